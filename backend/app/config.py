@@ -24,6 +24,7 @@ class Settings(BaseSettings):
     # Face Recognition
     face_similarity_threshold: float = 0.6
     face_detection_threshold: float = 0.5
+    face_model_warm_up: bool = True  # Load InsightFace models trong background lúc startup
     
     # File Upload
     max_file_size: int = 10 * 1024 * 1024  # 10MB
@@ -32,7 +33,77 @@ class Settings(BaseSettings):
     # Performance
     max_detection_threads: int = 4
     stream_frame_rate: int = 30
-    detection_interval: int = 5  # Process every Nth frame
+    jpeg_encode_workers: int = 2  # Thread pool cho cv2.imencode
+    stream_jpeg_quality: int = 70  # Quality của tier "medium"
+    stream_slow_send_ratio: float = 1.5  # Viewer gửi 1 frame lâu hơn N lần khoảng cách publish thì hạ tier
+    stream_tier_upgrade_frames: int = 100  # Số frame gửi nhanh liên tiếp trước khi thử nâng tier lại
+    detection_jpeg_quality: int = 90  # Ảnh detection lưu DB và đính kèm email (encode chung một lần)
+    detection_image_mode: str = "crop_with_context"  # frame | crop | crop_with_context - ảnh detection lưu cả frame hay vùng khuôn mặt
+    detection_crop_padding: float = 0.4  # Nới bbox mỗi phía thêm N lần kích thước khuôn mặt
+    detection_context_width: int = 640  # crop_with_context: frame toàn cảnh thu nhỏ lưu kèm crop
+    detection_context_quality: int = 50
+    detection_thumbnail_width: int = 320  # Thumbnail cạnh ảnh detection cho list view
+    detection_thumbnail_quality: int = 70
+    image_storage_workers: int = 2  # Thread pool ghi/xóa ảnh detection
+    detection_interval: int = 5  # Process every Nth frame (giá trị khởi đầu của adaptive interval)
+    detection_interval_min: int = 2
+    detection_interval_max: int = 30
+    detection_target_latency_ms: int = 200  # Latency inference vượt ngưỡng này thì giãn interval
+    detection_face_hold_seconds: float = 5.0  # Coi như "có người" trong N giây sau lần thấy mặt cuối
+    
+    # Camera capture
+    capture_reconnect_base_delay: float = 1.0  # Backoff kết nối lại: 1s, 2s, 4s, ...
+    capture_reconnect_max_delay: float = 30.0
+    capture_stall_timeout_seconds: float = 5.0  # Không có frame mới trong N giây -> stalled
+    capture_offline_after_attempts: int = 3  # Số lần kết nối thất bại liên tiếp trước khi báo offline
+    capture_rtsp_transport: str = "tcp"  # tcp | udp (camera có thể override qua stream_settings.rtsp_transport)
+    capture_open_timeout_ms: int = 5000
+    capture_read_timeout_ms: int = 5000
+    capture_pool_idle_seconds: float = 30.0  # Đóng capture handle của snapshot/capture-frame khi idle quá lâu
+    capture_pool_max_handles: int = 8  # Số capture handle mở tối đa, vượt quá thì đóng handle ít dùng nhất
+    capture_pool_max_drain_frames: int = 30  # Handle idle: bỏ tối đa N frame cũ trong buffer trước khi đọc
+    capture_ring_slots: int = 4  # Số buffer frame cấp phát sẵn cho mỗi camera (capture -> pipeline không copy)
+    
+    # Clip trước/sau sự kiện người lạ (ring buffer JPEG trong RAM)
+    clip_recording_enabled: bool = True
+    clip_pre_seconds: float = 5.0
+    clip_post_seconds: float = 5.0
+    clip_fps: int = 5
+    clip_max_width: int = 640
+    clip_jpeg_quality: int = 60
+    clip_max_pending_writes: int = 4  # Số clip chờ ghi tối đa, vượt quá thì bỏ clip mới
+    
+    # Write-behind queue cho detection_logs / detection_sessions
+    detection_log_batch_size: int = 100  # Flush khi đủ N document
+    detection_log_flush_interval_ms: int = 500  # ... hoặc sau N ms kể từ khi có document chờ
+    detection_log_queue_max: int = 5000  # Số detection log chờ ghi tối đa
+    detection_log_overflow_policy: str = "block"  # block | drop_oldest | drop_newest khi queue đầy
+    detection_log_block_timeout_ms: int = 200  # policy block: chờ tối đa N ms rồi bỏ log mới
+    detection_session_queue_max: int = 5000  # Số session op chờ ghi tối đa (đầy thì bỏ op mới)
+    detection_log_stop_timeout_seconds: float = 10.0  # Shutdown: chờ ghi nốt queue tối đa N giây
+    
+    # Batched inference scheduler
+    inference_batch_window_ms: int = 20  # Thời gian gom frame từ các camera thành một batch
+    inference_max_batch_size: int = 8
+    inference_max_queue_depth: int = 16  # Số frame chờ tối đa, vượt quá thì bỏ frame mới
+    inference_max_frame_age_ms: int = 500  # Frame chờ lâu hơn sẽ bị bỏ (stale)
+    inference_use_process_pool: bool = False  # Chạy InsightFace trong max_detection_threads worker processes
+    
+    # Face tracker (bỏ qua recognition cho khuôn mặt đã nhận dạng gần đây)
+    tracker_iou_threshold: float = 0.3
+    tracker_max_missed_frames: int = 3  # Số AI frame liên tiếp không thấy trước khi bỏ track
+    tracker_reverify_interval_seconds: float = 2.0
+    tracker_confident_similarity: float = 0.7  # Known person dưới ngưỡng này được nhận dạng lại mỗi frame
+    
+    # Stranger gallery (ID cố định cho người lạ)
+    stranger_match_threshold: float = 0.45
+    stranger_gallery_max_size: int = 500  # Số cluster người lạ tối đa mỗi owner
+    stranger_ttl_minutes: int = 30
+    
+    # Motion gate (bỏ qua detection khi camera tĩnh) - mặc định, camera có thể override trong stream_settings
+    motion_gate_enabled: bool = True
+    motion_gate_sensitivity: float = 0.5
+    motion_gate_keepalive_seconds: float = 3.0  # Vẫn chạy detection ít nhất mỗi N giây
     
     # Notifications
     alert_cooldown_minutes: int = 5
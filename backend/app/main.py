@@ -4,6 +4,11 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.responses import JSONResponse
 from .routers import auth, camera, person, admin, detection, stream, websocket, settings, alerts, detection_optimizer, user, test_email, notifications
 from .database import startup_db_client, shutdown_db_client
+from .services.known_person_cache import known_person_cache
+from .services.face_processor import face_processor
+from .services.capture_pool import capture_pool
+from .services.detection_log_writer import detection_log_writer
+from .config import get_settings
 import logging
 import os
 import time
@@ -89,6 +94,13 @@ async def startup_event():
     try:
         await startup_db_client()
         logger.info("✅ Database connected successfully")
+        
+        # Theo dõi thay đổi known_persons để invalidate embedding cache
+        known_person_cache.start_change_stream()
+        
+        # Load face models trong background - auth/CRUD routes phục vụ ngay
+        if get_settings().face_model_warm_up:
+            face_processor.start_warm_up()
     except Exception as e:
         logger.error(f"❌ Database connection failed: {e}")
         raise
@@ -97,6 +109,9 @@ async def startup_event():
 async def shutdown_event():
     """Đóng kết nối database khi shutdown app"""
     try:
+        await known_person_cache.stop_change_stream()
+        # Ghi nốt detection log / session đang chờ trước khi đóng DB
+        await detection_log_writer.stop()
         await shutdown_db_client()
         logger.info("✅ Database disconnected successfully")
     except Exception as e:
@@ -171,7 +186,8 @@ async def root():
         "version": "1.0.0",
         "status": "running",
         "docs": "/docs",
-        "health": "/health"
+        "health": "/health",
+        "ready": "/health/ready"
     }
 
 # Health check endpoint
@@ -180,9 +196,24 @@ async def health_check():
     return {
         "status": "healthy",
         "timestamp": time.time(),
-        "uptime": f"{time.time() - start_time:.2f} seconds" if 'start_time' in globals() else "unknown"
+        "uptime": f"{time.time() - start_time:.2f} seconds" if 'start_time' in globals() else "unknown",
+        "capture_pool": capture_pool.get_stats(),
+        "detection_log_writer": detection_log_writer.get_stats()
     }
 
+# Readiness endpoint - face models đã load xong chưa
+@app.get("/health/ready")
+async def readiness_check():
+    status = face_processor.get_status()
+    return JSONResponse(
+        status_code=200 if status["ready"] else 503,
+        content={
+            "status": "ready" if status["ready"] else "loading",
+            "timestamp": time.time(),
+            "face_engine": status
+        }
+    )
+
 # Debug endpoint
 @app.get("/debug/headers")
 async def debug_headers(request: Request):
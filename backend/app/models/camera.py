@@ -14,6 +14,14 @@ class StreamSettings(BaseModel):
     fps: Optional[int] = 30
     quality: Optional[str] = "medium"  # high, medium, low
     buffer_size: Optional[int] = 10
+    # Capture RTSP: transport, cờ low-latency và substream độ phân giải thấp cho face detection
+    rtsp_transport: Optional[str] = None  # tcp, udp (mặc định theo settings)
+    low_latency: Optional[bool] = True
+    substream_url: Optional[str] = None
+    # Motion gate: chỉ chạy face detection khi có chuyển động trong ROI
+    motion_gate_enabled: Optional[bool] = True
+    motion_sensitivity: Optional[float] = Field(0.5, ge=0.0, le=1.0)
+    motion_roi: Optional[List[List[float]]] = None  # [[x, y, w, h], ...] theo tỉ lệ 0..1
 
 class AlertSettings(BaseModel):
     email_alerts: Optional[bool] = True
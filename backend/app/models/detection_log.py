@@ -26,6 +26,9 @@ class DetectionLogResponse(BaseModel):
     confidence: float = Field(default=0.0, ge=0.0, le=1.0)
     similarity_score: Optional[float] = Field(None, ge=0.0, le=1.0)
     image_url: str
+    thumbnail_url: Optional[str] = None  # Ảnh thu nhỏ cho list view (None với ảnh cũ)
+    context_image_url: Optional[str] = None  # Frame toàn cảnh quality thấp khi image_url chỉ là crop khuôn mặt
+    clip_url: Optional[str] = None  # Clip trước/sau sự kiện (chỉ có với người lạ)
     bbox: List[int] = Field(default_factory=list)
     timestamp: datetime
     is_alert_sent: bool = False
@@ -62,6 +65,9 @@ class DetectionLog(BaseModel):
     confidence: float
     similarity_score: Optional[float] = None
     image_path: str
+    thumbnail_path: Optional[str] = None
+    context_image_path: Optional[str] = None
+    clip_path: Optional[str] = None
     bbox: List[int]
     timestamp: datetime
     is_alert_sent: bool
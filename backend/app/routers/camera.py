@@ -406,6 +406,8 @@ async def get_cameras(
 @router.get("/{camera_id}/video")
 async def stream_video(
     camera_id: str,
+    quality: Optional[str] = Query(None, description="Tier chất lượng: high, medium, low, mobile"),
+    resolution: Optional[str] = Query(None, description="Độ phân giải tối đa, vd 640x480"),
     current_user: User = Depends(get_current_active_user)
 ):
     """Stream video từ camera với face recognition"""
@@ -420,9 +422,9 @@ async def stream_video(
         
         print(f"✅ Camera found: {camera.name} (Type: {camera.camera_type})")
         
-        # ✅ Start face recognition enabled stream
+        # ✅ Subscribe vào pipeline chung của camera (face recognition chạy một lần cho mọi viewer)
         async def generate_stream():
-            async for frame in stream_processor.generate_video_stream_with_recognition(camera_id, camera, str(current_user.id)):
+            async for frame in stream_processor.subscribe_frames(camera_id, camera, quality, resolution):
                 yield (b'--frame\r\n'
                        b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
         
@@ -761,6 +763,8 @@ async def take_camera_snapshot(
 async def get_camera_capture_stream(
     camera_id: str,
     token: Optional[str] = Query(None),
+    quality: Optional[str] = Query(None, description="Tier chất lượng: high, medium, low, mobile"),
+    resolution: Optional[str] = Query(None, description="Độ phân giải tối đa, vd 640x480"),
     current_user: User = Depends(get_current_active_user)
 ):
     """Lấy camera stream cho việc capture ảnh (không có detection model)"""
@@ -774,10 +778,11 @@ async def get_camera_capture_stream(
         
         print(f"✅ Camera found: {camera.name}")
         
-        # Create generator for raw camera stream
-        def generate_frames():
+        # Raw stream async - capture dùng chung theo camera, không giữ thread cho mỗi viewer
+        async def generate_frames():
             try:
-                return camera_service.get_raw_camera_stream(camera_id)
+                async for chunk in camera_service.get_raw_camera_stream(camera_id, quality, resolution):
+                    yield chunk
             except Exception as e:
                 print(f"❌ Error in stream generator: {e}")
                 # Return empty response on error
@@ -100,7 +100,9 @@ async def get_stream_info(
 @router.get("/{camera_id}/video")
 async def stream_video(
     camera_id: str,
-    token: Optional[str] = Query(None)
+    token: Optional[str] = Query(None),
+    quality: Optional[str] = Query(None, description="Tier chất lượng: high, medium, low, mobile"),
+    resolution: Optional[str] = Query(None, description="Độ phân giải tối đa, vd 640x480")
 ):
     """Stream video từ camera with authentication via query parameter"""
     try:
@@ -124,7 +126,7 @@ async def stream_video(
         
         # Start video stream
         return StreamingResponse(
-            stream_processor.generate_video_stream(camera_id, camera),
+            stream_processor.generate_video_stream(camera_id, camera, quality, resolution),
             media_type="multipart/x-mixed-replace; boundary=frame"
         )
     except HTTPException:
@@ -0,0 +1,76 @@
+import math
+import time
+from typing import Dict, Any, Optional
+from ..config import get_settings
+
+
+class AdaptiveIntervalController:
+    """
+    Điều chỉnh số frame giữa hai lần chạy AI cho một camera
+
+    - Quá tải (latency vượt ngưỡng, queue scheduler đầy, frame bị bỏ): tăng interval x1.5
+    - Có khuôn mặt gần đây và hệ thống còn dư: giảm x0.75 về min interval
+    - Không có ai trong khung hình: tăng dần tới idle interval (2x detection_interval)
+    """
+
+    def __init__(self, camera_id: str):
+        settings = get_settings()
+        self.camera_id = camera_id
+        self.base_interval = max(1, settings.detection_interval)
+        self.min_interval = max(1, min(settings.detection_interval_min, self.base_interval))
+        self.max_interval = max(self.base_interval, settings.detection_interval_max)
+        self.idle_interval = min(self.base_interval * 2, self.max_interval)
+        self.target_latency = settings.detection_target_latency_ms / 1000.0
+        self.face_hold_seconds = settings.detection_face_hold_seconds
+
+        self.interval = self.base_interval
+        self.avg_latency: Optional[float] = None
+        self.last_face_time = 0.0
+        self.frames_since_ai = 0
+        self.adjustments = 0
+
+    def tick(self) -> bool:
+        """Gọi mỗi frame - True nếu frame này đến lượt chạy AI"""
+        self.frames_since_ai += 1
+        if self.frames_since_ai >= self.interval:
+            self.frames_since_ai = 0
+            return True
+        return False
+
+    def record(self, latency: float, faces: int, dropped: bool, queue_load: float):
+        """
+        Cập nhật sau mỗi lần chạy AI
+
+        Args:
+            latency: thời gian chờ kết quả inference (giây)
+            faces: số khuôn mặt phát hiện
+            dropped: frame bị scheduler bỏ
+            queue_load: queue depth / max queue depth của scheduler (0..1)
+        """
+        now = time.time()
+        self.avg_latency = latency if self.avg_latency is None else 0.8 * self.avg_latency + 0.2 * latency
+        if faces > 0:
+            self.last_face_time = now
+
+        previous = self.interval
+        if dropped or queue_load >= 0.5 or self.avg_latency > self.target_latency:
+            self.interval = min(self.max_interval, math.ceil(self.interval * 1.5))
+        elif now - self.last_face_time <= self.face_hold_seconds:
+            if self.avg_latency < self.target_latency * 0.7 and queue_load < 0.25:
+                self.interval = max(self.min_interval, min(self.interval - 1, int(self.interval * 0.75)))
+        elif self.interval < self.idle_interval:
+            self.interval += 1
+        elif self.interval > self.idle_interval and self.avg_latency < self.target_latency * 0.7:
+            self.interval = max(self.idle_interval, min(self.interval - 1, int(self.interval * 0.75)))
+
+        if self.interval != previous:
+            self.adjustments += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "effective_interval": self.interval,
+            "base_interval": self.base_interval,
+            "avg_inference_latency_ms": round(self.avg_latency * 1000, 1) if self.avg_latency is not None else None,
+            "faces_recently_seen": time.time() - self.last_face_time <= self.face_hold_seconds,
+            "adjustments": self.adjustments
+        }
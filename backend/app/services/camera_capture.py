@@ -0,0 +1,278 @@
+import threading
+import time
+from typing import Dict, List, Optional, Tuple, Any
+import numpy as np
+from ..config import get_settings
+from .capture_factory import capture_factory
+
+
+# Trạng thái sức khỏe của capture
+CAPTURE_CONNECTING = "connecting"
+CAPTURE_LIVE = "live"
+CAPTURE_STALLED = "stalled"
+CAPTURE_OFFLINE = "offline"
+
+
+class FrameRef:
+    """
+    Tham chiếu (view, không copy) tới một frame trong LatestFrameSlot
+
+    Slot không bị reader ghi đè cho tới khi release(). Frame cần sống lâu hơn
+    (snapshot alert, ...) thì phải copy trước khi release.
+    """
+
+    def __init__(self, slot: "LatestFrameSlot", index: int, frame: np.ndarray, seq: int, timestamp: float):
+        self._slot = slot
+        self._index = index
+        self.frame = frame
+        self.seq = seq
+        self.timestamp = timestamp
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._slot._release(self._index)
+
+    def __enter__(self) -> "FrameRef":
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class LatestFrameSlot:
+    """
+    Ring buffer frame cấp phát sẵn, consumer chỉ thấy frame mới nhất
+
+    Reader decode thẳng vào một buffer rảnh (không phải frame mới nhất, không
+    có ai giữ ref) rồi commit thành frame mới nhất; consumer acquire() nhận
+    FrameRef trỏ thẳng vào buffer đó. Không có queue nên không phải
+    get_nowait()/put mỗi frame, và không copy frame ở steady state.
+    """
+
+    def __init__(self, num_slots: int = 4):
+        self._lock = threading.Lock()
+        # Tối thiểu 3: frame pipeline đang xử lý + frame đã xử lý giữ cho snapshot + buffer reader ghi
+        self._buffers: List[Optional[np.ndarray]] = [None] * max(num_slots, 3)
+        self._refs: List[int] = [0] * len(self._buffers)
+        self._latest = -1
+        self._seq = 0
+        self.timestamp: Optional[float] = None
+        self.frames_dropped = 0
+
+    @property
+    def seq(self) -> int:
+        return self._seq
+
+    def reserve(self) -> Tuple[int, Optional[np.ndarray]]:
+        """
+        Lấy buffer rảnh cho reader ghi frame kế tiếp
+
+        Returns:
+            (index, buffer) - buffer None nếu slot chưa cấp phát; index -1 nếu mọi slot đang bị giữ
+        """
+        with self._lock:
+            for index, refs in enumerate(self._refs):
+                if refs == 0 and index != self._latest:
+                    return index, self._buffers[index]
+            self.frames_dropped += 1
+            return -1, None
+
+    def commit(self, index: int, frame: np.ndarray):
+        """Đánh dấu buffer index (đã ghi frame) là frame mới nhất"""
+        with self._lock:
+            # cap.read() có thể cấp phát array mới (lần đầu / đổi độ phân giải)
+            self._buffers[index] = frame
+            self._latest = index
+            self._seq += 1
+            self.timestamp = time.time()
+
+    def put(self, frame: np.ndarray) -> bool:
+        """Ghi frame có sẵn (copy vào buffer rảnh) - dùng cho nguồn không decode được vào buffer"""
+        index, buffer = self.reserve()
+        if index < 0:
+            return False
+        if buffer is None or buffer.shape != frame.shape or buffer.dtype != frame.dtype:
+            buffer = frame.copy()
+        else:
+            np.copyto(buffer, frame)
+        self.commit(index, buffer)
+        return True
+
+    def acquire(self, last_seq: int = 0) -> Optional[FrameRef]:
+        """FrameRef tới frame mới nhất nếu mới hơn last_seq, ngược lại None"""
+        if self._seq == last_seq:
+            return None  # Đường nhanh: không cần lock khi chưa có frame mới
+        with self._lock:
+            if self._latest < 0:
+                return None
+            self._refs[self._latest] += 1
+            return FrameRef(self, self._latest, self._buffers[self._latest], self._seq, self.timestamp)
+
+    def _release(self, index: int):
+        with self._lock:
+            self._refs[index] -= 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "slots": len(self._buffers),
+            "slots_in_use": sum(1 for refs in self._refs if refs > 0),
+            "frames_dropped": self.frames_dropped
+        }
+
+
+class CameraCapture:
+    """
+    Thread đọc frame của một camera
+
+    - Mở lại capture với exponential backoff khi không kết nối được / mất tín hiệu
+    - Phát hiện stall theo timestamp frame cuối (kể cả khi cap.read() bị treo)
+    - Trạng thái: connecting -> live -> stalled -> connecting ...; offline sau
+      nhiều lần kết nối thất bại liên tiếp (vẫn tiếp tục thử lại)
+    """
+
+    READ_FAIL_SLEEP = 0.05
+
+    def __init__(self, camera_id: str, camera_type: str, camera_url: Optional[str] = None,
+                 stream_settings: Optional[Any] = None, purpose: str = "main"):
+        settings = get_settings()
+        self.camera_id = camera_id
+        self.camera_type = camera_type
+        self.camera_url = camera_url
+        self.stream_settings = stream_settings
+        self.purpose = purpose
+        self.base_delay = settings.capture_reconnect_base_delay
+        self.max_delay = settings.capture_reconnect_max_delay
+        self.stall_timeout = settings.capture_stall_timeout_seconds
+        self.offline_after_attempts = settings.capture_offline_after_attempts
+
+        self.slot = LatestFrameSlot(settings.capture_ring_slots)
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._cap = None
+
+        self._state = CAPTURE_CONNECTING
+        self.failed_attempts = 0
+        self.reconnects = 0
+        self.frames_read = 0
+        self.connected_since: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    @property
+    def state(self) -> str:
+        """Trạng thái hiện tại - live quá stall_timeout không có frame được coi là stalled"""
+        if self._state == CAPTURE_LIVE and self._seconds_since_frame() > self.stall_timeout:
+            return CAPTURE_STALLED
+        return self._state
+
+    @property
+    def is_live(self) -> bool:
+        return self.state == CAPTURE_LIVE
+
+    def _seconds_since_frame(self) -> float:
+        last = max(self.slot.timestamp or 0.0, self.connected_since or 0.0)
+        return time.time() - last if last else 0.0
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name=f"capture-{self.camera_id}", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 1.0):
+        """Báo dừng và chờ thread (blocking - gọi qua executor). Chỉ capture thread release VideoCapture"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+            if self._thread.is_alive():
+                # read()/open() đang treo - thread tự release khi thoát vòng lặp
+                print(f"⚠️ Capture thread for camera {self.camera_id} still busy, releasing in background")
+
+    def _open(self):
+        return capture_factory.open(self.camera_type, self.camera_url, self.stream_settings, self.purpose)
+
+    def _release(self):
+        cap, self._cap = self._cap, None
+        if cap is not None:
+            try:
+                cap.release()
+            except Exception:
+                pass
+
+    def _backoff_delay(self) -> float:
+        return min(self.max_delay, self.base_delay * (2 ** max(self.failed_attempts - 1, 0)))
+
+    def _connect(self) -> bool:
+        self._state = CAPTURE_CONNECTING if self.failed_attempts < self.offline_after_attempts else CAPTURE_OFFLINE
+        try:
+            cap = self._open()
+            if cap is not None and cap.isOpened():
+                self._cap = cap
+                self.failed_attempts = 0
+                self.connected_since = time.time()
+                self._state = CAPTURE_LIVE
+                print(f"✅ Capture connected for camera {self.camera_id}")
+                return True
+            if cap is not None:
+                cap.release()
+            self.last_error = "Cannot open camera source"
+        except Exception as e:
+            self.last_error = str(e)
+
+        self.failed_attempts += 1
+        if self.failed_attempts >= self.offline_after_attempts:
+            self._state = CAPTURE_OFFLINE
+        delay = self._backoff_delay()
+        print(f"⚠️ Capture for camera {self.camera_id} failed ({self.last_error}), retry in {delay:.1f}s")
+        self._stop_event.wait(delay)
+        return False
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            if self._cap is None and not self._connect():
+                continue
+            cap = self._cap
+
+            index, buffer = self.slot.reserve()
+            if index < 0:
+                # Mọi buffer đang được pipeline giữ: grab() bỏ frame mà không decode
+                ret, frame = cap.grab(), None
+                if ret:
+                    self.slot.timestamp = time.time()
+                    continue
+            else:
+                # Decode thẳng vào buffer của ring (OpenCV dùng lại array nếu cùng shape)
+                ret, frame = cap.read(buffer) if buffer is not None else cap.read()
+            if ret and frame is not None:
+                self.slot.commit(index, frame)
+                self.frames_read += 1
+                if self._state != CAPTURE_LIVE:
+                    self._state = CAPTURE_LIVE
+                continue
+
+            # Đọc lỗi: không spin, chờ một chút rồi kiểm tra stall
+            if self._seconds_since_frame() > self.stall_timeout:
+                self._state = CAPTURE_STALLED
+                self.last_error = f"No frame for {self.stall_timeout:.0f}s"
+                print(f"⚠️ Capture for camera {self.camera_id} stalled, reconnecting")
+                self._release()
+                self.reconnects += 1
+                self.failed_attempts += 1
+                self._stop_event.wait(self._backoff_delay())
+            else:
+                self._stop_event.wait(self.READ_FAIL_SLEEP)
+
+        self._release()
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "health": self.state,
+            "frames_read": self.frames_read,
+            "reconnects": self.reconnects,
+            "failed_attempts": self.failed_attempts,
+            "seconds_since_frame": round(self._seconds_since_frame(), 1) if self.slot.timestamp else None,
+            "frame_slots": self.slot.get_stats(),
+            "last_error": self.last_error
+        }
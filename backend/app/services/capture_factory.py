@@ -0,0 +1,131 @@
+import os
+import threading
+from typing import Any, Optional, Union
+import cv2
+from ..config import get_settings
+
+
+class CaptureFactory:
+    """
+    Nơi duy nhất mở cv2.VideoCapture cho camera
+
+    - Webcam: device index, đặt resolution/fps theo StreamSettings
+      (thử lại với DirectShow trên Windows)
+    - RTSP/HTTP: backend FFmpeg với transport TCP/UDP, cờ low-latency
+      (nobuffer, low_delay) và timeout mở/đọc để camera chết không treo thread
+    - Mọi capture đều đặt CAP_PROP_BUFFERSIZE=1 để không tích lũy độ trễ
+    - purpose="inference" mở substream_url (độ phân giải thấp) nếu camera có
+    """
+
+    NETWORK_SCHEMES = ("rtsp://", "rtsps://", "rtmp://", "http://", "https://")
+
+    def __init__(self):
+        # OPENCV_FFMPEG_CAPTURE_OPTIONS là biến môi trường của cả process,
+        # đọc lúc mở capture - khóa để các camera mở song song không ghi đè nhau
+        self._env_lock = threading.Lock()
+
+    @staticmethod
+    def _get(stream_settings: Optional[Any], key: str, default=None):
+        if stream_settings is None:
+            return default
+        if isinstance(stream_settings, dict):
+            value = stream_settings.get(key)
+        else:
+            value = getattr(stream_settings, key, None)
+        return default if value is None else value
+
+    def is_network_source(self, source: Union[str, int, None]) -> bool:
+        return isinstance(source, str) and source.lower().startswith(self.NETWORK_SCHEMES)
+
+    def resolve_source(self, camera_type: str, camera_url: Optional[str],
+                       stream_settings: Optional[Any] = None, purpose: str = "main") -> Union[str, int]:
+        """URL/device index sẽ mở cho camera"""
+        if camera_type == "webcam" or not camera_url:
+            return int(camera_url) if camera_url and str(camera_url).isdigit() else 0
+        if purpose == "inference":
+            return self._get(stream_settings, "substream_url") or camera_url
+        return camera_url
+
+    def has_substream(self, camera_type: str, stream_settings: Optional[Any]) -> bool:
+        return camera_type != "webcam" and bool(self._get(stream_settings, "substream_url"))
+
+    def _ffmpeg_options(self, stream_settings: Optional[Any]) -> str:
+        settings = get_settings()
+        transport = str(self._get(stream_settings, "rtsp_transport", settings.capture_rtsp_transport)).lower()
+        options = [f"rtsp_transport;{'udp' if transport == 'udp' else 'tcp'}"]
+        if self._get(stream_settings, "low_latency", True):
+            options += ["fflags;nobuffer", "flags;low_delay", "max_delay;500000"]
+        return "|".join(options)
+
+    def _open_network(self, url: str, stream_settings: Optional[Any]) -> cv2.VideoCapture:
+        settings = get_settings()
+        params = []
+        if hasattr(cv2, "CAP_PROP_OPEN_TIMEOUT_MSEC"):
+            params += [cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, int(settings.capture_open_timeout_ms),
+                       cv2.CAP_PROP_READ_TIMEOUT_MSEC, int(settings.capture_read_timeout_ms)]
+        with self._env_lock:
+            previous = os.environ.get("OPENCV_FFMPEG_CAPTURE_OPTIONS")
+            os.environ["OPENCV_FFMPEG_CAPTURE_OPTIONS"] = self._ffmpeg_options(stream_settings)
+            try:
+                return cv2.VideoCapture(url, cv2.CAP_FFMPEG, params) if params else cv2.VideoCapture(url, cv2.CAP_FFMPEG)
+            finally:
+                if previous is None:
+                    os.environ.pop("OPENCV_FFMPEG_CAPTURE_OPTIONS", None)
+                else:
+                    os.environ["OPENCV_FFMPEG_CAPTURE_OPTIONS"] = previous
+
+    def _open_device(self, source: Union[str, int]) -> cv2.VideoCapture:
+        cap = cv2.VideoCapture(source)
+        if not cap.isOpened() and isinstance(source, int) and os.name == 'nt':
+            cap.release()
+            print("🔄 Trying webcam with DirectShow backend...")
+            cap = cv2.VideoCapture(source, cv2.CAP_DSHOW)
+        return cap
+
+    def _apply_settings(self, cap: cv2.VideoCapture, is_device: bool, stream_settings: Optional[Any]):
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        if not is_device:
+            return  # Resolution/FPS của RTSP do camera quyết định (dùng substream/tier để giảm)
+        resolution = self._get(stream_settings, "resolution")
+        if resolution and "x" in str(resolution):
+            try:
+                width, height = map(int, str(resolution).lower().split("x"))
+                cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+                cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+            except ValueError:
+                print(f"⚠️ Invalid resolution format: {resolution}")
+        fps = self._get(stream_settings, "fps")
+        if fps:
+            cap.set(cv2.CAP_PROP_FPS, fps)
+
+    def open(self, camera_type: str, camera_url: Optional[str] = None,
+             stream_settings: Optional[Any] = None, purpose: str = "main") -> cv2.VideoCapture:
+        """
+        Mở capture cho camera (blocking - gọi từ thread/executor)
+
+        Args:
+            purpose: "main" (stream/ghi hình/snapshot) hoặc "inference" (substream nếu có)
+        Returns:
+            cv2.VideoCapture - caller kiểm tra isOpened() và tự release()
+        """
+        source = self.resolve_source(camera_type, camera_url, stream_settings, purpose)
+        if self.is_network_source(source):
+            cap = self._open_network(source, stream_settings)
+            is_device = False
+        else:
+            # Webcam hoặc file video
+            cap = self._open_device(source)
+            is_device = isinstance(source, int)
+        if cap.isOpened():
+            self._apply_settings(cap, is_device, stream_settings)
+        return cap
+
+    def open_camera(self, camera: Any, purpose: str = "main") -> cv2.VideoCapture:
+        """Mở capture từ CameraResponse hoặc camera document (dict) của MongoDB"""
+        if isinstance(camera, dict):
+            return self.open(camera.get("camera_type", "webcam"), camera.get("camera_url"),
+                             camera.get("stream_settings"), purpose)
+        return self.open(camera.camera_type, camera.camera_url, getattr(camera, "stream_settings", None), purpose)
+
+# Global instance
+capture_factory = CaptureFactory()
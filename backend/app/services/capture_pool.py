@@ -0,0 +1,178 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+import cv2
+import numpy as np
+from ..config import get_settings
+
+
+class CapturePool:
+    """
+    Pool capture handle dùng lại giữa các request đọc một frame (snapshot, capture-frame, test)
+
+    - Giữ tối đa capture_pool_max_handles handle mở (mỗi handle giữ decoder, socket, buffer);
+      vượt quá thì đóng handle ít dùng nhất (LRU)
+    - Handle idle quá capture_pool_idle_seconds bị đóng bởi sweeper thread
+      (chỉ chạy khi pool còn handle) để trả session cho camera
+    - Thread-safe; mỗi key có lock riêng nên hai request cùng camera không đọc song song
+    - Handle trong pool bỏ hết frame cũ còn trong buffer trước khi đọc; đọc lỗi
+      (vd. RTSP session đã bị server đóng khi idle) thì mở lại và đọc thêm một lần
+    """
+
+    # grab() trả về nhanh hơn ngưỡng này = frame đã nằm sẵn trong buffer (cũ), chậm hơn = chờ frame live
+    LIVE_GRAB_SECONDS = 0.01
+
+    def __init__(self):
+        settings = get_settings()
+        self.idle_seconds = settings.capture_pool_idle_seconds
+        self.max_handles = max(settings.capture_pool_max_handles, 1)
+        self.max_drain_frames = max(settings.capture_pool_max_drain_frames, 1)
+        # key -> (capture, last_used), thứ tự LRU: đầu = ít dùng nhất
+        self._handles: "OrderedDict[str, Tuple[cv2.VideoCapture, float]]" = OrderedDict()
+        self._key_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._sweeper: Optional[threading.Thread] = None
+
+        self.hits = 0
+        self.misses = 0
+        self.idle_evictions = 0
+        self.capacity_evictions = 0
+        self.read_failures = 0
+        self.reopens = 0
+        self.frames_drained = 0
+
+    def _key_lock(self, key: str) -> threading.Lock:
+        with self._lock:
+            lock = self._key_locks.get(key)
+            if lock is None:
+                lock = threading.Lock()
+                self._key_locks[key] = lock
+            return lock
+
+    def _evict_idle(self):
+        now = time.time()
+        expired = []
+        with self._lock:
+            for key, (cap, last_used) in list(self._handles.items()):
+                if now - last_used > self.idle_seconds:
+                    expired.append(cap)
+                    del self._handles[key]
+            self.idle_evictions += len(expired)
+        for cap in expired:
+            cap.release()
+
+    def _sweep_loop(self):
+        while True:
+            time.sleep(max(self.idle_seconds / 2, 1.0))
+            self._evict_idle()
+            with self._lock:
+                if not self._handles:
+                    self._sweeper = None
+                    return
+
+    def _put(self, key: str, cap: cv2.VideoCapture):
+        """Trả handle về pool (đầu LRU mới nhất), đóng handle cũ nhất nếu vượt giới hạn"""
+        evicted = []
+        with self._lock:
+            self._handles[key] = (cap, time.time())
+            self._handles.move_to_end(key)
+            while len(self._handles) > self.max_handles:
+                _, (old_cap, _) = self._handles.popitem(last=False)
+                evicted.append(old_cap)
+            self.capacity_evictions += len(evicted)
+            if self._sweeper is None:
+                self._sweeper = threading.Thread(target=self._sweep_loop, name="capture-pool-sweeper", daemon=True)
+                self._sweeper.start()
+        for old_cap in evicted:
+            old_cap.release()
+
+    def _drain(self, cap: cv2.VideoCapture) -> bool:
+        """Bỏ các frame cũ trong buffer của handle idle cho tới khi grab() phải chờ frame live"""
+        for _ in range(self.max_drain_frames):
+            start = time.monotonic()
+            if not cap.grab():
+                return False
+            self.frames_drained += 1
+            if time.monotonic() - start >= self.LIVE_GRAB_SECONDS:
+                break
+        return True
+
+    @staticmethod
+    def _read(cap: Optional[cv2.VideoCapture]) -> Optional[np.ndarray]:
+        if cap is None or not cap.isOpened():
+            return None
+        ret, frame = cap.read()
+        return frame if ret else None
+
+    def read_frame(self, key: str, opener: Callable[[], cv2.VideoCapture]) -> Optional[np.ndarray]:
+        """
+        Đọc một frame mới từ handle của key (mở bằng opener nếu chưa có) - blocking
+
+        Handle trong pool đọc lỗi thì đóng và mở lại một lần; handle mới đọc lỗi bị đóng.
+        """
+        self._evict_idle()
+        with self._key_lock(key):
+            # Handle đang dùng được lấy ra khỏi pool, nên không bị evict giữa chừng
+            with self._lock:
+                entry = self._handles.pop(key, None)
+                if entry:
+                    self.hits += 1
+                else:
+                    self.misses += 1
+
+            frame = None
+            if entry:
+                cap = entry[0]
+                if self._drain(cap):
+                    frame = self._read(cap)
+                if frame is None:
+                    # Session đã bị camera/server đóng khi idle - mở lại thay vì trả lỗi
+                    self.read_failures += 1
+                    self.reopens += 1
+                    cap.release()
+                    entry = None
+            if entry is None:
+                cap = opener()
+                frame = self._read(cap)
+                if frame is None:
+                    self.read_failures += 1
+                    if cap is not None:
+                        cap.release()
+                    return None
+
+            self._put(key, cap)
+            return frame
+
+    def release(self, key: Optional[str] = None):
+        """Đóng handle của key (hoặc tất cả)"""
+        with self._lock:
+            if key is None:
+                entries = list(self._handles.values())
+                self._handles.clear()
+            else:
+                entry = self._handles.pop(key, None)
+                entries = [entry] if entry else []
+        for cap, _ in entries:
+            cap.release()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            open_handles = len(self._handles)
+        lookups = self.hits + self.misses
+        return {
+            "open_handles": open_handles,
+            "max_handles": self.max_handles,
+            "idle_seconds": self.idle_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "idle_evictions": self.idle_evictions,
+            "capacity_evictions": self.capacity_evictions,
+            "read_failures": self.read_failures,
+            "reopens": self.reopens,
+            "frames_drained": self.frames_drained
+        }
+
+# Global instance
+capture_pool = CapturePool()
@@ -0,0 +1,213 @@
+import asyncio
+import concurrent.futures
+import os
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple, Any
+import cv2
+import numpy as np
+from ..config import get_settings
+
+# Codec theo thứ tự ưu tiên - trình duyệt phát được H.264/MP4 và VP8/WebM (không phát được mp4v)
+CLIP_CODECS = (("avc1", ".mp4"), ("VP80", ".webm"))
+
+
+class ClipEvent:
+    """Một clip đang thu: frame pre-event + frame post-event cho tới end_time"""
+
+    def __init__(self, camera_id: str, pre_frames: List[Tuple[float, bytes]], end_time: float):
+        self.camera_id = camera_id
+        self.frames = pre_frames
+        self.end_time = end_time
+        self.detection_ids: List[str] = []
+
+
+class ClipRecorder:
+    """
+    Ghi clip trước/sau sự kiện người lạ từ ring buffer JPEG trong RAM
+
+    Pipeline đưa vào mỗi camera một JPEG nhỏ theo clip_fps (encode chung với
+    các tier stream); ring buffer chỉ giữ clip_pre_seconds gần nhất. Khi có
+    người lạ, frame trong buffer + frame của clip_post_seconds tiếp theo được
+    ghi thành H.264 MP4 (hoặc VP8 WebM nếu OpenCV không có encoder H.264) trong
+    uploads/clips bởi một writer thread duy nhất, số clip
+    chờ ghi bị giới hạn nên disk I/O không bao giờ chặn capture loop.
+    """
+
+    def __init__(self):
+        settings = get_settings()
+        self.enabled = settings.clip_recording_enabled
+        self.fps = max(settings.clip_fps, 1)
+        self.pre_seconds = settings.clip_pre_seconds
+        self.post_seconds = settings.clip_post_seconds
+        self.max_width = settings.clip_max_width
+        self.quality = settings.clip_jpeg_quality
+        self.max_pending = settings.clip_max_pending_writes
+        self.clip_dir = os.path.join("uploads", "clips")
+
+        self._buffers: Dict[str, Deque[Tuple[float, bytes]]] = {}
+        self._last_added: Dict[str, float] = {}
+        self._events: Dict[str, ClipEvent] = {}
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="clip-writer")
+        self._codec_index = 0  # Codec đầu tiên mở được trên máy này (bỏ qua codec đã lỗi)
+        self._pending_writes = 0
+        self.clips_written = 0
+        self.clips_dropped = 0
+
+    @property
+    def rendition(self) -> Tuple[Optional[int], int]:
+        """(max_width, quality) của frame clip - encode chung với các tier stream"""
+        return self.max_width, self.quality
+
+    def wants_frame(self, camera_id: str) -> bool:
+        """True nếu đến lượt đưa một frame vào ring buffer (theo clip_fps)"""
+        if not self.enabled:
+            return False
+        return time.time() - self._last_added.get(camera_id, 0.0) >= 1.0 / self.fps
+
+    def add_frame(self, camera_id: str, jpeg: bytes):
+        """Thêm JPEG vào ring buffer của camera (O(1), gọi từ pipeline)"""
+        now = time.time()
+        self._last_added[camera_id] = now
+        buffer = self._buffers.get(camera_id)
+        if buffer is None:
+            buffer = deque(maxlen=max(int(self.pre_seconds * self.fps), 1))
+            self._buffers[camera_id] = buffer
+        buffer.append((now, jpeg))
+
+        event = self._events.get(camera_id)
+        if event is not None:
+            event.frames.append((now, jpeg))
+            if now >= event.end_time:
+                self._finish_event(camera_id)
+
+    def trigger(self, camera_id: str, detection_id: Optional[str] = None) -> bool:
+        """
+        Bắt đầu (hoặc gộp vào) clip của camera cho một detection
+
+        Detection xảy ra khi clip đang thu sẽ dùng chung clip đó.
+        Returns False nếu clip bị bỏ do writer đang quá tải.
+        """
+        if not self.enabled:
+            return False
+        event = self._events.get(camera_id)
+        if event is None:
+            if self._pending_writes >= self.max_pending:
+                self.clips_dropped += 1
+                print(f"⚠️ ClipRecorder: Too many pending clips, skipping clip for camera {camera_id}")
+                return False
+            pre_frames = list(self._buffers.get(camera_id, ()))
+            event = ClipEvent(camera_id, pre_frames, time.time() + self.post_seconds)
+            self._events[camera_id] = event
+            self._pending_writes += 1
+        if detection_id:
+            event.detection_ids.append(detection_id)
+        return True
+
+    def is_recording(self, camera_id: str) -> bool:
+        return camera_id in self._events
+
+    def remove_camera(self, camera_id: str):
+        """Stream dừng: ghi nốt clip đang thu (nếu có) và giải phóng buffer"""
+        if camera_id in self._events:
+            self._finish_event(camera_id)
+        self._buffers.pop(camera_id, None)
+        self._last_added.pop(camera_id, None)
+
+    def _finish_event(self, camera_id: str):
+        event = self._events.pop(camera_id)
+        task = asyncio.create_task(self._write_clip(event))
+        task.add_done_callback(lambda t: None if not t.exception() else print(f"❌ Clip write error: {t.exception()}"))
+
+    async def _write_clip(self, event: ClipEvent):
+        try:
+            if not event.frames:
+                return
+            filename = f"clip_{event.camera_id}_{int(event.frames[0][0])}"
+            base_path = os.path.join(self.clip_dir, filename)
+
+            loop = asyncio.get_event_loop()
+            clip_path = await loop.run_in_executor(self._executor, self._write_clip_sync, base_path, event.frames)
+            if not clip_path:
+                return
+            self.clips_written += 1
+            print(f"🎬 Saved clip for camera {event.camera_id}: {clip_path} ({len(event.frames)} frames)")
+            if event.detection_ids:
+                await self._link_detections(event.detection_ids, clip_path)
+        finally:
+            self._pending_writes -= 1
+
+    def _open_writer(self, base_path: str, fps: float, size: Tuple[int, int]):
+        """Mở VideoWriter với codec khả dụng đầu tiên, trả về (writer, clip_path) hoặc (None, None)"""
+        while self._codec_index < len(CLIP_CODECS):
+            fourcc, ext = CLIP_CODECS[self._codec_index]
+            clip_path = base_path + ext
+            writer = cv2.VideoWriter(clip_path, cv2.VideoWriter_fourcc(*fourcc), fps, size)
+            if writer.isOpened():
+                return writer, clip_path
+            writer.release()
+            if os.path.exists(clip_path):
+                os.remove(clip_path)
+            print(f"⚠️ ClipRecorder: Codec {fourcc} unavailable, falling back")
+            self._codec_index += 1
+        return None, None
+
+    def _write_clip_sync(self, base_path: str, frames: List[Tuple[float, bytes]]) -> Optional[str]:
+        """Decode các JPEG và ghi video (chạy trên clip-writer thread), trả về path clip hoặc None"""
+        os.makedirs(self.clip_dir, exist_ok=True)
+        # FPS thực tế của clip (frame có thể thưa hơn clip_fps khi pipeline chậm)
+        duration = frames[-1][0] - frames[0][0]
+        fps = (len(frames) - 1) / duration if duration > 0 else float(self.fps)
+        writer = None
+        clip_path = None
+        size = None
+        try:
+            for _, jpeg in frames:
+                image = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+                if image is None:
+                    continue
+                if writer is None:
+                    size = (image.shape[1], image.shape[0])
+                    writer, clip_path = self._open_writer(base_path, max(fps, 1.0), size)
+                    if writer is None:
+                        print(f"❌ ClipRecorder: Cannot open video writer for {base_path}")
+                        return None
+                elif (image.shape[1], image.shape[0]) != size:
+                    image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+                writer.write(image)
+            return clip_path
+        except Exception as e:
+            print(f"❌ ClipRecorder: Error writing clip {base_path}: {e}")
+            return None
+        finally:
+            if writer is not None:
+                writer.release()
+
+    async def _link_detections(self, detection_ids: List[str], clip_path: str):
+        """Gắn clip vào các detection log của sự kiện"""
+        try:
+            from ..database import get_database
+            from bson import ObjectId
+
+            db = get_database()
+            await db.detection_logs.update_many(
+                {"_id": {"$in": [ObjectId(detection_id) for detection_id in detection_ids]}},
+                {"$set": {"clip_path": clip_path}}
+            )
+        except Exception as e:
+            print(f"❌ ClipRecorder: Error linking clip to detections: {e}")
+
+    def get_stats(self, camera_id: str) -> Dict[str, Any]:
+        buffer = self._buffers.get(camera_id)
+        return {
+            "enabled": self.enabled,
+            "buffered_frames": len(buffer) if buffer else 0,
+            "buffered_bytes": sum(len(jpeg) for _, jpeg in buffer) if buffer else 0,
+            "is_recording": self.is_recording(camera_id),
+            "pending_writes": self._pending_writes,
+            "clips_written": self.clips_written,
+            "clips_dropped": self.clips_dropped
+        }
+
+# Global instance
+clip_recorder = ClipRecorder()
@@ -0,0 +1,273 @@
+import asyncio
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+from bson import ObjectId
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+from ..config import get_settings
+from ..database import get_database
+
+
+# Policy khi queue detection log đầy
+OVERFLOW_BLOCK = "block"
+OVERFLOW_DROP_OLDEST = "drop_oldest"
+OVERFLOW_DROP_NEWEST = "drop_newest"
+
+
+class DetectionLogWriter:
+    """
+    Write-behind queue cho detection_logs và detection_sessions
+
+    - Gom document thành batch: insert_many cho detection_logs, bulk_write
+      (giữ thứ tự insert -> update) cho detection_sessions
+    - Flush khi đủ detection_log_batch_size hoặc sau detection_log_flush_interval_ms
+    - Queue giới hạn detection_log_queue_max; Mongo chậm thì block caller
+      (tối đa detection_log_block_timeout_ms) hoặc bỏ log theo overflow policy
+    - _id sinh trước khi enqueue nên caller có detection_id ngay (alert, clip)
+    - stop() ghi nốt queue khi shutdown
+    """
+
+    def __init__(self):
+        settings = get_settings()
+        self.batch_size = max(settings.detection_log_batch_size, 1)
+        self.flush_interval = settings.detection_log_flush_interval_ms / 1000.0
+        self.max_queue = max(settings.detection_log_queue_max, self.batch_size)
+        self.max_session_queue = max(settings.detection_session_queue_max, self.batch_size)
+        self.overflow_policy = settings.detection_log_overflow_policy
+        self.block_timeout = settings.detection_log_block_timeout_ms / 1000.0
+        self.stop_timeout = settings.detection_log_stop_timeout_seconds
+
+        self._logs: Deque[dict] = deque()
+        self._session_ops: Deque[Any] = deque()
+        self._wakeup: Optional[asyncio.Event] = None  # Có document chờ ghi
+        self._batch_ready: Optional[asyncio.Event] = None  # Đủ một batch - flush ngay
+        self._space: Optional[asyncio.Event] = None  # Flush vừa giải phóng chỗ trong queue
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False  # stop() đã gọi - loop ghi nốt queue rồi thoát
+
+        self.stats = {
+            "logs_written": 0,
+            "session_ops_written": 0,
+            "logs_dropped": 0,
+            "session_ops_dropped": 0,
+            "write_errors": 0,
+            "flushes": 0,
+            "last_batch_size": 0,
+            "last_flush_latency_ms": 0.0,
+            "avg_flush_latency_ms": 0.0
+        }
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._logs) + len(self._session_ops)
+
+    def _ensure_started(self):
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._batch_ready = asyncio.Event()
+            self._space = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    def _signal(self):
+        self._wakeup.set()
+        if self.queue_depth >= self.batch_size:
+            self._batch_ready.set()
+
+    async def enqueue_log(self, detection_doc: dict) -> Optional[str]:
+        """
+        Đưa detection log vào queue ghi
+
+        Returns:
+            detection_id (str) đã sinh sẵn, hoặc None nếu log bị bỏ do queue đầy
+        """
+        self._ensure_started()
+        detection_doc.setdefault("_id", ObjectId())
+
+        if len(self._logs) >= self.max_queue and self.overflow_policy == OVERFLOW_BLOCK:
+            await self._wait_for_space()
+        if len(self._logs) >= self.max_queue:
+            self.stats["logs_dropped"] += 1
+            if self.overflow_policy == OVERFLOW_DROP_OLDEST:
+                self._logs.popleft()
+            else:
+                return None
+
+        self._logs.append(detection_doc)
+        self._signal()
+        return str(detection_doc["_id"])
+
+    async def _wait_for_space(self):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.block_timeout
+        while len(self._logs) >= self.max_queue:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return
+            self._space.clear()
+            try:
+                await asyncio.wait_for(self._space.wait(), remaining)
+            except asyncio.TimeoutError:
+                return
+
+    def _enqueue_session_op(self, op: Any) -> bool:
+        self._ensure_started()
+        if len(self._session_ops) >= self.max_session_queue:
+            # Mongo chậm/lỗi kéo dài - bỏ op mới thay vì để queue tăng không giới hạn
+            self.stats["session_ops_dropped"] += 1
+            if self.stats["session_ops_dropped"] % 100 == 1:
+                print(f"⚠️ DetectionLogWriter: Session queue full ({self.max_session_queue}), dropping session ops")
+            return False
+        self._session_ops.append(op)
+        self._signal()
+        return True
+
+    def enqueue_session_insert(self, session_doc: dict) -> str:
+        """Đưa session mới vào queue ghi (bị bỏ nếu session queue đầy)"""
+        session_doc.setdefault("_id", ObjectId())
+        self._enqueue_session_op(InsertOne(session_doc))
+        return str(session_doc["_id"])
+
+    def enqueue_session_update(self, filter_doc: dict, update_doc: dict):
+        """Đưa update session vào queue ghi (chạy sau insert của session cùng batch)"""
+        self._enqueue_session_op(UpdateOne(filter_doc, update_doc))
+
+    async def _run(self):
+        while True:
+            try:
+                if self._stopping:
+                    await self._drain()
+                    return
+                await self._wakeup.wait()
+                if self.queue_depth < self.batch_size and not self._stopping:
+                    # Chờ đủ batch hoặc hết flush interval
+                    try:
+                        await asyncio.wait_for(self._batch_ready.wait(), self.flush_interval)
+                    except asyncio.TimeoutError:
+                        pass
+                self._batch_ready.clear()
+
+                if self._stopping:
+                    await self._drain()
+                    return
+                if not await self._flush():
+                    # Mongo lỗi - document đã được đưa lại vào queue, chờ rồi thử lại
+                    await asyncio.sleep(self.flush_interval)
+                if self.queue_depth == 0 and not self._stopping:
+                    # Không xóa wakeup mà stop() vừa set - loop phải thấy _stopping ở vòng sau
+                    self._wakeup.clear()
+                elif self.queue_depth >= self.batch_size:
+                    self._batch_ready.set()
+
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                print(f"❌ DetectionLogWriter: Error in writer loop: {e}")
+
+    async def _flush(self) -> bool:
+        """Ghi một batch log + session ops; False nếu Mongo lỗi (batch được đưa lại vào queue)"""
+        logs: List[dict] = [self._logs.popleft() for _ in range(min(len(self._logs), self.batch_size))]
+        session_ops: List[Any] = [self._session_ops.popleft() for _ in range(min(len(self._session_ops), self.batch_size))]
+        if not logs and not session_ops:
+            return True
+        self._space.set()
+
+        db = get_database()
+        start = time.monotonic()
+        ok = True
+        if logs:
+            try:
+                await db.detection_logs.insert_many(logs, ordered=False)
+                self.stats["logs_written"] += len(logs)
+            except BulkWriteError as e:
+                # Document lỗi (vd. trùng _id) không ghi lại; các document còn lại đã được insert
+                self.stats["write_errors"] += len(e.details.get("writeErrors", []))
+                self.stats["logs_written"] += e.details.get("nInserted", 0)
+            except asyncio.CancelledError:
+                # Bị hủy giữa lúc ghi - đưa cả batch lại vào queue (_id sinh sẵn nên ghi lại không tạo bản trùng)
+                self._logs.extendleft(reversed(logs))
+                self._session_ops.extendleft(reversed(session_ops))
+                raise
+            except Exception as e:
+                ok = False
+                self.stats["write_errors"] += 1
+                self._logs.extendleft(reversed(logs))
+                print(f"❌ DetectionLogWriter: Error writing {len(logs)} detection logs: {e}")
+        if session_ops:
+            try:
+                await db.detection_sessions.bulk_write(session_ops, ordered=True)
+                self.stats["session_ops_written"] += len(session_ops)
+            except BulkWriteError as e:
+                # ordered=True dừng ở op lỗi - bỏ op lỗi, ghi lại các op phía sau
+                details = e.details
+                failed = details["writeErrors"][0]["index"] if details.get("writeErrors") else len(session_ops)
+                self.stats["write_errors"] += 1
+                self.stats["session_ops_written"] += failed
+                self._session_ops.extendleft(reversed(session_ops[failed + 1:]))
+            except asyncio.CancelledError:
+                self._session_ops.extendleft(reversed(session_ops))
+                raise
+            except Exception as e:
+                ok = False
+                self.stats["write_errors"] += 1
+                self._session_ops.extendleft(reversed(session_ops))
+                print(f"❌ DetectionLogWriter: Error writing {len(session_ops)} session ops: {e}")
+
+        latency_ms = (time.monotonic() - start) * 1000
+        self.stats["flushes"] += 1
+        self.stats["last_batch_size"] = len(logs) + len(session_ops)
+        self.stats["last_flush_latency_ms"] = round(latency_ms, 1)
+        avg = self.stats["avg_flush_latency_ms"]
+        self.stats["avg_flush_latency_ms"] = round(latency_ms if self.stats["flushes"] == 1 else avg * 0.9 + latency_ms * 0.1, 1)
+        return ok
+
+    async def _drain(self):
+        while self.queue_depth:
+            if not await self._flush():
+                print(f"⚠️ DetectionLogWriter: Discarding {self.queue_depth} unwritten documents on shutdown")
+                break
+        self._logs.clear()
+        self._session_ops.clear()
+
+    async def stop(self):
+        """
+        Dừng writer và ghi nốt document đang chờ (gọi khi shutdown, trước khi đóng DB)
+
+        Không cancel loop giữa lúc flush - báo dừng rồi chờ loop tự ghi nốt queue và thoát
+        """
+        task = self._task
+        if task and not task.done():
+            self._stopping = True
+            self._wakeup.set()
+            self._batch_ready.set()
+            try:
+                # shield: shutdown bị hủy cũng không cắt ngang batch đang ghi
+                await asyncio.wait_for(asyncio.shield(task), self.stop_timeout)
+            except asyncio.TimeoutError:
+                # Mongo treo - hủy loop (batch đang ghi được đưa lại queue) rồi bỏ phần còn lại
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+                print(f"⚠️ DetectionLogWriter: Stop timed out, discarding {self.queue_depth} unwritten documents")
+                self._logs.clear()
+                self._session_ops.clear()
+        else:
+            await self._drain()
+        self._task = None
+        self._stopping = False
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "queue_depth": self.queue_depth,
+            "logs_queued": len(self._logs),
+            "session_ops_queued": len(self._session_ops),
+            "max_queue": self.max_queue,
+            "max_session_queue": self.max_session_queue,
+            "overflow_policy": self.overflow_policy
+        }
+
+# Global instance
+detection_log_writer = DetectionLogWriter()
@@ -4,6 +4,7 @@ import asyncio
 import uuid
 from bson import ObjectId
 from ..database import get_database
+from .detection_log_writer import detection_log_writer
 
 class DetectionOptimizerService:
     """
@@ -83,12 +84,14 @@ class DetectionOptimizerService:
             if buffer:
                 await self._save_detection_session(buffer)
     
-    async def process_detection(self, detection_data: dict) -> Optional[str]:
+    async def process_detection(self, detection_data: dict, always_save: bool = False) -> Optional[str]:
         """
         Xử lý detection mới và quyết định cách lưu trữ
         
         Args:
             detection_data: Dữ liệu detection (camera_id, person_id, person_name, detection_type, ...)
+            always_save: Caller đã lọc detection (stream_processor qua detection_tracker) -
+                luôn lưu detection, buffer chỉ dùng để gom session
             
         Returns:
             detection_id: ID của detection nếu được lưu, None nếu chỉ cập nhật buffer
@@ -100,12 +103,13 @@ class DetectionOptimizerService:
             person_name = detection_data.get('person_name', 'Unknown')
             detection_type = detection_data.get('detection_type', 'stranger')
             confidence = detection_data.get('confidence', 0.0)
+            stranger_id = detection_data.get('stranger_id')
             
             if not camera_id:
                 return None
             
-            # Create buffer key: camera_id + person_id
-            buffer_key = f"{camera_id}_{person_id or 'unknown'}"
+            # Create buffer key: camera_id + person_id (người lạ dùng stranger_id cố định)
+            buffer_key = f"{camera_id}_{person_id or stranger_id or 'unknown'}"
             now = datetime.now()
             
             # Check if there's an existing buffer for this person on this camera
@@ -137,7 +141,7 @@ class DetectionOptimizerService:
                 
                 # Additional save condition: high confidence detection
                 high_confidence_threshold = 0.9 if detection_type == 'known_person' else 0.85
-                if confidence >= high_confidence_threshold:
+                if confidence >= high_confidence_threshold or always_save:
                     should_save = True
                 
                 if should_save:
@@ -161,6 +165,7 @@ class DetectionOptimizerService:
                     'camera_id': camera_id,
                     'person_id': person_id,
                     'person_name': person_name,
+                    'stranger_id': stranger_id,
                     'detection_type': detection_type,
                     'first_detection_time': now,
                     'last_detection_time': now,
@@ -197,9 +202,12 @@ class DetectionOptimizerService:
                 "detection_type": detection_type,
                 "person_id": ObjectId(detection_data.get('person_id')) if detection_data.get('person_id') else None,
                 "person_name": detection_data.get('person_name', 'Unknown'),
+                "stranger_id": detection_data.get('stranger_id'),
                 "confidence": detection_data.get('confidence', 0),
                 "similarity_score": detection_data.get('similarity_score', 0),
                 "image_path": detection_data.get('image_path', ''),
+                "thumbnail_path": detection_data.get('thumbnail_path'),
+                "context_image_path": detection_data.get('context_image_path'),
                 "bbox": detection_data.get('bbox', [0, 0, 0, 0]),
                 "timestamp": datetime.utcnow(),
                 "is_alert_sent": detection_type in ["stranger", "unknown"],  # ✅ FIXED: True for alerts, False for known persons
@@ -212,11 +220,12 @@ class DetectionOptimizerService:
                 "notes": detection_data.get('notes', '')
             }
             
-            # Insert into detection_logs collection
-            result = await self.collection_detections.insert_one(detection_doc)
-            detection_id = str(result.inserted_id)
-            
-            print(f"✅ Detection saved to database: {detection_data.get('person_name')} - ID: {detection_id}")
+            # Ghi qua write-behind queue (insert_many theo batch)
+            detection_id = await detection_log_writer.enqueue_log(detection_doc)
+            if detection_id:
+                print(f"✅ Detection queued for database: {detection_data.get('person_name')} - ID: {detection_id}")
+            else:
+                print(f"⚠️ Detection log dropped (write queue full): {detection_data.get('person_name')}")
             return detection_id
             
         except Exception as e:
@@ -228,7 +237,7 @@ class DetectionOptimizerService:
         try:
             # Extract data
             camera_id = buffer.get('camera_id')
-            user_id = await self._get_user_id_from_camera(camera_id)
+            user_id = buffer['best_detection_data'].get('user_id') or await self._get_user_id_from_camera(camera_id)
             
             if not user_id:
                 return None
@@ -241,6 +250,7 @@ class DetectionOptimizerService:
                 "detection_type": buffer.get('detection_type', 'stranger'),
                 "person_id": ObjectId(buffer.get('person_id')) if buffer.get('person_id') else None,
                 "person_name": buffer.get('person_name', 'Unknown'),
+                "stranger_id": buffer.get('stranger_id'),
                 
                 # Session statistics
                 "detection_count": buffer.get('detection_count', 1),
@@ -256,9 +266,8 @@ class DetectionOptimizerService:
                 "created_at": datetime.utcnow()
             }
             
-            # Insert into sessions collection
-            result = await self.collection_sessions.insert_one(session_doc)
-            session_id = str(result.inserted_id)
+            # Ghi qua write-behind queue (bulk_write theo batch)
+            session_id = detection_log_writer.enqueue_session_insert(session_doc)
             
             print(f"✅ Session created: {buffer.get('person_name')} - ID: {session_id}")
             return session_id
@@ -282,13 +291,9 @@ class DetectionOptimizerService:
                 "last_updated": datetime.utcnow()
             }
             
-            # Update session in database
-            result = await self.collection_sessions.update_one(
-                {"session_id": session_id},
-                {"$set": update_data}
-            )
-            
-            return result.modified_count > 0
+            # Update qua write-behind queue (chạy sau insert của session)
+            detection_log_writer.enqueue_session_update({"session_id": session_id}, {"$set": update_data})
+            return True
             
         except Exception as e:
             print(f"Error updating session: {e}")
@@ -10,10 +10,10 @@ from ..models.detection_log import (
 )
 from datetime import datetime, timedelta
 from ..utils.timezone_utils import vietnam_now
+from .image_storage import image_storage
 import asyncio
 import base64
 import os
-import uuid
 
 class DetectionService:
     @property
@@ -37,7 +37,9 @@ class DetectionService:
                 raise ValueError("Camera not found or access denied")
             
             # Save image to file system
-            image_filename = await self._save_detection_image(detection_data.image_base64)
+            image_filename, thumbnail_filename = await self._save_detection_image(
+                detection_data.image_base64, detection_data.camera_id
+            )
             
             # Prepare detection document
             detection_dict = {
@@ -49,6 +51,7 @@ class DetectionService:
                 "confidence": detection_data.confidence,
                 "similarity_score": detection_data.similarity_score,
                 "image_path": image_filename,
+                "thumbnail_path": thumbnail_filename,
                 "image_base64": detection_data.image_base64,  # Keep for quick access
                 "bbox": detection_data.bbox,
                 "timestamp": vietnam_now(),
@@ -79,31 +82,20 @@ class DetectionService:
         except Exception as e:
             raise ValueError(f"Failed to create detection: {str(e)}")
 
-    async def _save_detection_image(self, image_base64: str) -> str:
-        """Lưu ảnh detection vào file system"""
+    async def _save_detection_image(self, image_base64: str, camera_id: Optional[str] = None):
+        """Lưu ảnh detection + thumbnail qua ImageStorage, trả về (image_path, thumbnail_path)"""
         try:
-            # Ensure upload directory exists
-            upload_dir = "uploads/detections"
-            os.makedirs(upload_dir, exist_ok=True)
-            
-            # Generate unique filename
-            image_filename = f"{uuid.uuid4()}.jpg"
-            image_path = os.path.join(upload_dir, image_filename)
-            
             # Decode base64 and save
             if image_base64.startswith('data:image/'):
                 image_data = base64.b64decode(image_base64.split(',')[1])
             else:
                 image_data = base64.b64decode(image_base64)
             
-            with open(image_path, 'wb') as f:
-                f.write(image_data)
-            
-            return image_path
+            return await image_storage.save(image_data, camera_id)
             
         except Exception as e:
             print(f"Error saving detection image: {e}")
-            return ""
+            return "", None
 
     async def _send_stranger_alert(self, user_id: str, detection_data: Dict[str, Any]):
         """Gửi cảnh báo stranger (sẽ integrate với notification service sau)"""
@@ -196,13 +188,10 @@ class DetectionService:
                         # Default fallback for invalid data
                         sanitized_detection_type = "unknown"
                     
-                    # Build image URL safely
+                    # Build image URL safely (thumbnail cho list view, ảnh cũ không có thumbnail)
                     image_path = detection.get("image_path", "")
-                    image_url = ""
-                    if image_path:
-                        filename = os.path.basename(image_path)
-                        if filename:
-                            image_url = f"/uploads/detections/{filename}"
+                    image_url = image_storage.url_for(image_path)
+                    thumbnail_url = image_storage.url_for(detection.get("thumbnail_path")) or image_url
                     
                     # Format response
                     detection_response = {
@@ -216,6 +205,9 @@ class DetectionService:
                         "similarity_score": detection.get("similarity_score"),
                         "image_path": image_path,
                         "image_url": image_url,
+                        "thumbnail_url": thumbnail_url,
+                        "context_image_url": image_storage.url_for(detection.get("context_image_path")) or None,
+                        "clip_url": f"/uploads/clips/{os.path.basename(detection['clip_path'])}" if detection.get("clip_path") else None,
                         "bbox": detection.get("bbox", [0, 0, 0, 0]),
                         "timestamp": detection.get("timestamp", vietnam_now()),
                         "is_alert_sent": detection.get("is_alert_sent", False),
@@ -242,51 +234,85 @@ class DetectionService:
             traceback.print_exc()
             return []
 
+    @staticmethod
+    def _sum_if(condition: Dict[str, Any]) -> Dict[str, Any]:
+        return {"$sum": {"$cond": [condition, 1, 0]}}
+
+    def _counts_group(self, windows: Optional[Dict[str, datetime]] = None) -> Dict[str, Any]:
+        """
+        $group đếm detection theo loại (và theo từng mốc thời gian) trong một lượt quét
+
+        Kết quả: total, stranger, known_person, alerts, <window>_total, <window>_stranger
+        """
+        is_stranger = {"$eq": ["$detection_type", "stranger"]}
+        group = {
+            "_id": None,
+            "total": {"$sum": 1},
+            "stranger": self._sum_if(is_stranger),
+            "known_person": self._sum_if({"$eq": ["$detection_type", "known_person"]}),
+            "alerts": self._sum_if({"$eq": ["$is_alert_sent", True]})
+        }
+        for name, start in (windows or {}).items():
+            in_window = {"$gte": ["$timestamp", start]}
+            group[f"{name}_total"] = self._sum_if(in_window)
+            group[f"{name}_stranger"] = self._sum_if({"$and": [in_window, is_stranger]})
+        return {"$group": group}
+
+    async def _count_detections(self, query: Dict[str, Any],
+                                windows: Optional[Dict[str, datetime]] = None) -> Dict[str, int]:
+        """Đếm detection khớp query bằng một aggregation (thay cho nhiều count_documents)"""
+        result = await self.collection.aggregate([{"$match": query}, self._counts_group(windows)]).to_list(length=1)
+        return result[0] if result else {}
+
+    async def _count_cameras(self, user_id: str) -> Dict[str, int]:
+        """Số camera tổng / active / streaming của user trong một aggregation"""
+        result = await self.db.cameras.aggregate([
+            {"$match": {"user_id": ObjectId(user_id)}},
+            {"$group": {
+                "_id": None,
+                "total": {"$sum": 1},
+                "active": self._sum_if({"$eq": ["$is_active", True]}),
+                "streaming": self._sum_if({"$eq": ["$is_streaming", True]})
+            }}
+        ]).to_list(length=1)
+        return result[0] if result else {}
+
+    async def _get_camera_names(self, camera_ids: List[Any]) -> Dict[Any, str]:
+        """camera _id -> tên camera, một query cho cả danh sách"""
+        if not camera_ids:
+            return {}
+        cursor = self.db.cameras.find({"_id": {"$in": list(set(camera_ids))}}, {"name": 1})
+        return {camera["_id"]: camera.get("name", "Unknown Camera") async for camera in cursor}
+
     async def get_detection_stats(self, user_id: str) -> DetectionStats:
         """Lấy thống kê detection"""
         try:
             query = {"user_id": ObjectId(user_id)}
             
-            # Basic counts
-            total_detections = await self.collection.count_documents(query)
-            stranger_detections = await self.collection.count_documents({
-                **query, "detection_type": "stranger"
-            })
-            known_person_detections = await self.collection.count_documents({
-                **query, "detection_type": "known_person"
-            })
-            
             # Time-based counts
             now = vietnam_now()
-            today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-            week_start = now - timedelta(days=7)
-            month_start = now - timedelta(days=30)
-            
-            today_detections = await self.collection.count_documents({
-                **query, "timestamp": {"$gte": today_start}
-            })
-            
-            this_week_detections = await self.collection.count_documents({
-                **query, "timestamp": {"$gte": week_start}
-            })
-            
-            this_month_detections = await self.collection.count_documents({
-                **query, "timestamp": {"$gte": month_start}
-            })
+            windows = {
+                "today": now.replace(hour=0, minute=0, second=0, microsecond=0),
+                "week": now - timedelta(days=7),
+                "month": now - timedelta(days=30)
+            }
             
-            # Active cameras count
-            cameras_active = await self.db.cameras.count_documents({
-                "user_id": ObjectId(user_id),
-                "is_active": True
-            })
+            # Đếm detection (một aggregation) và camera active song song
+            counts, cameras_active = await asyncio.gather(
+                self._count_detections(query, windows),
+                self.db.cameras.count_documents({
+                    "user_id": ObjectId(user_id),
+                    "is_active": True
+                })
+            )
             
             return DetectionStats(
-                total_detections=total_detections,
-                stranger_detections=stranger_detections,
-                known_person_detections=known_person_detections,
-                today_detections=today_detections,
-                this_week_detections=this_week_detections,
-                this_month_detections=this_month_detections,
+                total_detections=counts.get("total", 0),
+                stranger_detections=counts.get("stranger", 0),
+                known_person_detections=counts.get("known_person", 0),
+                today_detections=counts.get("today_total", 0),
+                this_week_detections=counts.get("week_total", 0),
+                this_month_detections=counts.get("month_total", 0),
                 cameras_active=cameras_active
             )
             
@@ -340,9 +366,14 @@ class DetectionService:
                 
             # Build image URL safely
             image_url = ""
+            thumbnail_url = None
             if log_data.get("image_path"):
-                rel_path = f"/uploads/detections/{os.path.basename(log_data.get('image_path', ''))}"
-                image_url = f"{base_url}{rel_path}" if base_url else rel_path
+                image_url = f"{base_url}{image_storage.url_for(log_data['image_path'])}"
+            if log_data.get("thumbnail_path"):
+                thumbnail_url = f"{base_url}{image_storage.url_for(log_data['thumbnail_path'])}"
+            context_image_url = None
+            if log_data.get("context_image_path"):
+                context_image_url = f"{base_url}{image_storage.url_for(log_data['context_image_path'])}"
                 
             # Validate detection_type
             detection_type = log_data.get("detection_type", "unknown")
@@ -357,6 +388,9 @@ class DetectionService:
                 confidence=log_data.get("confidence", 0.0),
                 similarity_score=log_data.get("similarity_score"),
                 image_url=image_url,
+                thumbnail_url=thumbnail_url,
+                context_image_url=context_image_url,
+                clip_url=f"/uploads/clips/{os.path.basename(log_data['clip_path'])}" if log_data.get("clip_path") else None,
                 bbox=log_data.get("bbox", []),
                 timestamp=log_data.get("timestamp", vietnam_now()),
                 is_alert_sent=log_data.get("is_alert_sent", False)
@@ -379,12 +413,9 @@ class DetectionService:
             if not detection:
                 return False
             
-            # Delete image file if exists
-            if detection.get("image_path") and os.path.exists(detection["image_path"]):
-                try:
-                    os.remove(detection["image_path"])
-                except:
-                    pass
+            # Delete image + thumbnail/context files if exist
+            await image_storage.delete(detection.get("image_path"), detection.get("thumbnail_path"),
+                                       detection.get("context_image_path"))
             
             # Delete from database
             result = await self.collection.delete_one({
@@ -411,13 +442,12 @@ class DetectionService:
             }):
                 old_detections.append(detection)
             
-            # Delete image files
-            for detection in old_detections:
-                if detection.get("image_path") and os.path.exists(detection["image_path"]):
-                    try:
-                        os.remove(detection["image_path"])
-                    except:
-                        pass
+            # Delete image files (và clip sự kiện - clip chỉ dùng chung giữa các detection cùng thời điểm)
+            await image_storage.delete(*[
+                detection.get(path_key)
+                for detection in old_detections
+                for path_key in ("image_path", "thumbnail_path", "context_image_path", "clip_path")
+            ])
             
             # Delete from database
             result = await self.collection.delete_many({
@@ -436,129 +466,94 @@ class DetectionService:
         try:
             query = {"user_id": ObjectId(user_id)}
             
-            # Basic counts
-            total_detections = await self.collection.count_documents(query)
-            stranger_detections = await self.collection.count_documents({
-                **query, "detection_type": "stranger"
-            })
-            known_person_detections = await self.collection.count_documents({
-                **query, "detection_type": "known_person"
-            })
-            
             # Time-based statistics
             now = datetime.utcnow()
             today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-            week_start = now - timedelta(days=7)
-            month_start = now - timedelta(days=30)
-            
-            today_detections = await self.collection.count_documents({
-                **query, "timestamp": {"$gte": today_start}
-            })
-            
-            this_week_detections = await self.collection.count_documents({
-                **query, "timestamp": {"$gte": week_start}
-            })
-            
-            this_month_detections = await self.collection.count_documents({
-                **query, "timestamp": {"$gte": month_start}
-            })
-            
-            # Camera statistics
-            total_cameras = await self.db.cameras.count_documents({
-                "user_id": ObjectId(user_id)
-            })
-            
-            active_cameras = await self.db.cameras.count_documents({
-                "user_id": ObjectId(user_id),
-                "is_active": True
-            })
+            windows = {
+                "today": today_start,
+                "week": now - timedelta(days=7),
+                "month": now - timedelta(days=30),
+                "last_24h": now - timedelta(hours=24)
+            }
             
-            streaming_cameras = await self.db.cameras.count_documents({
-                "user_id": ObjectId(user_id),
-                "is_streaming": True
-            })
+            # Một aggregation cho mọi thống kê detection: đếm, top camera, phân bố theo giờ hôm nay
+            detection_pipeline = [
+                {"$match": query},
+                {"$facet": {
+                    "counts": [self._counts_group(windows)],
+                    "top_cameras": [
+                        {"$group": {
+                            "_id": "$camera_id",
+                            "detection_count": {"$sum": 1},
+                            "stranger_count": self._sum_if({"$eq": ["$detection_type", "stranger"]})
+                        }},
+                        {"$sort": {"detection_count": -1}},
+                        {"$limit": 5}
+                    ],
+                    "hourly": [
+                        {"$match": {"timestamp": {"$gte": today_start, "$lt": today_start + timedelta(days=1)}}},
+                        {"$group": {"_id": {"$hour": "$timestamp"}, "count": {"$sum": 1}}}
+                    ]
+                }}
+            ]
             
-            # Person statistics
-            total_persons = await self.db.known_persons.count_documents({
-                "user_id": ObjectId(user_id),
-                "is_active": True
-            })
+            # Detection, camera và person stats độc lập - chạy song song
+            facets, camera_counts, total_persons = await asyncio.gather(
+                self.collection.aggregate(detection_pipeline).to_list(length=1),
+                self._count_cameras(user_id),
+                self.db.known_persons.count_documents({
+                    "user_id": ObjectId(user_id),
+                    "is_active": True
+                })
+            )
+            facets = facets[0] if facets else {}
+            counts = (facets.get("counts") or [{}])[0]
             
-            # Recent activity (last 24 hours)
-            yesterday = now - timedelta(hours=24)
-            recent_stranger_alerts = await self.collection.count_documents({
-                **query, 
-                "detection_type": "stranger",
-                "timestamp": {"$gte": yesterday}
-            })
+            total_detections = counts.get("total", 0)
+            known_person_detections = counts.get("known_person", 0)
+            total_cameras = camera_counts.get("total", 0)
+            active_cameras = camera_counts.get("active", 0)
             
             # Detection accuracy (simple calculation)
             detection_accuracy = 0.0
             if total_detections > 0:
                 detection_accuracy = (known_person_detections / total_detections) * 100
             
-            # Alert statistics
-            alerts_sent = await self.collection.count_documents({
-                **query, 
-                "is_alert_sent": True
-            })
+            # Top cameras by detections (tên camera lấy trong một query)
+            camera_stats = facets.get("top_cameras", [])
+            camera_names = await self._get_camera_names([stat["_id"] for stat in camera_stats])
+            top_cameras = [
+                {
+                    "camera_id": str(stat["_id"]),
+                    "camera_name": camera_names[stat["_id"]],
+                    "detection_count": stat["detection_count"],
+                    "stranger_count": stat["stranger_count"]
+                }
+                for stat in camera_stats if stat["_id"] in camera_names
+            ]
             
-            # Top cameras by detections
-            top_cameras = []
-            camera_stats = await self.collection.aggregate([
-                {"$match": query},
-                {"$group": {
-                    "_id": "$camera_id",
-                    "detection_count": {"$sum": 1},
-                    "stranger_count": {
-                        "$sum": {"$cond": [{"$eq": ["$detection_type", "stranger"]}, 1, 0]}
-                    }
-                }},
-                {"$sort": {"detection_count": -1}},
-                {"$limit": 5}
-            ]).to_list(length=5)
-            
-            for stat in camera_stats:
-                camera_data = await self.db.cameras.find_one({"_id": stat["_id"]})
-                if camera_data:
-                    top_cameras.append({
-                        "camera_id": str(stat["_id"]),
-                        "camera_name": camera_data["name"],
-                        "detection_count": stat["detection_count"],
-                        "stranger_count": stat["stranger_count"]
-                    })
-            
-            # Hourly detection pattern (last 24 hours)
-            hourly_pattern = {}
-            for hour in range(24):
-                hour_start = today_start + timedelta(hours=hour)
-                hour_end = hour_start + timedelta(hours=1)
-                
-                count = await self.collection.count_documents({
-                    **query,
-                    "timestamp": {"$gte": hour_start, "$lt": hour_end}
-                })
-                
-                hourly_pattern[f"{hour:02d}:00"] = count
+            # Hourly detection pattern (hôm nay, giờ UTC)
+            hourly_counts = {stat["_id"]: stat["count"] for stat in facets.get("hourly", [])}
+            hourly_pattern = {f"{hour:02d}:00": hourly_counts.get(hour, 0) for hour in range(24)}
             
             return {
                 "overview": {
                     "total_detections": total_detections,
-                    "stranger_detections": stranger_detections,
+                    "stranger_detections": counts.get("stranger", 0),
                     "known_person_detections": known_person_detections,
                     "detection_accuracy": round(detection_accuracy, 2),
-                    "alerts_sent": alerts_sent
+                    "alerts_sent": counts.get("alerts", 0)
                 },
                 "time_based": {
-                    "today": today_detections,
-                    "this_week": this_week_detections,
-                    "this_month": this_month_detections,
-                    "last_24h_strangers": recent_stranger_alerts
+                    "today": counts.get("today_total", 0),
+                    "this_week": counts.get("week_total", 0),
+                    "this_month": counts.get("month_total", 0),
+                    "last_24h_strangers": counts.get("last_24h_stranger", 0)
                 },
                 "camera_stats": {
                     "total_cameras": total_cameras,
                     "active_cameras": active_cameras,
-                    "streaming_cameras": streaming_cameras,
+                    "streaming_cameras": camera_counts.get("streaming", 0),
                     "offline_cameras": total_cameras - active_cameras
                 },
                 "person_stats": {
@@ -612,23 +607,19 @@ class DetectionService:
                 "timestamp": {"$gte": start_date}
             }
             
-            # Get camera info
-            camera_data = await self.db.cameras.find_one({
-                "_id": ObjectId(camera_id),
-                "user_id": ObjectId(user_id)
-            })
+            # Get camera info và basic stats (một aggregation) song song
+            camera_data, counts = await asyncio.gather(
+                self.db.cameras.find_one({
+                    "_id": ObjectId(camera_id),
+                    "user_id": ObjectId(user_id)
+                }),
+                self._count_detections(query)
+            )
             
             if not camera_data:
                 raise ValueError("Camera not found")
             
-            # Basic stats
-            total_detections = await self.collection.count_documents(query)
-            stranger_detections = await self.collection.count_documents({
-                **query, "detection_type": "stranger"
-            })
-            known_person_detections = await self.collection.count_documents({
-                **query, "detection_type": "known_person"
-            })
+            total_detections = counts.get("total", 0)
             
             return {
                 "camera_info": {
@@ -642,8 +633,8 @@ class DetectionService:
                 "period": f"Last {days} days",
                 "summary": {
                     "total_detections": total_detections,
-                    "stranger_detections": stranger_detections,
-                    "known_person_detections": known_person_detections,
+                    "stranger_detections": counts.get("stranger", 0),
+                    "known_person_detections": counts.get("known_person", 0),
                     "avg_detections_per_day": round(total_detections / days, 2)
                 }
             }
@@ -819,33 +810,17 @@ class DetectionService:
                 "timestamp": {"$gte": last_30_min}
             }
             
-            query_5min = {
-                "user_id": ObjectId(user_id),
-                "timestamp": {"$gte": last_5_min}
-            }
-            
-            # Last 30 minutes
-            detections_30min = await self.collection.count_documents(query_30min)
-            strangers_30min = await self.collection.count_documents({
-                **query_30min, "detection_type": "stranger"
-            })
-            
-            # Last 5 minutes
-            detections_5min = await self.collection.count_documents(query_5min)
-            strangers_5min = await self.collection.count_documents({
-                **query_5min, "detection_type": "stranger"
-            })
-            
-            # Active cameras
-            active_cameras = await self.db.cameras.count_documents({
-                "user_id": ObjectId(user_id),
-                "is_active": True
-            })
+            # 30 phút + 5 phút gần nhất trong một aggregation, song song với thống kê camera
+            counts, camera_counts = await asyncio.gather(
+                self._count_detections(query_30min, {"last_5min": last_5_min}),
+                self._count_cameras(user_id)
+            )
             
-            streaming_cameras = await self.db.cameras.count_documents({
-                "user_id": ObjectId(user_id),
-                "is_streaming": True
-            })
+            detections_30min = counts.get("total", 0)
+            strangers_30min = counts.get("stranger", 0)
+            detections_5min = counts.get("last_5min_total", 0)
+            strangers_5min = counts.get("last_5min_stranger", 0)
+            streaming_cameras = camera_counts.get("streaming", 0)
             
             return {
                 "timestamp": now.isoformat(),
@@ -860,7 +835,7 @@ class DetectionService:
                     "known_person_detections": detections_5min - strangers_5min
                 },
                 "system_status": {
-                    "active_cameras": active_cameras,
+                    "active_cameras": camera_counts.get("active", 0),
                     "streaming_cameras": streaming_cameras,
                     "detection_active": streaming_cameras > 0
                 }
@@ -1230,110 +1205,103 @@ class DetectionService:
             if detection_type in ['known_person', 'stranger']:
                 query["detection_type"] = detection_type
             
-            # Get basic statistics
-            total_detections = await self.collection.count_documents(query)
+            is_stranger = {"$eq": ["$detection_type", "stranger"]}
+            is_known = {"$eq": ["$detection_type", "known_person"]}
             
-            stranger_query = {**query, "detection_type": "stranger"}
-            known_query = {**query, "detection_type": "known_person"}
+            # Toàn bộ báo cáo trong một aggregation ($facet): tổng, theo ngày, theo giờ, theo camera, timeline
+            result = await self.collection.aggregate([
+                {"$match": query},
+                {"$facet": {
+                    "counts": [self._counts_group()],
+                    "daily": [
+                        {"$group": {
+                            "_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$timestamp"}},
+                            "detections": {"$sum": 1},
+                            "strangers": self._sum_if(is_stranger),
+                            "known": self._sum_if(is_known)
+                        }}
+                    ],
+                    "hourly": [
+                        {"$group": {"_id": {"$hour": "$timestamp"}, "count": {"$sum": 1}}}
+                    ],
+                    "cameras": [
+                        {"$group": {
+                            "_id": "$camera_id",
+                            "detection_count": {"$sum": 1},
+                            "stranger_count": self._sum_if(is_stranger),
+                            "known_count": self._sum_if(is_known)
+                        }},
+                        {"$sort": {"detection_count": -1}},
+                        {"$limit": 10}
+                    ],
+                    "timeline": [
+                        {"$sort": {"timestamp": -1}},
+                        {"$limit": 50},
+                        {"$project": {"timestamp": 1, "detection_type": 1, "person_name": 1, "camera_id": 1}}
+                    ]
+                }}
+            ]).to_list(length=1)
+            facets = result[0] if result else {}
+            counts = (facets.get("counts") or [{}])[0]
             
-            stranger_detections = await self.collection.count_documents(stranger_query)
-            known_detections = await self.collection.count_documents(known_query)
+            # Get basic statistics
+            total_detections = counts.get("total", 0)
+            stranger_detections = counts.get("stranger", 0)
+            known_detections = counts.get("known_person", 0)
             
             # Calculate accuracy
             accuracy_rate = 0
             if total_detections > 0:
                 accuracy_rate = (known_detections / total_detections) * 100
             
-            # Get daily trend data
+            # Daily trend data (ngày không có detection = 0)
+            daily_stats = {stat["_id"]: stat for stat in facets.get("daily", [])}
             daily_trends = []
             current_date = start_date
             while current_date <= end_date:
-                day_start = current_date.replace(hour=0, minute=0, second=0, microsecond=0)
-                day_end = day_start + timedelta(days=1)
-                
-                day_query = {
-                    **query,
-                    "timestamp": {"$gte": day_start, "$lt": day_end}
-                }
-                
-                day_total = await self.collection.count_documents(day_query)
-                day_strangers = await self.collection.count_documents({
-                    **day_query, "detection_type": "stranger"
-                })
-                day_known = await self.collection.count_documents({
-                    **day_query, "detection_type": "known_person"
-                })
-                
+                day = daily_stats.get(current_date.strftime("%Y-%m-%d"), {})
                 daily_trends.append({
                     "date": current_date.strftime("%Y-%m-%d"),
-                    "detections": day_total,
-                    "known": day_known,
-                    "strangers": day_strangers
+                    "detections": day.get("detections", 0),
+                    "known": day.get("known", 0),
+                    "strangers": day.get("strangers", 0)
                 })
-                
                 current_date += timedelta(days=1)
             
-            # Get hourly pattern
-            hourly_pattern = {}
-            for hour in range(24):
-                hour_start = start_date.replace(hour=hour, minute=0, second=0, microsecond=0)
-                hour_end = hour_start + timedelta(hours=1)
-                
-                hour_query = {
-                    **query,
-                    "timestamp": {"$gte": hour_start, "$lt": hour_end}
-                }
-                
-                hour_count = await self.collection.count_documents(hour_query)
-                hourly_pattern[f"{hour:02d}:00"] = hour_count
+            # Hourly pattern trong cả kỳ báo cáo
+            hourly_counts = {stat["_id"]: stat["count"] for stat in facets.get("hourly", [])}
+            hourly_pattern = {f"{hour:02d}:00": hourly_counts.get(hour, 0) for hour in range(24)}
             
-            # Get camera statistics
-            camera_stats = await self.collection.aggregate([
-                {"$match": query},
-                {"$group": {
-                    "_id": "$camera_id",
-                    "detection_count": {"$sum": 1},
-                    "stranger_count": {
-                        "$sum": {"$cond": [{"$eq": ["$detection_type", "stranger"]}, 1, 0]}
-                    },
-                    "known_count": {
-                        "$sum": {"$cond": [{"$eq": ["$detection_type", "known_person"]}, 1, 0]}
-                    }
-                }},
-                {"$sort": {"detection_count": -1}},
-                {"$limit": 10}
-            ]).to_list(length=10)
+            # Tên camera cho camera stats + timeline trong một query
+            camera_stats = facets.get("cameras", [])
+            recent_detections = facets.get("timeline", [])
+            camera_names = await self._get_camera_names(
+                [stat["_id"] for stat in camera_stats] + [d["camera_id"] for d in recent_detections if d.get("camera_id")]
+            )
             
             # Enrich camera data
-            camera_performance = []
-            for stat in camera_stats:
-                camera_data = await self.db.cameras.find_one({"_id": stat["_id"]})
-                if camera_data:
-                    camera_performance.append({
-                        "camera_id": str(stat["_id"]),
-                        "camera_name": camera_data["name"],
-                        "detection_count": stat["detection_count"],
-                        "stranger_count": stat["stranger_count"],
-                        "known_count": stat["known_count"],
-                        "accuracy": (stat["known_count"] / stat["detection_count"] * 100) if stat["detection_count"] > 0 else 0
-                    })
-            
-            # Get recent detections for timeline
-            recent_detections = await self.collection.find(
-                query,
-                {"timestamp": 1, "detection_type": 1, "person_name": 1, "camera_id": 1}
-            ).sort("timestamp", -1).limit(50).to_list(length=50)
+            camera_performance = [
+                {
+                    "camera_id": str(stat["_id"]),
+                    "camera_name": camera_names[stat["_id"]],
+                    "detection_count": stat["detection_count"],
+                    "stranger_count": stat["stranger_count"],
+                    "known_count": stat["known_count"],
+                    "accuracy": (stat["known_count"] / stat["detection_count"] * 100) if stat["detection_count"] > 0 else 0
+                }
+                for stat in camera_stats if stat["_id"] in camera_names
+            ]
             
             # Enrich recent detections with camera names
-            detection_timeline = []
-            for detection in recent_detections:
-                camera_data = await self.db.cameras.find_one({"_id": detection["camera_id"]})
-                detection_timeline.append({
+            detection_timeline = [
+                {
                     "timestamp": detection["timestamp"].isoformat(),
                     "detection_type": detection["detection_type"],
                     "person_name": detection.get("person_name", "Unknown"),
-                    "camera_name": camera_data["name"] if camera_data else "Unknown Camera"
-                })
+                    "camera_name": camera_names.get(detection.get("camera_id"), "Unknown Camera")
+                }
+                for detection in recent_detections
+            ]
             
             return {
                 "report_config": report_config,
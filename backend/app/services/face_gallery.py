@@ -0,0 +1,168 @@
+import asyncio
+import threading
+from typing import Dict, List, Optional, Tuple, Any, Union
+import numpy as np
+import faiss
+from .known_person_cache import known_person_cache, KnownPersonEntry
+
+
+class FaceGalleryIndex:
+    """
+    FAISS index lâu dài cho known persons của một user
+
+    Index được build một lần, sau đó chỉ thêm/xóa vector theo từng person
+    (IndexIDMap2 + IndexFlatIP, vector đã chuẩn hóa L2 => inner product = cosine).
+    Search chạy trong executor thread nên mọi thao tác đều đi qua một lock.
+    """
+
+    def __init__(self, user_id: str, version: int = 0):
+        self.user_id = user_id
+        self.version = version  # version của KnownPersonCache mà index đang phản ánh
+        self._index = None
+        self._dim: Optional[int] = None
+        self._labels: Dict[int, Tuple[str, str]] = {}  # faiss id -> (person_id, person_name)
+        self._person_ids: Dict[str, List[int]] = {}  # person_id -> faiss ids
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    @property
+    def size(self) -> int:
+        return len(self._labels)
+
+    @property
+    def persons_count(self) -> int:
+        return len(self._person_ids)
+
+    def upsert_person(self, person_id: str, person_name: str, embeddings: Union[np.ndarray, List[np.ndarray]]):
+        """Thêm hoặc thay thế toàn bộ embeddings của một person"""
+        if isinstance(person_name, bytes):
+            person_name = person_name.decode('utf-8')
+        elif not isinstance(person_name, str):
+            person_name = str(person_name)
+
+        with self._lock:
+            self._remove_locked(person_id)
+
+            vectors = [emb for emb in embeddings if emb is not None and emb.size > 0]
+            if not vectors:
+                return
+
+            if self._dim is None:
+                self._dim = int(vectors[0].shape[-1])
+                self._index = faiss.IndexIDMap2(faiss.IndexFlatIP(self._dim))
+
+            vectors = [emb for emb in vectors if emb.shape[-1] == self._dim]
+            if not vectors:
+                print(f"⚠️ FaceGallery: Embedding dimension mismatch for person {person_id}")
+                return
+
+            matrix = np.ascontiguousarray(np.vstack(vectors), dtype=np.float32)
+            faiss.normalize_L2(matrix)
+
+            ids = np.arange(self._next_id, self._next_id + len(matrix), dtype=np.int64)
+            self._next_id += len(matrix)
+            self._index.add_with_ids(matrix, ids)
+
+            self._person_ids[person_id] = ids.tolist()
+            for faiss_id in self._person_ids[person_id]:
+                self._labels[faiss_id] = (person_id, person_name)
+
+    def remove_person(self, person_id: str):
+        """Xóa toàn bộ embeddings của một person khỏi index"""
+        with self._lock:
+            self._remove_locked(person_id)
+
+    def _remove_locked(self, person_id: str):
+        ids = self._person_ids.pop(person_id, None)
+        if not ids:
+            return
+        self._index.remove_ids(np.array(ids, dtype=np.int64))
+        for faiss_id in ids:
+            self._labels.pop(faiss_id, None)
+
+    def search(self, embedding: np.ndarray, threshold: float) -> Optional[Tuple[str, str, float]]:
+        """
+        Tìm person gần nhất với embedding
+
+        Returns:
+            (person_id, person_name, similarity) nếu similarity > threshold, ngược lại None
+        """
+        with self._lock:
+            if self._index is None or not self._labels:
+                return None
+            query = np.ascontiguousarray(embedding, dtype=np.float32).reshape(1, -1)
+            if query.shape[1] != self._dim:
+                return None
+            faiss.normalize_L2(query)
+            D, I = self._index.search(query, 1)
+            similarity = float(D[0][0])
+            faiss_id = int(I[0][0])
+            if faiss_id < 0 or similarity <= threshold:
+                return None
+            person_id, person_name = self._labels[faiss_id]
+            return person_id, person_name, similarity
+
+
+class FaceGalleryService:
+    """
+    Quản lý FaceGalleryIndex theo từng user (owner của camera)
+
+    Dữ liệu lấy từ KnownPersonCache; thay đổi từng person được áp dụng trực tiếp
+    vào index, còn khi version lệch (invalidate toàn bộ) thì index được build lại.
+    """
+
+    def __init__(self):
+        self._galleries: Dict[str, FaceGalleryIndex] = {}
+        self._build_locks: Dict[str, asyncio.Lock] = {}
+        known_person_cache.add_listener(self._on_person_changed)
+
+    async def get_gallery(self, user_id: str) -> FaceGalleryIndex:
+        """Lấy gallery của user, build ở lần gọi đầu tiên hoặc khi cache đã đổi version"""
+        gallery = self._galleries.get(user_id)
+        if gallery is not None and gallery.version == known_person_cache.get_version(user_id):
+            return gallery
+
+        lock = self._build_locks.setdefault(user_id, asyncio.Lock())
+        async with lock:
+            gallery = self._galleries.get(user_id)
+            if gallery is None or gallery.version != known_person_cache.get_version(user_id):
+                entry = await known_person_cache.get(user_id)
+                gallery = self._build_gallery(entry)
+                self._galleries[user_id] = gallery
+        return gallery
+
+    def _build_gallery(self, entry: KnownPersonEntry) -> FaceGalleryIndex:
+        """Build gallery từ snapshot embeddings của owner"""
+        gallery = FaceGalleryIndex(entry.user_id, entry.version)
+        for person in entry.as_list():
+            gallery.upsert_person(person["id"], person["name"], person["embeddings"])
+        print(f"✅ FaceGallery: Built index for user {entry.user_id} - {gallery.persons_count} persons, {gallery.size} embeddings")
+        return gallery
+
+    def _on_person_changed(self, user_id: str, person_id: str, person: Optional[dict], version: int):
+        """Áp dụng thay đổi một person vào index nếu index đang đồng bộ với cache"""
+        gallery = self._galleries.get(user_id)
+        if gallery is None or gallery.version != version - 1:
+            return  # Lệch version - get_gallery() sẽ build lại
+        if person:
+            gallery.upsert_person(person_id, person["name"], person["embeddings"])
+        else:
+            gallery.remove_person(person_id)
+        gallery.version = version
+
+    def invalidate(self, user_id: Optional[str] = None):
+        """Bỏ gallery để build lại ở lần truy cập sau"""
+        if user_id:
+            self._galleries.pop(user_id, None)
+        else:
+            self._galleries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "galleries": len(self._galleries),
+            "persons": sum(g.persons_count for g in self._galleries.values()),
+            "embeddings": sum(g.size for g in self._galleries.values())
+        }
+
+# Global instance
+face_gallery_service = FaceGalleryService()
@@ -1,36 +1,147 @@
 import cv2
 import numpy as np
-import insightface
-from insightface.app import FaceAnalysis
-import faiss
-from typing import List, Tuple, Optional
+from typing import List, Tuple, Optional, Dict, Any
 import asyncio
 import concurrent.futures
 import gc
-import torch
+import sys
+import threading
+import time
 import logging
+from ..config import get_settings
+from .face_gallery import FaceGalleryIndex
+from .inference_workers import InferenceWorkerPool
+from .face_tracker import FaceTracker, FaceTrack
+from .stranger_gallery import stranger_gallery_service
 
 logger = logging.getLogger(__name__)
 
 class FaceProcessorService:
+    """
+    Face detection/recognition engine (InsightFace)
+
+    Model được load lazily ở lần dùng đầu tiên (hoặc warm_up() lúc startup) để
+    import app.services không phải chờ insightface/onnxruntime load model.
+    """
+
     def __init__(self):
-        # Detect available providers and choose the best one
-        available_providers = self._get_available_providers()
-        logger.info(f"Available providers: {available_providers}")
-        
-        # Initialize face analysis with GPU if available
-        self.face_app = FaceAnalysis(providers=available_providers)
+        settings = get_settings()
+        self.det_size = (640, 640)
         
-        # Use GPU context if CUDA is available, otherwise CPU
-        ctx_id = 0 if 'CUDAExecutionProvider' in available_providers else -1
-        self.face_app.prepare(ctx_id=ctx_id, det_size=(640, 640))
+        # Ngưỡng cosine similarity để nhận dạng known person
+        self.recognition_threshold = settings.face_similarity_threshold
         
-        # Adjust thread pool based on GPU availability
-        max_workers = 4 if 'CUDAExecutionProvider' in available_providers else 2
-        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+        # Optional: chạy detection/embedding của stream trong worker processes
+        self.use_process_pool = settings.inference_use_process_pool
+        self.num_workers = settings.max_detection_threads
         
-        logger.info(f"FaceProcessor initialized with providers: {available_providers}")
-        logger.info(f"Using context ID: {ctx_id} ({'GPU' if ctx_id >= 0 else 'CPU'})")
+        self._providers: Optional[List[str]] = None
+        self._face_app = None
+        self._executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+        self._worker_pool: Optional[InferenceWorkerPool] = None
+        self._load_lock = threading.Lock()
+        self._init_lock = threading.Lock()
+        self._load_error: Optional[str] = None
+        self._load_time: Optional[float] = None
+        self._warm_up_task = None
+
+    @property
+    def providers(self) -> List[str]:
+        if self._providers is None:
+            self._providers = self._get_available_providers()
+            logger.info(f"Available providers: {self._providers}")
+        return self._providers
+
+    @property
+    def executor(self) -> concurrent.futures.ThreadPoolExecutor:
+        if self._executor is None:
+            with self._init_lock:
+                if self._executor is None:
+                    # Adjust thread pool based on GPU availability
+                    max_workers = 4 if 'CUDAExecutionProvider' in self.providers else 2
+                    self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+        return self._executor
+
+    @property
+    def face_app(self):
+        """FaceAnalysis instance - load ở lần truy cập đầu tiên"""
+        if self._face_app is None:
+            self._load_models()
+        return self._face_app
+
+    @property
+    def worker_pool(self) -> Optional[InferenceWorkerPool]:
+        if self._worker_pool is None and self.use_process_pool:
+            with self._init_lock:
+                if self._worker_pool is None:
+                    self._worker_pool = InferenceWorkerPool(
+                        num_workers=self.num_workers,
+                        providers=self.providers,
+                        det_size=self.det_size
+                    )
+                    logger.info(f"Process-pool inference enabled with {self.num_workers} workers")
+        return self._worker_pool
+
+    @property
+    def is_ready(self) -> bool:
+        if self._face_app is None:
+            return False
+        if self.use_process_pool:
+            return self._worker_pool is not None and self._worker_pool.is_ready
+        return True
+
+    def _load_models(self):
+        """Load InsightFace models (blocking - gọi trong executor thread)"""
+        with self._load_lock:
+            if self._face_app is not None:
+                return
+            start = time.time()
+            try:
+                from insightface.app import FaceAnalysis
+                
+                providers = self.providers
+                # Initialize face analysis with GPU if available
+                face_app = FaceAnalysis(providers=providers)
+                
+                # Use GPU context if CUDA is available, otherwise CPU
+                ctx_id = 0 if 'CUDAExecutionProvider' in providers else -1
+                face_app.prepare(ctx_id=ctx_id, det_size=self.det_size)
+                
+                self._face_app = face_app
+                self._load_error = None
+                self._load_time = time.time() - start
+                logger.info(f"FaceProcessor initialized with providers: {providers}")
+                logger.info(f"Using context ID: {ctx_id} ({'GPU' if ctx_id >= 0 else 'CPU'}), loaded in {self._load_time:.1f}s")
+            except Exception as e:
+                self._load_error = str(e)
+                logger.error(f"❌ FaceProcessor: Failed to load models: {e}")
+                raise
+
+    async def warm_up(self):
+        """Load models trong background (gọi lúc FastAPI startup)"""
+        loop = asyncio.get_event_loop()
+        try:
+            await loop.run_in_executor(self.executor, self._load_models)
+            if self.worker_pool is not None:
+                await loop.run_in_executor(self.executor, self.worker_pool.wait_ready)
+            print("✅ FaceProcessor: Models warmed up")
+        except Exception as e:
+            print(f"❌ FaceProcessor: Warm-up failed: {e}")
+
+    def start_warm_up(self):
+        if self._warm_up_task is None:
+            self._warm_up_task = asyncio.create_task(self.warm_up())
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "ready": self.is_ready,
+            "models_loaded": self._face_app is not None,
+            "loading": self._warm_up_task is not None and not self._warm_up_task.done(),
+            "load_time_seconds": round(self._load_time, 2) if self._load_time is not None else None,
+            "error": self._load_error,
+            "providers": self._providers,
+            "process_pool": self._worker_pool.get_stats() if self._worker_pool else None
+        }
     
     def _get_available_providers(self) -> List[str]:
         """Get list of available execution providers, prioritizing GPU"""
@@ -59,12 +170,15 @@ class FaceProcessorService:
     def cleanup(self):
         """Giải phóng tài nguyên"""
         try:
-            if hasattr(self, 'face_app'):
-                del self.face_app
-            if hasattr(self, 'executor'):
-                self.executor.shutdown(wait=True)
+            self._face_app = None
+            if self._executor:
+                self._executor.shutdown(wait=True)
+            if self._worker_pool:
+                self._worker_pool.shutdown()
             gc.collect()
-            if torch.cuda.is_available():
+            # Chỉ dọn CUDA cache nếu torch đã được import (không import torch chỉ để cleanup)
+            torch = sys.modules.get('torch')
+            if torch is not None and torch.cuda.is_available():
                 torch.cuda.empty_cache()
         except:
             pass
@@ -137,113 +251,170 @@ class FaceProcessorService:
             print(f"Error detecting faces: {e}")
             return []
 
-    async def detect_and_recognize_faces(self, frame: np.ndarray, known_persons: List[dict] = None) -> List[dict]:
+    async def detect_and_recognize_faces(self, frame: np.ndarray, gallery: Optional[FaceGalleryIndex] = None,
+                                         tracker: Optional[FaceTracker] = None) -> List[dict]:
         """Phát hiện và nhận dạng khuôn mặt trong frame cho streaming - dựa theo code mẫu"""
+        if self.worker_pool is not None:
+            return (await self.detect_and_recognize_batch([frame], [gallery], [tracker]))[0]
         loop = asyncio.get_event_loop()
         return await loop.run_in_executor(
             self.executor,
             self._detect_and_recognize_sync,
             frame,
-            known_persons or []
+            gallery,
+            tracker
         )
 
-    def _detect_and_recognize_sync(self, frame: np.ndarray, known_persons: List[dict]) -> List[dict]:
-        """Phát hiện và nhận dạng khuôn mặt (sync version) - tương tự code mẫu"""
+    def _detect_and_recognize_sync(self, frame: np.ndarray, gallery: Optional[FaceGalleryIndex],
+                                   tracker: Optional[FaceTracker] = None) -> List[dict]:
+        """Phát hiện và nhận dạng khuôn mặt (sync version) - gallery index đã được build sẵn"""
         try:
             # Phát hiện khuôn mặt giống như code mẫu
             faces = self.face_app.get(frame)
-            result = []
-            
-            # Tạo FAISS index từ known_persons nếu có
-            face_db = []
-            names = []
-            
-            for person in known_persons:
-                if 'embeddings' in person and person['embeddings']:
-                    person_name = person['name']
-                    # Đảm bảo name là UTF-8 string đúng
-                    if isinstance(person_name, bytes):
-                        person_name = person_name.decode('utf-8')
-                    elif not isinstance(person_name, str):
-                        person_name = str(person_name)
-                        
-                    for embedding in person['embeddings']:
-                        face_db.append(embedding)
-                        names.append(person_name)
-            
-            # Chuyển sang numpy array để dùng với FAISS như code mẫu
-            if face_db:
-                face_db_array = np.array(face_db).astype('float32')
-                
-                # Tạo FAISS index
-                index = faiss.IndexFlatIP(face_db_array.shape[1])
-                # Chuẩn hóa vector về unit vector để dùng cosine similarity
-                faiss.normalize_L2(face_db_array)
-                index.add(face_db_array)
-            else:
-                index = None
-            
-            # Xử lý từng khuôn mặt được phát hiện
-            for face in faces:
-                # Lấy bounding box giống code mẫu
-                x1, y1, x2, y2 = map(int, face.bbox)
-                bbox = [x1, y1, x2 - x1, y2 - y1]  # [x, y, width, height]
-                
-                # Nhận dạng khuôn mặt giống code mẫu
-                name = self._get_face_name(face.embedding, index, names)
-                
-                detection = {
-                    'bbox': bbox,
-                    'confidence': float(face.det_score),
-                    'person_id': None,
-                    'person_name': name,
-                    'recognition_confidence': 0.0,
-                    'is_new_detection': False
-                }
-                
-                # Nếu là người đã biết, tìm person_id
-                if name != "Unknown":
-                    for person in known_persons:
-                        if person['name'] == name:
-                            detection['person_id'] = person['id']
-                            detection['is_new_detection'] = True
-                            break
-                
-                result.append(detection)
-            
-            return result
+            return self._build_detections(
+                [(face.bbox, face.det_score, face.embedding) for face in faces], gallery, tracker
+            )
             
         except Exception as e:
             print(f"Error detecting and recognizing faces: {e}")
             return []
 
-    def _get_face_name(self, face_embedding, index, names, recognition_threshold=0.6):
-        """Nhận dạng tên khuôn mặt - tương tự code mẫu"""
-        if index is None or len(names) == 0:
-            return "Unknown"
+    def _build_detections(self, faces: List[tuple], gallery: Optional[FaceGalleryIndex],
+                          tracker: Optional[FaceTracker]) -> List[dict]:
+        """Tạo detections từ list (bbox, det_score, embedding) đã có embedding"""
+        tracks = tracker.update(np.array([bbox[:4] for bbox, _, _ in faces])) if tracker and faces else [None] * len(faces)
+        return [
+            self._build_detection(bbox, score, embedding, gallery, tracker, track)
+            for (bbox, score, embedding), track in zip(faces, tracks)
+        ]
+
+    def _build_detection(self, face_bbox, det_score, embedding, gallery: Optional[FaceGalleryIndex],
+                         tracker: Optional[FaceTracker] = None, track: Optional[FaceTrack] = None) -> dict:
+        """Tạo detection dict từ kết quả detector + embedding (embedding=None khi dùng lại identity của track)"""
+        # Lấy bounding box giống code mẫu
+        x1, y1, x2, y2 = map(int, face_bbox[:4])
+        bbox = [x1, y1, x2 - x1, y2 - y1]  # [x, y, width, height]
+        
+        gallery_version = gallery.version if gallery is not None else None
+        if track is not None and (embedding is None or not tracker.needs_recognition(track, gallery_version)):
+            # Track đã nhận dạng gần đây - dùng lại identity
+            tracker.recognitions_skipped += 1
+            name, person_id, similarity = track.person_name, track.person_id, track.similarity
+            stranger_id = track.stranger_id
+        else:
+            # Nhận dạng khuôn mặt - chỉ search trên gallery index
+            name, person_id, similarity = self._get_face_name(embedding, gallery)
+            stranger_id = None
+            if person_id is None and gallery is not None:
+                # Người lạ - gán ID cố định qua stranger gallery của owner
+                stranger_id = stranger_gallery_service.assign(gallery.user_id, embedding)
+            if track is not None:
+                tracker.recognitions_run += 1
+                track.set_identity(person_id, name, similarity, embedding, gallery_version, stranger_id)
+        
+        return {
+            'bbox': bbox,
+            'confidence': float(det_score),
+            'person_id': person_id,
+            'person_name': name,
+            'recognition_confidence': similarity,
+            'track_id': track.track_id if track is not None else None,
+            'stranger_id': stranger_id,
+            'is_new_detection': person_id is not None
+        }
+
+    async def detect_and_recognize_batch(self, frames: List[np.ndarray], galleries: List[Optional[FaceGalleryIndex]],
+                                         trackers: Optional[List[Optional[FaceTracker]]] = None) -> List[List[dict]]:
+        """Phát hiện và nhận dạng khuôn mặt cho nhiều frame (nhiều camera) trong một lần gọi"""
+        if trackers is None:
+            trackers = [None] * len(frames)
+        if self.worker_pool is not None:
+            # Frames chạy song song trên các worker process, so khớp gallery ở process chính
+            faces_per_frame = await self.worker_pool.detect_batch(frames)
+            return [
+                self._build_detections(faces, gallery, tracker)
+                for faces, gallery, tracker in zip(faces_per_frame, galleries, trackers)
+            ]
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(
+            self.executor,
+            self._detect_and_recognize_batch_sync,
+            frames,
+            galleries,
+            trackers
+        )
+
+    def _detect_and_recognize_batch_sync(self, frames: List[np.ndarray], galleries: List[Optional[FaceGalleryIndex]],
+                                         trackers: List[Optional[FaceTracker]]) -> List[List[dict]]:
+        """
+        Batch version: chạy detector cho từng frame, sau đó gom face crops
+        của cả batch vào một lần chạy ArcFace recognizer.
+        Chỉ chạy detection + recognition (bỏ qua landmark/genderage không dùng tới).
+        Face thuộc track đã nhận dạng gần đây không cần crop/embedding.
+        """
+        det_model = getattr(self.face_app, 'det_model', None)
+        rec_model = self.face_app.models.get('recognition') if hasattr(self.face_app, 'models') else None
+        if det_model is None or rec_model is None:
+            return [
+                self._detect_and_recognize_sync(frame, gallery, tracker)
+                for frame, gallery, tracker in zip(frames, galleries, trackers)
+            ]
+        
+        from insightface.utils import face_align
         
+        results: List[List[Optional[dict]]] = [[] for _ in frames]
         try:
-            # Chuẩn hóa embedding giống code mẫu
-            embedding = face_embedding.astype('float32').reshape(1, -1)
-            faiss.normalize_L2(embedding)
+            crops = []
+            owners = []  # (frame_index, face_index, bbox_row, track)
+            for i, frame in enumerate(frames):
+                try:
+                    bboxes, kpss = det_model.detect(frame, max_num=0, metric='default')
+                except Exception as e:
+                    print(f"Error detecting faces in batch frame {i}: {e}")
+                    continue
+                if bboxes is None or bboxes.shape[0] == 0 or kpss is None:
+                    continue
+                
+                tracker, gallery = trackers[i], galleries[i]
+                tracks = tracker.update(bboxes[:, :4]) if tracker else [None] * bboxes.shape[0]
+                gallery_version = gallery.version if gallery is not None else None
+                results[i] = [None] * bboxes.shape[0]
+                for j in range(bboxes.shape[0]):
+                    track = tracks[j]
+                    if track is not None and not tracker.needs_recognition(track, gallery_version):
+                        results[i][j] = self._build_detection(bboxes[j][:4], bboxes[j][4], None, gallery, tracker, track)
+                        continue
+                    crops.append(face_align.norm_crop(frame, landmark=kpss[j], image_size=rec_model.input_size[0]))
+                    owners.append((i, j, bboxes[j], track))
             
-            # Tìm vector gần nhất
-            D, I = index.search(embedding, 1)
-            max_similarity = D[0][0]
-            max_index = I[0][0]
+            if crops:
+                # Một lần forward ArcFace cho các faces cần nhận dạng của cả batch
+                embeddings = rec_model.get_feat(crops)
+                for (i, j, det, track), embedding in zip(owners, embeddings):
+                    results[i][j] = self._build_detection(det[:4], det[4], embedding.flatten(), galleries[i], trackers[i], track)
             
-            if max_similarity > recognition_threshold:
-                recognized_name = names[max_index]
-                # Đảm bảo name là UTF-8 string đúng
-                if isinstance(recognized_name, bytes):
-                    recognized_name = recognized_name.decode('utf-8')
-                elif not isinstance(recognized_name, str):
-                    recognized_name = str(recognized_name)
-                return recognized_name
-            return "Unknown"
+        except Exception as e:
+            print(f"Error in batch detection and recognition: {e}")
+        
+        return [[d for d in frame_results if d is not None] for frame_results in results]
+
+    def _get_face_name(self, face_embedding, gallery: Optional[FaceGalleryIndex], recognition_threshold: float = None) -> Tuple[str, Optional[str], float]:
+        """Nhận dạng tên khuôn mặt - trả về (name, person_id, similarity)"""
+        if gallery is None or gallery.size == 0:
+            return "Unknown", None, 0.0
+        
+        if recognition_threshold is None:
+            recognition_threshold = self.recognition_threshold
+        
+        try:
+            match = gallery.search(face_embedding, recognition_threshold)
+            if match is None:
+                return "Unknown", None, 0.0
+            person_id, person_name, similarity = match
+            return person_name, person_id, similarity
         except Exception as e:
             print(f"Error in face recognition: {e}")
-            return "Unknown"
+            return "Unknown", None, 0.0
 
     def _calculate_similarity(self, embedding1: np.ndarray, embedding2: np.ndarray) -> float:
         """Tính toán độ tương đồng giữa hai embeddings"""
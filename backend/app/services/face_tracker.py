@@ -0,0 +1,173 @@
+import threading
+import time
+from typing import Dict, List, Optional, Any
+import numpy as np
+from ..config import get_settings
+
+
+def _iou_matrix(boxes_a: np.ndarray, boxes_b: np.ndarray) -> np.ndarray:
+    """IoU giữa hai tập bbox [x1, y1, x2, y2]"""
+    if len(boxes_a) == 0 or len(boxes_b) == 0:
+        return np.zeros((len(boxes_a), len(boxes_b)), dtype=np.float32)
+    x1 = np.maximum(boxes_a[:, None, 0], boxes_b[None, :, 0])
+    y1 = np.maximum(boxes_a[:, None, 1], boxes_b[None, :, 1])
+    x2 = np.minimum(boxes_a[:, None, 2], boxes_b[None, :, 2])
+    y2 = np.minimum(boxes_a[:, None, 3], boxes_b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (boxes_a[:, 2] - boxes_a[:, 0]) * (boxes_a[:, 3] - boxes_a[:, 1])
+    area_b = (boxes_b[:, 2] - boxes_b[:, 0]) * (boxes_b[:, 3] - boxes_b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-6), 0.0)
+
+
+class FaceTrack:
+    """Một khuôn mặt được theo dõi qua các AI frame (bbox + vận tốc + identity đã nhận dạng)"""
+
+    def __init__(self, track_id: str, bbox: np.ndarray):
+        self.track_id = track_id
+        self.bbox = bbox.astype(np.float32)
+        self.velocity = np.zeros(4, dtype=np.float32)
+        self.hits = 1
+        self.missed = 0
+        self.created_at = time.time()
+
+        # Identity (None = chưa nhận dạng)
+        self.person_id: Optional[str] = None
+        self.person_name: Optional[str] = None
+        self.stranger_id: Optional[str] = None
+        self.similarity = 0.0
+        self.embedding: Optional[np.ndarray] = None
+        self.gallery_version: Optional[int] = None
+        self.last_verified: Optional[float] = None
+
+    def predict(self) -> np.ndarray:
+        """Vị trí dự đoán ở frame kế tiếp (constant velocity)"""
+        return self.bbox + self.velocity * (self.missed + 1)
+
+    def update(self, bbox: np.ndarray):
+        bbox = bbox.astype(np.float32)
+        steps = self.missed + 1
+        # Làm mượt vận tốc để bbox nhiễu không làm dự đoán nhảy
+        self.velocity = 0.5 * self.velocity + 0.5 * (bbox - self.bbox) / steps
+        self.bbox = bbox
+        self.hits += 1
+        self.missed = 0
+
+    def set_identity(self, person_id: Optional[str], person_name: str, similarity: float,
+                     embedding: Optional[np.ndarray], gallery_version: Optional[int],
+                     stranger_id: Optional[str] = None):
+        self.person_id = person_id
+        self.person_name = person_name
+        self.stranger_id = stranger_id
+        self.similarity = similarity
+        self.embedding = embedding
+        self.gallery_version = gallery_version
+        self.last_verified = time.time()
+
+
+class FaceTracker:
+    """
+    Multi-face tracker cho một camera (IoU matching + dự đoán constant velocity)
+
+    Track mới, track có similarity thấp, track quá hạn re-verify hoặc gallery
+    đã thay đổi mới cần chạy lại recognition; các track còn lại dùng lại identity cũ.
+    """
+
+    def __init__(self, camera_id: str):
+        settings = get_settings()
+        self.camera_id = camera_id
+        self.iou_threshold = settings.tracker_iou_threshold
+        self.max_missed = settings.tracker_max_missed_frames
+        self.reverify_interval = settings.tracker_reverify_interval_seconds
+        self.confident_similarity = settings.tracker_confident_similarity
+        self.tracks: List[FaceTrack] = []
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.recognitions_run = 0
+        self.recognitions_skipped = 0
+
+    def update(self, bboxes: np.ndarray) -> List[FaceTrack]:
+        """
+        Gán các bbox [x1, y1, x2, y2] của frame hiện tại vào track
+
+        Returns:
+            List track tương ứng với từng bbox (cùng thứ tự)
+        """
+        with self._lock:
+            bboxes = np.asarray(bboxes, dtype=np.float32).reshape(-1, 4)
+            assigned: List[Optional[FaceTrack]] = [None] * len(bboxes)
+
+            if self.tracks and len(bboxes):
+                predicted = np.array([t.predict() for t in self.tracks], dtype=np.float32)
+                iou = _iou_matrix(predicted, bboxes)
+                # Greedy matching theo IoU giảm dần
+                pairs = np.dstack(np.unravel_index(np.argsort(-iou, axis=None), iou.shape))[0]
+                used_tracks, used_dets = set(), set()
+                for t_idx, d_idx in pairs:
+                    if iou[t_idx, d_idx] < self.iou_threshold:
+                        break
+                    if t_idx in used_tracks or d_idx in used_dets:
+                        continue
+                    track = self.tracks[t_idx]
+                    track.update(bboxes[d_idx])
+                    assigned[d_idx] = track
+                    used_tracks.add(t_idx)
+                    used_dets.add(d_idx)
+
+            matched = set(id(t) for t in assigned if t is not None)
+            for track in self.tracks:
+                if id(track) not in matched:
+                    track.missed += 1
+            self.tracks = [t for t in self.tracks if t.missed <= self.max_missed]
+
+            for d_idx, track in enumerate(assigned):
+                if track is None:
+                    self._next_id += 1
+                    track = FaceTrack(f"track_{self._next_id}", bboxes[d_idx])
+                    self.tracks.append(track)
+                    assigned[d_idx] = track
+
+            return assigned
+
+    def needs_recognition(self, track: FaceTrack, gallery_version: Optional[int]) -> bool:
+        if track.last_verified is None:
+            return True
+        if track.gallery_version != gallery_version:
+            return True  # Gallery vừa thay đổi (thêm/sửa person)
+        if track.person_id is not None and track.similarity < self.confident_similarity:
+            return True
+        return time.time() - track.last_verified >= self.reverify_interval
+
+    def reset(self):
+        with self._lock:
+            self.tracks = []
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "tracks": len(self.tracks),
+            "recognitions_run": self.recognitions_run,
+            "recognitions_skipped": self.recognitions_skipped
+        }
+
+
+class FaceTrackerService:
+    """Quản lý FaceTracker theo camera"""
+
+    def __init__(self):
+        self._trackers: Dict[str, FaceTracker] = {}
+
+    def get_tracker(self, camera_id: str) -> FaceTracker:
+        tracker = self._trackers.get(camera_id)
+        if tracker is None:
+            tracker = FaceTracker(camera_id)
+            self._trackers[camera_id] = tracker
+        return tracker
+
+    def remove_tracker(self, camera_id: str):
+        self._trackers.pop(camera_id, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {camera_id: tracker.get_stats() for camera_id, tracker in self._trackers.items()}
+
+# Global instance
+face_tracker_service = FaceTrackerService()
@@ -0,0 +1,188 @@
+import asyncio
+import time
+from typing import Dict, List, Optional, AsyncGenerator, Any
+from ..config import get_settings
+
+
+# Tier chất lượng stream, sắp xếp từ cao xuống thấp: (chiều rộng tối đa, JPEG quality)
+# max_width None = giữ nguyên độ phân giải camera; quality None = settings.stream_jpeg_quality
+STREAM_TIERS: Dict[str, Dict[str, Optional[int]]] = {
+    "high": {"max_width": None, "quality": 85},
+    "medium": {"max_width": 1280, "quality": None},
+    "low": {"max_width": 640, "quality": 50},
+    "mobile": {"max_width": 320, "quality": 40},
+}
+TIER_ORDER: List[str] = list(STREAM_TIERS.keys())
+DEFAULT_TIER = "medium"
+
+
+def tier_quality(tier: str) -> int:
+    quality = STREAM_TIERS[tier]["quality"]
+    return quality if quality is not None else get_settings().stream_jpeg_quality
+
+
+def _parse_width(resolution: Optional[str]) -> Optional[int]:
+    """'1280x720' / '640' -> chiều rộng"""
+    if not resolution:
+        return None
+    try:
+        return int(str(resolution).lower().split("x")[0])
+    except ValueError:
+        return None
+
+
+def resolve_tier(quality: Optional[str] = None, resolution: Optional[str] = None) -> str:
+    """
+    Chọn tier cho viewer từ quality (high/medium/low/mobile) và resolution yêu cầu
+
+    Resolution chỉ hạ tier xuống (tới tier nhỏ nhất vẫn rộng hơn width yêu cầu),
+    nên số rendition mỗi camera luôn bị giới hạn bởi STREAM_TIERS.
+    """
+    tier = quality.lower() if quality and quality.lower() in STREAM_TIERS else DEFAULT_TIER
+    width = _parse_width(resolution)
+    if not width:
+        return tier
+    index = TIER_ORDER.index(tier)
+    while index < len(TIER_ORDER) - 1:
+        max_width = STREAM_TIERS[TIER_ORDER[index]]["max_width"]
+        if max_width is not None and max_width <= width:
+            break
+        if STREAM_TIERS[TIER_ORDER[index + 1]]["max_width"] < width:
+            break  # Tier kế tiếp đã nhỏ hơn width yêu cầu
+        index += 1
+    return TIER_ORDER[index]
+
+
+class FrameBroadcaster:
+    """
+    Broadcast buffer cho một camera: producer publish JPEG đã annotate theo
+    từng tier, mọi viewer cùng tier đọc chung một frame mới nhất.
+
+    Buffer chỉ giữ frame mới nhất - viewer chậm sẽ bỏ qua các frame trung gian
+    thay vì bắt server buffer frame cho nó. Viewer gửi một frame lâu hơn
+    nhiều khoảng cách publish sẽ bị hạ tier tự động, và thử nâng lại
+    sau một chuỗi frame gửi nhanh.
+    """
+
+    SEND_TIME_ALPHA = 0.3
+    MIN_SEND_SAMPLES = 3  # Số frame đo được trước khi cho phép đổi tier
+
+    def __init__(self, camera_id: str):
+        settings = get_settings()
+        self.camera_id = camera_id
+        self.slow_send_ratio = settings.stream_slow_send_ratio
+        self.upgrade_frames = settings.stream_tier_upgrade_frames
+        self._frames: Dict[str, bytes] = {}
+        self._seq = 0
+        self._condition = asyncio.Condition()
+        self._closed = False
+        self._tier_subscribers: Dict[str, int] = {tier: 0 for tier in TIER_ORDER}
+        self.subscribers = 0
+        self.last_publish_time: Optional[float] = None
+        self.avg_publish_interval: Optional[float] = None
+        self.downgrades = 0
+        self.upgrades = 0
+
+    @property
+    def latest_frame(self) -> Optional[bytes]:
+        """Frame mới nhất ở tier cao nhất đang có"""
+        for tier in TIER_ORDER:
+            if tier in self._frames:
+                return self._frames[tier]
+        return None
+
+    @property
+    def is_closed(self) -> bool:
+        return self._closed
+
+    def active_tiers(self) -> List[str]:
+        """Các tier đang có viewer - producer chỉ render/encode các tier này"""
+        return [tier for tier in TIER_ORDER if self._tier_subscribers[tier] > 0]
+
+    async def publish(self, frames: Dict[str, bytes]):
+        """Publish frame mới (tier -> JPEG bytes) và đánh thức tất cả viewers"""
+        now = time.time()
+        async with self._condition:
+            interval = now - self.last_publish_time if self.last_publish_time is not None else None
+            # Bỏ qua khoảng trống dài (không có viewer / camera mất tín hiệu)
+            if interval is not None and interval < 1.0:
+                self.avg_publish_interval = interval if self.avg_publish_interval is None \
+                    else 0.9 * self.avg_publish_interval + 0.1 * interval
+            self._frames = frames
+            self._seq += 1
+            self.last_publish_time = now
+            self._condition.notify_all()
+
+    async def close(self):
+        """Đóng buffer - các viewer đang chờ sẽ kết thúc"""
+        async with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def _move(self, from_tier: str, to_tier: str):
+        self._tier_subscribers[from_tier] -= 1
+        self._tier_subscribers[to_tier] += 1
+
+    async def subscribe(self, tier: str = DEFAULT_TIER) -> AsyncGenerator[bytes, None]:
+        """
+        Yield JPEG bytes của tier mỗi khi có frame mới cho tới khi buffer bị đóng
+
+        Thời gian từ lúc yield tới lúc viewer quay lại lấy frame tiếp chính là
+        thời gian gửi frame (StreamingResponse chờ socket drain).
+        """
+        requested = tier if tier in STREAM_TIERS else DEFAULT_TIER
+        current = requested
+        self.subscribers += 1
+        self._tier_subscribers[current] += 1
+        last_seq = 0
+        send_time: Optional[float] = None
+        samples = 0
+        fast_sends = 0
+        try:
+            while True:
+                async with self._condition:
+                    await self._condition.wait_for(
+                        lambda: self._closed or (self._seq != last_seq and current in self._frames)
+                    )
+                    if self._closed:
+                        return
+                    frame, last_seq = self._frames[current], self._seq
+                sent_at = time.time()
+                yield frame
+                elapsed = time.time() - sent_at
+                send_time = elapsed if send_time is None else \
+                    (1 - self.SEND_TIME_ALPHA) * send_time + self.SEND_TIME_ALPHA * elapsed
+                samples += 1
+
+                budget = self.avg_publish_interval
+                if not budget or samples < self.MIN_SEND_SAMPLES:
+                    continue
+                index = TIER_ORDER.index(current)
+                if send_time > budget * self.slow_send_ratio and index < len(TIER_ORDER) - 1:
+                    # Viewer không theo kịp - hạ tier thay vì buffer frame cho nó
+                    lower = TIER_ORDER[index + 1]
+                    self._move(current, lower)
+                    current, send_time, samples, fast_sends = lower, None, 0, 0
+                    self.downgrades += 1
+                    print(f"📉 Viewer of camera {self.camera_id} downgraded to tier '{current}'")
+                elif current != requested and send_time < budget * 0.5:
+                    fast_sends += 1
+                    if fast_sends >= self.upgrade_frames:
+                        higher = TIER_ORDER[index - 1]
+                        self._move(current, higher)
+                        current, send_time, samples, fast_sends = higher, None, 0, 0
+                        self.upgrades += 1
+                        print(f"📈 Viewer of camera {self.camera_id} upgraded to tier '{current}'")
+                else:
+                    fast_sends = 0
+        finally:
+            self.subscribers -= 1
+            self._tier_subscribers[current] -= 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "viewers_by_tier": {tier: count for tier, count in self._tier_subscribers.items() if count},
+            "avg_publish_interval_ms": round(self.avg_publish_interval * 1000, 1) if self.avg_publish_interval else None,
+            "tier_downgrades": self.downgrades,
+            "tier_upgrades": self.upgrades
+        }
@@ -0,0 +1,85 @@
+import asyncio
+import concurrent.futures
+from typing import Dict, Optional, Tuple, Any
+import cv2
+import numpy as np
+from ..config import get_settings
+
+
+class FrameEncoder:
+    """JPEG encoder chạy trên thread pool riêng để cv2.imencode không chặn event loop"""
+
+    def __init__(self):
+        settings = get_settings()
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=settings.jpeg_encode_workers, thread_name_prefix="jpeg-encode"
+        )
+        self.frames_encoded = 0
+
+    def encode_sync(self, frame: np.ndarray, quality: int = 90) -> Optional[bytes]:
+        """Encode frame thành JPEG bytes (blocking)"""
+        ok, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, int(quality)])
+        self.frames_encoded += 1
+        return buffer.tobytes() if ok else None
+
+    async def encode(self, frame: np.ndarray, quality: int = 90) -> Optional[bytes]:
+        """Encode frame trên encode pool"""
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self._executor, self.encode_sync, frame, quality)
+
+    def encode_scaled_sync(self, frame: np.ndarray, max_width: Optional[int], quality: int) -> Optional[bytes]:
+        """Thu nhỏ frame về max_width (giữ tỉ lệ) rồi encode JPEG (blocking)"""
+        height, width = frame.shape[:2]
+        if max_width and width > max_width:
+            size = (max_width, max(int(height * max_width / width), 1))
+            frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        return self.encode_sync(frame, quality)
+
+    async def encode_renditions(self, frame: np.ndarray,
+                                renditions: Dict[str, Tuple[Optional[int], int]]) -> Dict[str, bytes]:
+        """
+        Encode song song nhiều rendition của cùng một frame trên encode pool
+
+        Args:
+            renditions: tên -> (max_width, quality)
+        Returns:
+            tên -> JPEG bytes (bỏ qua rendition encode lỗi)
+        """
+        loop = asyncio.get_event_loop()
+        names = list(renditions.keys())
+        results = await asyncio.gather(*[
+            loop.run_in_executor(self._executor, self.encode_scaled_sync, frame, *renditions[name])
+            for name in names
+        ])
+        return {name: data for name, data in zip(names, results) if data}
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"frames_encoded": self.frames_encoded}
+
+
+class EncodedFrame:
+    """
+    Snapshot của một frame + JPEG bytes đã encode theo từng quality
+
+    Mỗi quality chỉ encode một lần; stream, lưu detection và email alert
+    dùng chung bytes. Frame phải là bản copy không bị vẽ thêm sau khi tạo.
+    """
+
+    def __init__(self, frame: np.ndarray):
+        self.frame = frame
+        self._encoded: Dict[int, asyncio.Future] = {}
+
+    @property
+    def shape(self):
+        return self.frame.shape
+
+    async def jpeg(self, quality: int = 90) -> Optional[bytes]:
+        future = self._encoded.get(quality)
+        if future is None:
+            # Các caller đồng thời cùng quality chờ chung một lần encode
+            future = asyncio.ensure_future(frame_encoder.encode(self.frame, quality))
+            self._encoded[quality] = future
+        return await asyncio.shield(future)
+
+# Global instance
+frame_encoder = FrameEncoder()
@@ -0,0 +1,156 @@
+import asyncio
+import concurrent.futures
+import os
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, Optional, Set, Tuple
+import cv2
+import numpy as np
+from ..config import get_settings
+from .frame_encoder import frame_encoder
+
+
+class ImageStorage:
+    """
+    Lưu ảnh detection trên I/O executor riêng (không chặn event loop)
+
+    - Shard theo ngày/camera: uploads/detections/YYYY/MM/DD/<camera_id>/<uuid>.jpg
+      nên không thư mục nào chứa hàng triệu file
+    - Sinh thumbnail <uuid>_thumb.jpg cạnh ảnh gốc cho list view
+    - Xóa file (detection bị xóa / dọn dẹp) cũng chạy trên executor
+    """
+
+    def __init__(self):
+        settings = get_settings()
+        self.root = os.path.join("uploads", "detections")
+        self.thumbnail_width = settings.detection_thumbnail_width
+        self.thumbnail_quality = settings.detection_thumbnail_quality
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=settings.image_storage_workers, thread_name_prefix="image-io"
+        )
+        self._known_dirs: Set[str] = set()  # Thư mục đã tạo - không gọi makedirs lặp lại
+
+        self.stats = {
+            "images_written": 0,
+            "thumbnails_written": 0,
+            "bytes_written": 0,
+            "files_deleted": 0,
+            "write_errors": 0,
+            "last_write_ms": 0.0
+        }
+
+    def new_path(self, camera_id: Optional[str] = None, timestamp: Optional[datetime] = None) -> str:
+        """Đường dẫn (chưa ghi) cho ảnh detection mới"""
+        timestamp = timestamp or datetime.utcnow()
+        directory = os.path.join(self.root, timestamp.strftime("%Y"), timestamp.strftime("%m"),
+                                 timestamp.strftime("%d"), camera_id or "manual")
+        return os.path.join(directory, f"{uuid.uuid4().hex}.jpg")
+
+    @staticmethod
+    def companion_path(image_path: str, suffix: str) -> str:
+        """File đi kèm ảnh detection (thumb, context) - cùng thư mục, cùng tên gốc"""
+        root, ext = os.path.splitext(image_path)
+        return f"{root}_{suffix}{ext or '.jpg'}"
+
+    def thumbnail_path_for(self, image_path: str) -> str:
+        return self.companion_path(image_path, "thumb")
+
+    @staticmethod
+    def url_for(path: Optional[str]) -> str:
+        """URL tĩnh (/uploads/...) của file trong uploads - cả ảnh cũ nằm thẳng trong uploads/detections"""
+        if not path:
+            return ""
+        normalized = path.replace(os.sep, "/")
+        index = normalized.find("uploads/")
+        if index >= 0:
+            return "/" + normalized[index:]
+        return f"/uploads/detections/{os.path.basename(normalized)}"
+
+    def _ensure_dir(self, directory: str):
+        if directory not in self._known_dirs:
+            os.makedirs(directory, exist_ok=True)
+            self._known_dirs.add(directory)
+
+    def _write_sync(self, path: str, data: bytes):
+        self._ensure_dir(os.path.dirname(path))
+        with open(path, 'wb') as f:
+            f.write(data)
+        self.stats["bytes_written"] += len(data)
+
+    def _make_thumbnail_sync(self, image_bytes: bytes, frame: Optional[np.ndarray]) -> Optional[bytes]:
+        if frame is None:
+            # Decode ở 1/2 độ phân giải - đủ cho thumbnail, nhanh hơn decode full
+            frame = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_REDUCED_COLOR_2)
+            if frame is None:
+                return None
+        return frame_encoder.encode_scaled_sync(frame, self.thumbnail_width, self.thumbnail_quality)
+
+    def _save_sync(self, image_path: str, image_bytes: bytes, frame: Optional[np.ndarray],
+                   thumbnail: bool) -> Tuple[str, Optional[str]]:
+        start = time.monotonic()
+        self._write_sync(image_path, image_bytes)
+        self.stats["images_written"] += 1
+
+        thumbnail_path = None
+        try:
+            if not thumbnail:
+                return image_path, None
+            thumbnail_bytes = self._make_thumbnail_sync(image_bytes, frame)
+            if thumbnail_bytes:
+                thumbnail_path = self.thumbnail_path_for(image_path)
+                self._write_sync(thumbnail_path, thumbnail_bytes)
+                self.stats["thumbnails_written"] += 1
+        except Exception as e:
+            # Thiếu thumbnail không chặn việc lưu detection - list view dùng ảnh gốc
+            print(f"⚠️ ImageStorage: Cannot create thumbnail for {image_path}: {e}")
+            thumbnail_path = None
+        finally:
+            self.stats["last_write_ms"] = round((time.monotonic() - start) * 1000, 1)
+        return image_path, thumbnail_path
+
+    async def save(self, image_bytes: bytes, camera_id: Optional[str] = None,
+                   frame: Optional[np.ndarray] = None, thumbnail: bool = True,
+                   image_path: Optional[str] = None) -> Tuple[str, Optional[str]]:
+        """
+        Ghi ảnh detection + thumbnail trên I/O executor
+
+        Args:
+            frame: Frame gốc của image_bytes nếu có - thumbnail thu nhỏ thẳng từ frame thay vì decode JPEG
+            thumbnail: False để chỉ ghi ảnh (vd. ảnh context đi kèm)
+            image_path: Ghi vào path có sẵn (companion_path) thay vì sinh path mới
+        Returns:
+            (image_path, thumbnail_path) - thumbnail_path None nếu không tạo được
+        """
+        image_path = image_path or self.new_path(camera_id)
+        loop = asyncio.get_event_loop()
+        try:
+            return await loop.run_in_executor(self._executor, self._save_sync, image_path, image_bytes,
+                                              frame, thumbnail)
+        except Exception:
+            self.stats["write_errors"] += 1
+            raise
+
+    def _delete_sync(self, paths: Tuple[Optional[str], ...]) -> int:
+        deleted = 0
+        for path in paths:
+            if not path:
+                continue
+            try:
+                os.remove(path)
+                deleted += 1
+            except OSError:
+                pass
+        self.stats["files_deleted"] += deleted
+        return deleted
+
+    async def delete(self, *paths: Optional[str]) -> int:
+        """Xóa các file (bỏ qua path rỗng / không tồn tại) trên I/O executor"""
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self._executor, self._delete_sync, paths)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return dict(self.stats)
+
+# Global instance
+image_storage = ImageStorage()
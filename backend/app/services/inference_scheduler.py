@@ -0,0 +1,175 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Any
+import numpy as np
+from ..config import get_settings
+from .face_gallery import FaceGalleryIndex
+from .face_processor import face_processor
+from .face_tracker import face_tracker_service
+
+
+class _PendingFrame:
+    __slots__ = ("camera_id", "frame", "gallery", "future", "enqueued_at")
+
+    def __init__(self, camera_id: str, frame: np.ndarray, gallery: Optional[FaceGalleryIndex], future: asyncio.Future):
+        self.camera_id = camera_id
+        self.frame = frame
+        self.gallery = gallery
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+
+class InferenceScheduler:
+    """
+    Scheduler trung tâm cho face detection/recognition của tất cả camera
+
+    - Gom frame đang chờ của các camera trong một cửa sổ thời gian ngắn rồi chạy một batch
+    - Mỗi camera chỉ có tối đa một frame chờ; frame mới thay frame cũ (frame cũ nhận None)
+    - Batch lấy theo thứ tự chờ lâu nhất trước để các camera được phục vụ công bằng
+    - Vượt queue depth hoặc frame quá cũ thì bỏ frame thay vì để latency tăng dần
+    """
+
+    def __init__(self):
+        settings = get_settings()
+        self.batch_window = settings.inference_batch_window_ms / 1000.0
+        self.max_batch_size = settings.inference_max_batch_size
+        self.max_queue_depth = settings.inference_max_queue_depth
+        self.max_frame_age = settings.inference_max_frame_age_ms / 1000.0
+
+        self._pending: "OrderedDict[str, _PendingFrame]" = OrderedDict()  # camera_id -> frame chờ
+        self._inflight: List[_PendingFrame] = []  # Batch đang chạy (đã rời _pending)
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+        self.stats = {
+            "batches": 0,
+            "frames_processed": 0,
+            "frames_replaced": 0,
+            "frames_rejected": 0,
+            "frames_stale": 0,
+            "last_batch_size": 0,
+            "last_batch_latency_ms": 0.0
+        }
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._pending)
+
+    def _ensure_started(self):
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    def _fail_all(self):
+        """Báo lỗi cho mọi frame đang chạy / đang chờ để caller của submit() không treo"""
+        for pending in [*self._inflight, *self._pending.values()]:
+            if not pending.future.done():
+                pending.future.set_exception(RuntimeError("Inference scheduler stopped"))
+        self._inflight = []
+        self._pending.clear()
+
+    async def stop(self):
+        """Dừng scheduler, submit() của các frame đang chạy / đang chờ raise RuntimeError"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._fail_all()
+
+    async def submit(self, camera_id: str, frame: np.ndarray, gallery: Optional[FaceGalleryIndex]) -> Optional[List[dict]]:
+        """
+        Gửi frame của camera vào batch kế tiếp
+
+        Returns:
+            List detections, hoặc None nếu frame bị bỏ (queue đầy / stale / bị frame mới thay thế)
+        Raises:
+            RuntimeError nếu scheduler bị dừng trước khi frame có kết quả
+        """
+        self._ensure_started()
+        loop = asyncio.get_running_loop()
+
+        previous = self._pending.get(camera_id)
+        if previous is not None:
+            # Frame cũ của cùng camera chưa được xử lý - chỉ giữ frame mới nhất (giữ nguyên lượt trong hàng đợi)
+            self.stats["frames_replaced"] += 1
+            if not previous.future.done():
+                previous.future.set_result(None)
+        elif len(self._pending) >= self.max_queue_depth:
+            self.stats["frames_rejected"] += 1
+            return None
+
+        future = loop.create_future()
+        self._pending[camera_id] = _PendingFrame(camera_id, frame, gallery, future)
+        self._wakeup.set()
+        return await future
+
+    def _take_batch(self) -> List[_PendingFrame]:
+        """Lấy tối đa max_batch_size frame, chờ lâu nhất trước; bỏ frame đã quá cũ"""
+        now = time.monotonic()
+        batch = []
+        while self._pending and len(batch) < self.max_batch_size:
+            _, pending = self._pending.popitem(last=False)
+            if pending.future.done():
+                continue
+            if now - pending.enqueued_at > self.max_frame_age:
+                self.stats["frames_stale"] += 1
+                pending.future.set_result(None)
+                continue
+            batch.append(pending)
+        return batch
+
+    async def _run(self):
+        while True:
+            try:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                if not self._pending:
+                    continue
+
+                # Cửa sổ gom batch - chờ thêm frame từ các camera khác
+                if len(self._pending) < self.max_batch_size:
+                    await asyncio.sleep(self.batch_window)
+
+                batch = self._take_batch()
+                if self._pending:
+                    self._wakeup.set()  # Còn frame chờ - chạy batch tiếp ngay
+                if not batch:
+                    continue
+
+                self._inflight = batch
+                start = time.monotonic()
+                try:
+                    results = await face_processor.detect_and_recognize_batch(
+                        [p.frame for p in batch],
+                        [p.gallery for p in batch],
+                        [face_tracker_service.get_tracker(p.camera_id) for p in batch]
+                    )
+                except Exception as e:
+                    print(f"❌ InferenceScheduler: Batch error: {e}")
+                    results = [[] for _ in batch]
+
+                for pending, detections in zip(batch, results):
+                    if not pending.future.done():
+                        pending.future.set_result(detections)
+                self._inflight = []
+
+                self.stats["batches"] += 1
+                self.stats["frames_processed"] += len(batch)
+                self.stats["last_batch_size"] = len(batch)
+                self.stats["last_batch_latency_ms"] = round((time.monotonic() - start) * 1000, 1)
+
+            except asyncio.CancelledError:
+                self._fail_all()
+                break
+            except Exception as e:
+                print(f"❌ InferenceScheduler: Error in scheduler loop: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "queue_depth": self.queue_depth}
+
+# Global instance
+inference_scheduler = InferenceScheduler()
@@ -0,0 +1,198 @@
+import asyncio
+import concurrent.futures
+import multiprocessing
+import threading
+from multiprocessing import shared_memory
+from typing import List, Optional, Tuple, Any, Dict
+import numpy as np
+from ..utils.inference_worker import worker_main
+
+
+class _InferenceWorker:
+    """Một worker process + pipe điều khiển + slot shared memory chứa frame input"""
+
+    def __init__(self, index: int, ctx, providers: List[str], det_size: Tuple[int, int]):
+        self.index = index
+        self._ctx = ctx
+        self._providers = providers
+        self._det_size = det_size
+        self.process = None
+        self.conn = None
+        self.shm: Optional[shared_memory.SharedMemory] = None
+        self.ready = False
+        self.frames_processed = 0
+        self._ready_lock = threading.Lock()
+
+    def start(self):
+        parent_conn, child_conn = self._ctx.Pipe()
+        self.process = self._ctx.Process(
+            target=worker_main,
+            args=(child_conn, self._providers, self._det_size),
+            name=f"inference-worker-{self.index}",
+            daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        self.conn = parent_conn
+        self.ready = False
+
+    def _ensure_slot(self, nbytes: int):
+        """Tạo (hoặc mở rộng) slot shared memory đủ chứa frame"""
+        if self.shm is not None and self.shm.size >= nbytes:
+            return
+        self._release_slot()
+        self.shm = shared_memory.SharedMemory(create=True, size=nbytes)
+
+    def _release_slot(self):
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+    def wait_ready(self):
+        """Chờ worker load xong model (blocking)"""
+        with self._ready_lock:
+            if not self.ready:
+                status, _ = self.conn.recv()
+                self.ready = status == "ready"
+
+    def infer(self, frame: np.ndarray) -> List[Tuple[np.ndarray, float, np.ndarray]]:
+        """Copy frame vào shared memory, gửi metadata qua pipe và chờ kết quả (blocking)"""
+        self.wait_ready()
+
+        frame = np.ascontiguousarray(frame)
+        self._ensure_slot(frame.nbytes)
+        slot = np.ndarray(frame.shape, dtype=frame.dtype, buffer=self.shm.buf)
+        slot[...] = frame
+        del slot
+
+        self.conn.send((self.shm.name, frame.shape, frame.dtype.str))
+        status, payload = self.conn.recv()
+        if status != "ok":
+            raise RuntimeError(f"Inference worker {self.index} error: {payload}")
+        self.frames_processed += 1
+        return payload
+
+    def is_alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+    def stop(self):
+        try:
+            if self.is_alive():
+                self.conn.send(None)
+                self.process.join(timeout=5)
+                if self.process.is_alive():
+                    self.process.terminate()
+        except Exception:
+            pass
+        finally:
+            if self.conn:
+                self.conn.close()
+            self._release_slot()
+            self.process = None
+            self.conn = None
+
+
+class InferenceWorkerPool:
+    """
+    Pool N process chạy InsightFace ngoài process uvicorn (tránh GIL)
+
+    - Mỗi worker load FaceAnalysis riêng một lần khi start
+    - Frame được copy vào shared memory của worker, pipe chỉ mang (shm_name, shape, dtype)
+    - Worker trả về bbox/score/embedding; so khớp gallery vẫn chạy ở process chính
+    - Worker bị chết sẽ được khởi động lại ở request kế tiếp
+    """
+
+    def __init__(self, num_workers: int, providers: List[str], det_size: Tuple[int, int] = (640, 640)):
+        self.num_workers = max(1, num_workers)
+        self.providers = providers
+        self.det_size = det_size
+        self._ctx = multiprocessing.get_context("spawn")
+        self._workers: List[_InferenceWorker] = []
+        self._idle: Optional[asyncio.Queue] = None
+        self._start_lock = threading.Lock()
+        # Thread chờ pipe - recv nhả GIL nên không chặn event loop
+        self._io_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.num_workers, thread_name_prefix="inference-io"
+        )
+
+    @property
+    def is_started(self) -> bool:
+        return bool(self._workers)
+
+    @property
+    def is_ready(self) -> bool:
+        return bool(self._workers) and all(w.ready for w in self._workers)
+
+    def wait_ready(self):
+        """Start pool và chờ tất cả worker load xong model (blocking - dùng cho warm-up)"""
+        self.start()
+        for worker in self._workers:
+            try:
+                worker.wait_ready()
+            except (EOFError, OSError) as e:
+                print(f"❌ InferenceWorkerPool: Worker {worker.index} failed to start: {e}")
+
+    def start(self):
+        """Khởi động các worker process (gọi lazily ở request đầu tiên)"""
+        with self._start_lock:
+            if self._workers:
+                return
+            for i in range(self.num_workers):
+                worker = _InferenceWorker(i, self._ctx, self.providers, self.det_size)
+                worker.start()
+                self._workers.append(worker)
+            print(f"🚀 InferenceWorkerPool: Started {self.num_workers} worker processes")
+
+    def _ensure_idle_queue(self):
+        if self._idle is None:
+            self._idle = asyncio.Queue()
+            for worker in self._workers:
+                self._idle.put_nowait(worker)
+
+    async def detect(self, frame: np.ndarray) -> List[Tuple[np.ndarray, float, np.ndarray]]:
+        """Chạy detection + embedding cho một frame trên worker rảnh"""
+        self.start()
+        self._ensure_idle_queue()
+        worker = await self._idle.get()
+        try:
+            if not worker.is_alive():
+                print(f"⚠️ InferenceWorkerPool: Worker {worker.index} died, restarting")
+                worker.stop()
+                worker.start()
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(self._io_executor, worker.infer, frame)
+        except (EOFError, BrokenPipeError, ConnectionResetError) as e:
+            print(f"❌ InferenceWorkerPool: Worker {worker.index} connection lost: {e}")
+            worker.stop()
+            return []
+        finally:
+            self._idle.put_nowait(worker)
+
+    async def detect_batch(self, frames: List[np.ndarray]) -> List[List[Tuple[np.ndarray, float, np.ndarray]]]:
+        """Chia các frame của batch cho các worker chạy song song"""
+        results = await asyncio.gather(*(self.detect(frame) for frame in frames), return_exceptions=True)
+        faces = []
+        for result in results:
+            if isinstance(result, Exception):
+                print(f"❌ InferenceWorkerPool: {result}")
+                faces.append([])
+            else:
+                faces.append(result)
+        return faces
+
+    def shutdown(self):
+        for worker in self._workers:
+            worker.stop()
+        self._workers = []
+        self._idle = None
+        self._io_executor.shutdown(wait=False)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.num_workers,
+            "alive": sum(1 for w in self._workers if w.is_alive()),
+            "ready": sum(1 for w in self._workers if w.ready),
+            "frames_processed": sum(w.frames_processed for w in self._workers),
+            "idle": self._idle.qsize() if self._idle else 0
+        }
@@ -0,0 +1,230 @@
+import asyncio
+import base64
+import time
+from typing import Dict, List, Optional, Any, Callable
+import numpy as np
+from bson import ObjectId
+from pymongo.errors import OperationFailure, PyMongoError
+from ..database import get_database
+
+
+def decode_face_embeddings(raw_embeddings: List[Any]) -> List[np.ndarray]:
+    """Giải mã face_embeddings lưu trong MongoDB (list float hoặc base64) thành float32 vectors"""
+    embeddings = []
+    for emb_data in raw_embeddings or []:
+        try:
+            if isinstance(emb_data, str) and emb_data:
+                embeddings.append(np.frombuffer(base64.b64decode(emb_data), dtype=np.float32))
+            elif isinstance(emb_data, list) and emb_data:
+                embeddings.append(np.array(emb_data, dtype=np.float32))
+        except Exception as e:
+            print(f"⚠️ KnownPersonCache: Error decoding embedding: {e}")
+    return embeddings
+
+
+def _to_person_entry(person_data: dict) -> Optional[dict]:
+    """Chuyển document known_persons thành entry {'id', 'name', 'embeddings'} với matrix float32"""
+    embeddings = decode_face_embeddings(person_data.get("face_embeddings", []))
+    if not embeddings:
+        return None
+    dim = embeddings[0].shape[-1]
+    embeddings = [emb for emb in embeddings if emb.shape[-1] == dim]
+
+    person_name = person_data.get("name", "Unknown")
+    if isinstance(person_name, bytes):
+        person_name = person_name.decode('utf-8')
+    elif not isinstance(person_name, str):
+        person_name = str(person_name)
+
+    return {
+        "id": str(person_data["_id"]),
+        "name": person_name,
+        "embeddings": np.ascontiguousarray(np.vstack(embeddings), dtype=np.float32)
+    }
+
+
+class KnownPersonEntry:
+    """Snapshot embeddings đã decode của tất cả known persons active của một owner"""
+
+    def __init__(self, user_id: str, version: int, persons: Dict[str, dict]):
+        self.user_id = user_id
+        self.version = version
+        self.persons = persons  # person_id -> {'id', 'name', 'embeddings'}
+        self.loaded_at = time.time()
+
+    def as_list(self) -> List[dict]:
+        return list(self.persons.values())
+
+
+class KnownPersonCache:
+    """
+    Cache embeddings của known persons theo owner (user_id)
+
+    - Dữ liệu chỉ được load từ MongoDB một lần cho mỗi owner
+    - PersonService gọi refresh_person/remove_person sau mỗi lần ghi
+    - Change stream trên known_persons (nếu MongoDB là replica set) bắt các thay đổi ngoài PersonService
+    - Mỗi thay đổi tăng version của owner để reader biết dữ liệu đang giữ đã cũ
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, KnownPersonEntry] = {}
+        self._versions: Dict[str, int] = {}
+        self._person_owners: Dict[str, str] = {}  # person_id -> user_id (cho delete events)
+        self._load_locks: Dict[str, asyncio.Lock] = {}
+        self._listeners: List[Callable[[str, str, Optional[dict], int], None]] = []
+        self._change_stream_task = None
+
+    def get_version(self, user_id: str) -> int:
+        return self._versions.get(user_id, 0)
+
+    def add_listener(self, callback: Callable[[str, str, Optional[dict], int], None]):
+        """Đăng ký callback(user_id, person_id, person_entry|None, version) khi một person thay đổi"""
+        self._listeners.append(callback)
+
+    async def get(self, user_id: str) -> KnownPersonEntry:
+        """Lấy snapshot embeddings của owner, load lại nếu chưa có hoặc đã bị invalidate"""
+        entry = self._entries.get(user_id)
+        if entry is not None and entry.version == self.get_version(user_id):
+            return entry
+
+        lock = self._load_locks.setdefault(user_id, asyncio.Lock())
+        async with lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry.version != self.get_version(user_id):
+                entry = await self._load(user_id)
+                self._entries[user_id] = entry
+        return entry
+
+    async def get_persons(self, user_id: str) -> List[dict]:
+        return (await self.get(user_id)).as_list()
+
+    async def _load(self, user_id: str) -> KnownPersonEntry:
+        version = self.get_version(user_id)
+        persons = {}
+        db = get_database()
+        query = {"user_id": ObjectId(user_id), "is_active": True}
+        projection = {"name": 1, "face_embeddings": 1}
+        async for person_data in db.known_persons.find(query, projection):
+            person_id = str(person_data["_id"])
+            self._person_owners[person_id] = user_id
+            person = _to_person_entry(person_data)
+            if person:
+                persons[person_id] = person
+        print(f"✅ KnownPersonCache: Loaded {len(persons)} persons for user {user_id} (version {version})")
+        return KnownPersonEntry(user_id, version, persons)
+
+    def _bump(self, user_id: str) -> int:
+        version = self.get_version(user_id) + 1
+        self._versions[user_id] = version
+        return version
+
+    def _apply(self, user_id: str, person_id: str, person: Optional[dict]):
+        """Cập nhật entry đang cache (nếu có) và báo cho listeners"""
+        entry = self._entries.get(user_id)
+        in_sync = entry is not None and entry.version == self.get_version(user_id)
+        version = self._bump(user_id)
+        if in_sync:
+            if person:
+                entry.persons[person_id] = person
+            else:
+                entry.persons.pop(person_id, None)
+            entry.version = version
+
+        for callback in self._listeners:
+            try:
+                callback(user_id, person_id, person, version)
+            except Exception as e:
+                print(f"⚠️ KnownPersonCache: Listener error: {e}")
+
+    async def refresh_person(self, user_id: str, person_id: str):
+        """Đọc lại một person từ database sau create/update/regenerate"""
+        try:
+            db = get_database()
+            person_data = await db.known_persons.find_one(
+                {"_id": ObjectId(person_id), "user_id": ObjectId(user_id)},
+                {"name": 1, "face_embeddings": 1, "is_active": 1}
+            )
+        except Exception as e:
+            print(f"❌ KnownPersonCache: Error refreshing person {person_id}: {e}")
+            self.invalidate(user_id)
+            return
+
+        self._person_owners[person_id] = user_id
+        person = None
+        if person_data and person_data.get("is_active", False):
+            person = _to_person_entry(person_data)
+        self._apply(user_id, person_id, person)
+
+    def remove_person(self, user_id: str, person_id: str):
+        """Bỏ person khỏi cache (sau delete / deactivate)"""
+        self._person_owners.pop(person_id, None)
+        self._apply(user_id, person_id, None)
+
+    def invalidate(self, user_id: Optional[str] = None):
+        """Đánh dấu toàn bộ dữ liệu của owner là cũ - lần get() sau sẽ load lại"""
+        user_ids = [user_id] if user_id else list(self._entries.keys())
+        for uid in user_ids:
+            self._bump(uid)
+
+    # ===== Change stream =====
+
+    def start_change_stream(self):
+        """Theo dõi known_persons qua MongoDB change stream"""
+        if self._change_stream_task is None:
+            self._change_stream_task = asyncio.create_task(self._watch_changes())
+
+    async def stop_change_stream(self):
+        if self._change_stream_task:
+            self._change_stream_task.cancel()
+            try:
+                await self._change_stream_task
+            except asyncio.CancelledError:
+                pass
+            self._change_stream_task = None
+
+    async def _watch_changes(self):
+        try:
+            db = get_database()
+            async with db.known_persons.watch(full_document="updateLookup") as stream:
+                print("🔄 KnownPersonCache: Watching known_persons change stream")
+                async for change in stream:
+                    await self._handle_change(change)
+        except asyncio.CancelledError:
+            raise
+        except OperationFailure as e:
+            # Standalone MongoDB không hỗ trợ change stream - chỉ dựa vào PersonService
+            print(f"⚠️ KnownPersonCache: Change stream not available ({e}), using PersonService invalidation only")
+        except PyMongoError as e:
+            print(f"❌ KnownPersonCache: Change stream error: {e}")
+            self.invalidate()
+        finally:
+            self._change_stream_task = None
+
+    async def _handle_change(self, change: dict):
+        operation = change.get("operationType")
+        if operation in ("drop", "rename", "dropDatabase", "invalidate"):
+            self.invalidate()
+            return
+
+        person_id = str(change.get("documentKey", {}).get("_id", ""))
+        full_document = change.get("fullDocument")
+        if full_document and full_document.get("user_id"):
+            user_id = str(full_document["user_id"])
+            self._person_owners[person_id] = user_id
+            person = _to_person_entry(full_document) if full_document.get("is_active", False) else None
+            self._apply(user_id, person_id, person)
+        else:
+            user_id = self._person_owners.get(person_id)
+            if user_id:
+                self.remove_person(user_id, person_id)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "owners": len(self._entries),
+            "persons": sum(len(e.persons) for e in self._entries.values()),
+            "versions": dict(self._versions),
+            "change_stream_active": self._change_stream_task is not None
+        }
+
+# Global instance
+known_person_cache = KnownPersonCache()
@@ -0,0 +1,144 @@
+import time
+from typing import Dict, List, Optional, Any
+import cv2
+import numpy as np
+from ..config import get_settings
+
+
+class MotionGate:
+    """
+    Bộ lọc chuyển động rẻ tiền chạy trước face detection
+
+    Frame được thu nhỏ + grayscale rồi so với background trung bình động;
+    chỉ khi tỉ lệ pixel thay đổi trong ROI vượt ngưỡng (theo sensitivity)
+    mới cần chạy detector. Vẫn chạy định kỳ (keepalive) và khi frame trước
+    còn khuôn mặt để người đứng yên không bị coi là đã rời đi.
+    """
+
+    PROCESS_WIDTH = 160
+    PIXEL_DIFF_THRESHOLD = 25
+    BACKGROUND_ALPHA = 0.1
+
+    def __init__(self, camera_id: str, sensitivity: float = 0.5, roi: Optional[List[List[float]]] = None,
+                 keepalive_seconds: float = 3.0):
+        self.camera_id = camera_id
+        self.sensitivity = min(max(float(sensitivity), 0.0), 1.0)
+        self.roi = roi or []  # List [x, y, w, h] theo tỉ lệ 0..1 của frame
+        self.keepalive_seconds = keepalive_seconds
+        # sensitivity 1.0 -> 0.1% pixel thay đổi, 0.0 -> 5%
+        self.min_changed_ratio = 0.001 + (1.0 - self.sensitivity) * 0.049
+
+        self._background: Optional[np.ndarray] = None
+        self._mask: Optional[np.ndarray] = None
+        self._last_processed = 0.0
+
+        self.frames_checked = 0
+        self.frames_processed = 0
+        self.frames_skipped = 0
+        self.last_motion_ratio = 0.0
+
+    def _build_mask(self, shape) -> Optional[np.ndarray]:
+        if not self.roi:
+            return None
+        h, w = shape
+        mask = np.zeros((h, w), dtype=np.uint8)
+        for rect in self.roi:
+            try:
+                x, y, rw, rh = [float(v) for v in rect]
+            except (TypeError, ValueError):
+                continue
+            x1, y1 = int(x * w), int(y * h)
+            x2, y2 = int((x + rw) * w), int((y + rh) * h)
+            mask[max(y1, 0):min(y2, h), max(x1, 0):min(x2, w)] = 255
+        return mask if mask.any() else None
+
+    def _motion_ratio(self, frame: np.ndarray) -> float:
+        scale = self.PROCESS_WIDTH / frame.shape[1]
+        small = cv2.resize(frame, (self.PROCESS_WIDTH, max(int(frame.shape[0] * scale), 1)), interpolation=cv2.INTER_AREA)
+        gray = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+
+        if self._background is None or self._background.shape != gray.shape:
+            self._background = gray.astype(np.float32)
+            self._mask = self._build_mask(gray.shape)
+            return 1.0  # Frame đầu tiên luôn xử lý
+
+        diff = cv2.absdiff(gray, cv2.convertScaleAbs(self._background))
+        cv2.accumulateWeighted(gray, self._background, self.BACKGROUND_ALPHA)
+        _, changed = cv2.threshold(diff, self.PIXEL_DIFF_THRESHOLD, 255, cv2.THRESH_BINARY)
+
+        if self._mask is not None:
+            changed = cv2.bitwise_and(changed, self._mask)
+            area = cv2.countNonZero(self._mask)
+        else:
+            area = changed.size
+        return cv2.countNonZero(changed) / max(area, 1)
+
+    def should_process(self, frame: np.ndarray, faces_present: bool = False) -> bool:
+        """True nếu frame cần chạy face detection"""
+        self.frames_checked += 1
+        now = time.time()
+        try:
+            self.last_motion_ratio = self._motion_ratio(frame)
+        except Exception as e:
+            print(f"⚠️ MotionGate: Error computing motion for camera {self.camera_id}: {e}")
+            self.last_motion_ratio = 1.0
+
+        if (self.last_motion_ratio >= self.min_changed_ratio or faces_present
+                or now - self._last_processed >= self.keepalive_seconds):
+            self._last_processed = now
+            self.frames_processed += 1
+            return True
+
+        self.frames_skipped += 1
+        return False
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "frames_checked": self.frames_checked,
+            "frames_processed": self.frames_processed,
+            "frames_skipped": self.frames_skipped,
+            "skip_ratio": round(self.frames_skipped / self.frames_checked, 3) if self.frames_checked else 0.0,
+            "last_motion_ratio": round(self.last_motion_ratio, 4),
+            "sensitivity": self.sensitivity,
+            "roi": self.roi
+        }
+
+
+class MotionGateService:
+    """Quản lý MotionGate theo camera, cấu hình từ camera.stream_settings"""
+
+    def __init__(self):
+        self._gates: Dict[str, MotionGate] = {}
+        self._configs: Dict[str, tuple] = {}
+
+    def get_gate(self, camera_id: str, stream_settings: Optional[dict]) -> Optional[MotionGate]:
+        """Lấy gate của camera (None nếu camera tắt motion gate)"""
+        settings = get_settings()
+        stream_settings = stream_settings or {}
+        if not stream_settings.get("motion_gate_enabled", settings.motion_gate_enabled):
+            self.remove_gate(camera_id)
+            return None
+
+        sensitivity = stream_settings.get("motion_sensitivity")
+        if sensitivity is None:
+            sensitivity = settings.motion_gate_sensitivity
+        roi = stream_settings.get("motion_roi") or []
+        config = (sensitivity, str(roi))
+
+        gate = self._gates.get(camera_id)
+        if gate is None or self._configs.get(camera_id) != config:
+            gate = MotionGate(camera_id, sensitivity, roi, settings.motion_gate_keepalive_seconds)
+            self._gates[camera_id] = gate
+            self._configs[camera_id] = config
+        return gate
+
+    def remove_gate(self, camera_id: str):
+        self._gates.pop(camera_id, None)
+        self._configs.pop(camera_id, None)
+
+    def get_stats(self, camera_id: str) -> Optional[Dict[str, Any]]:
+        gate = self._gates.get(camera_id)
+        return gate.get_stats() if gate else None
+
+# Global instance
+motion_gate_service = MotionGateService()
@@ -39,6 +39,9 @@ class NotificationService:
         # ANTI-SPAM: Lock mechanism để tránh race condition
         self.email_locks: Dict[str, asyncio.Lock] = {}  # Locks per user+camera  # Prevent spam alerts
         
+        # Dedupe theo stranger_id: cùng một người lạ chỉ alert lại sau alert_cooldown_minutes
+        self.stranger_last_alerted: Dict[str, datetime] = {}  # f"{user_id}_{stranger_id}" -> time
+        
     async def send_stranger_alert_with_frame_analysis(self, user_id: str, camera_id: str, 
                                                      all_detections: List[Dict[str, Any]], 
                                                      image_data: bytes = None):
@@ -76,6 +79,12 @@ class NotificationService:
                 elif detection.get('detection_type') == 'known_person':
                     known_person_detections.append(detection)
             
+            # ===== DEDUPE THEO STRANGER ID =====
+            # Bỏ qua nếu mọi người lạ trong khung hình đều đã được alert gần đây
+            if stranger_detections and not self._has_new_stranger(user_id, stranger_detections):
+                print(f"ℹ️ No email sent: All {len(stranger_detections)} strangers already alerted recently")
+                return
+            
             # ===== LOGIC MỚI: CHỈ GỬI EMAIL NẾU CHỈ CÓ NGƯỜI LẠ =====
             if stranger_detections and not known_person_detections:
                 print(f"🚨 [MAIN EMAIL ALERT] Only strangers detected in frame!")
@@ -245,6 +254,7 @@ class NotificationService:
                 # Để tránh spam, set cooldown ngay cả khi email thất bại
                 if email_attempted:
                     self.alert_cooldown[cooldown_key] = current_time
+                    self._mark_strangers_alerted(user_id, stranger_detections, current_time)
                     
                     if not should_bypass_cooldown:
                         cooldown_info = f"{basic_cooldown_seconds}s"
@@ -275,6 +285,30 @@ class NotificationService:
             import traceback
             traceback.print_exc()
         
+    def _has_new_stranger(self, user_id: str, stranger_detections: List[Dict[str, Any]]) -> bool:
+        """True nếu có người lạ chưa có stranger_id hoặc chưa được alert trong cooldown"""
+        cooldown = timedelta(minutes=self.settings.alert_cooldown_minutes)
+        now = datetime.utcnow()
+        for detection in stranger_detections:
+            stranger_id = detection.get('stranger_id')
+            if not stranger_id:
+                return True
+            last_alerted = self.stranger_last_alerted.get(f"{user_id}_{stranger_id}")
+            if not last_alerted or now - last_alerted >= cooldown:
+                return True
+        return False
+    
+    def _mark_strangers_alerted(self, user_id: str, stranger_detections: List[Dict[str, Any]], alerted_at: datetime):
+        for detection in stranger_detections:
+            if detection.get('stranger_id'):
+                self.stranger_last_alerted[f"{user_id}_{detection['stranger_id']}"] = alerted_at
+        
+        # Dọn các entry đã hết cooldown
+        cooldown = timedelta(minutes=self.settings.alert_cooldown_minutes)
+        expired = [key for key, ts in self.stranger_last_alerted.items() if alerted_at - ts >= cooldown]
+        for key in expired:
+            del self.stranger_last_alerted[key]
+
     async def send_stranger_alert(self, user_id: str, detection_data: Dict[str, Any]):
         """Gửi cảnh báo phát hiện người lạ - DEPRECATED: Chỉ gửi WebSocket, không gửi email"""
         try:
@@ -0,0 +1,115 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Tuple, Any
+import cv2
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+
+class OverlayRenderer:
+    """
+    Vẽ bounding box + label UTF-8 (tiếng Việt) lên frame
+
+    Label được rasterize bằng PIL một lần thành alpha mask nhỏ và cache theo
+    (text, font_size); mỗi frame chỉ blend các patch label vào vùng tương ứng
+    thay vì chuyển cả frame sang PIL và ngược lại.
+    """
+
+    MAX_CACHED_LABELS = 512
+
+    def __init__(self):
+        self._fonts: Dict[int, Any] = {}
+        self._labels: "OrderedDict[Tuple[str, int], np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    @staticmethod
+    def _font_path() -> str:
+        if os.name == 'nt':  # Windows
+            return "C:/Windows/Fonts/arial.ttf"
+        return "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"  # Linux/Mac
+
+    def _get_font(self, font_size: int):
+        font = self._fonts.get(font_size)
+        if font is None:
+            try:
+                font_path = self._font_path()
+                if os.path.exists(font_path):
+                    font = ImageFont.truetype(font_path, font_size)
+                else:
+                    font = ImageFont.load_default()
+            except Exception:
+                font = ImageFont.load_default()
+            self._fonts[font_size] = font
+        return font
+
+    def _get_label_mask(self, text: str, font_size: int) -> np.ndarray:
+        """Alpha mask (float32 0..1) của label - cache LRU theo (text, font_size)"""
+        key = (text, font_size)
+        with self._lock:
+            mask = self._labels.get(key)
+            if mask is not None:
+                self._labels.move_to_end(key)
+                self.cache_hits += 1
+                return mask
+
+        font = self._get_font(font_size)
+        left, top, right, bottom = font.getbbox(text)
+        width, height = max(right, 1), max(bottom, 1)
+        image = Image.new("L", (width, height), 0)
+        ImageDraw.Draw(image).text((0, 0), text, font=font, fill=255)
+        mask = np.asarray(image, dtype=np.float32) / 255.0
+
+        with self._lock:
+            self.cache_misses += 1
+            self._labels[key] = mask
+            if len(self._labels) > self.MAX_CACHED_LABELS:
+                self._labels.popitem(last=False)
+        return mask
+
+    def draw_text(self, frame: np.ndarray, text: str, position: tuple,
+                  font_scale: float = 0.8, color: tuple = (0, 255, 0)) -> np.ndarray:
+        """Blend label vào frame tại position (góc trên trái) - vẽ trực tiếp trên frame"""
+        font_size = int(20 * font_scale)
+        mask = self._get_label_mask(text, font_size)
+
+        x, y = int(position[0]), int(position[1])
+        h, w = mask.shape
+        frame_h, frame_w = frame.shape[:2]
+        # Cắt phần label nằm ngoài frame
+        x1, y1 = max(x, 0), max(y, 0)
+        x2, y2 = min(x + w, frame_w), min(y + h, frame_h)
+        if x1 >= x2 or y1 >= y2:
+            return frame
+
+        alpha = mask[y1 - y:y2 - y, x1 - x:x2 - x, None]
+        roi = frame[y1:y2, x1:x2].astype(np.float32)
+        roi += (np.array(color, dtype=np.float32) - roi) * alpha
+        frame[y1:y2, x1:x2] = roi.astype(np.uint8)
+        return frame
+
+    def draw_detections(self, frame: np.ndarray, detections: List[Dict[str, Any]]) -> np.ndarray:
+        """Vẽ tất cả bbox + label của frame trong một lượt"""
+        for detection in detections:
+            x, y, w, h = detection.get('bbox', [0, 0, 0, 0])
+            name = detection.get('person_name', 'Unknown')
+            confidence = detection.get('confidence', 0)
+
+            # Màu khác nhau cho người đã biết và không xác định
+            color = (0, 0, 255) if name == "Unknown" else (0, 255, 0)
+
+            cv2.rectangle(frame, (x, y), (x + w, y + h), color, 2)
+            self.draw_text(frame, f"{name} ({confidence:.2f})", (x, y - 30), font_scale=0.8, color=color)
+        return frame
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "cached_labels": len(self._labels),
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses
+        }
+
+# Global instance
+overlay_renderer = OverlayRenderer()
@@ -10,6 +10,7 @@ from ..models.known_person import (
     FaceImageResponse      # ✅ Add this import
 )
 from ..services.face_processor import face_processor
+from ..services.known_person_cache import known_person_cache
 from datetime import datetime, timedelta
 import base64
 import asyncio
@@ -85,6 +86,7 @@ class PersonService:
             person_dict["_id"] = result.inserted_id
             
             print(f"✅ PersonService: Person created with ID: {result.inserted_id}")
+            await known_person_cache.refresh_person(user_id, str(result.inserted_id))
             
             # ✅ FIX: Return response with all fields
             return KnownPersonResponse(
@@ -246,6 +248,7 @@ class PersonService:
             
             if result:
                 print(f"✅ PersonService: Person updated successfully")
+                await known_person_cache.refresh_person(user_id, person_id)
                 
                 # ✅ FIX: Return complete response with all fields
                 return KnownPersonResponse(
@@ -282,6 +285,7 @@ class PersonService:
                     "_id": ObjectId(person_id),
                     "user_id": ObjectId(user_id)
                 })
+                known_person_cache.remove_person(user_id, person_id)
                 return result.deleted_count > 0
             else:
                 result = await self.collection.update_one(
@@ -293,6 +297,7 @@ class PersonService:
                         }
                     }
                 )
+                known_person_cache.remove_person(user_id, person_id)
                 return result.modified_count > 0
         except Exception as e:
             print(f"Error deleting person: {e}")
@@ -392,6 +397,8 @@ class PersonService:
             
             if result.modified_count > 0:
                 print(f"✅ PersonService: Face image added successfully")
+                if embedding_list is not None:
+                    await known_person_cache.refresh_person(user_id, person_id)
                 return {
                     "success": True,
                     "message": "Face image added successfully",
@@ -510,6 +517,7 @@ class PersonService:
             
             if result.modified_count > 0:
                 print(f"✅ PersonService: Face embeddings regenerated successfully")
+                await known_person_cache.refresh_person(user_id, person_id)
                 return {
                     "success": True,
                     "message": f"Regenerated embeddings for {successful_extractions}/{len(face_images)} images",
@@ -563,6 +571,8 @@ class PersonService:
                 }
             )
             
+            if result.modified_count > 0:
+                await known_person_cache.refresh_person(user_id, person_id)
             return result.modified_count > 0
         except Exception as e:
             print(f"Error removing face image: {e}")
@@ -610,6 +620,7 @@ class PersonService:
                         }
                     }
                 )
+                await known_person_cache.refresh_person(user_id, person_id)
             
             return {
                 "success": True,
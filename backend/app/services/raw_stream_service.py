@@ -0,0 +1,146 @@
+import asyncio
+from typing import Any, AsyncGenerator, Dict, Optional
+from ..services.camera_capture import CameraCapture
+from ..services.frame_broadcaster import FrameBroadcaster, STREAM_TIERS, resolve_tier, tier_quality
+from ..services.frame_encoder import frame_encoder
+
+
+class RawStreamService:
+    """
+    Raw camera stream (không có detection) dùng chung cho mọi viewer của camera
+
+    Mỗi camera chỉ có một CameraCapture + một producer task encode JPEG theo
+    tier đang có viewer; viewer là async generator đọc FrameBroadcaster nên
+    không giữ thread nào. Nếu camera đang chạy detection stream thì đọc chung
+    LatestFrameSlot của capture đó (không mở thêm RTSP session / webcam), chỉ
+    mở capture riêng khi không có. Capture riêng đóng khi viewer cuối cùng rời đi.
+    """
+
+    def __init__(self):
+        self._streams: Dict[str, Dict[str, Any]] = {}
+
+    @staticmethod
+    def _shared_capture(camera_id: str) -> Optional[CameraCapture]:
+        """Capture của detection stream đang chạy cho camera (None nếu không có)"""
+        from .stream_processor import stream_processor
+        stream = stream_processor.active_streams.get(camera_id)
+        if not stream or not stream.get("is_active"):
+            return None
+        return stream.get("capture")
+
+    def _attach_capture(self, camera_id: str, entry: Dict[str, Any]):
+        capture = self._shared_capture(camera_id)
+        if capture is not None:
+            entry["capture"], entry["owns_capture"] = capture, False
+            return
+        camera_doc = entry["camera_doc"]
+        capture = CameraCapture(camera_id, camera_doc.get("camera_type", "webcam"),
+                                camera_doc.get("camera_url"), camera_doc.get("stream_settings"))
+        entry["capture"], entry["owns_capture"] = capture, True
+        capture.start()
+
+    def _start(self, camera_id: str, camera_doc: dict) -> Dict[str, Any]:
+        entry = {
+            "camera_doc": camera_doc,
+            "capture": None,
+            "owns_capture": False,
+            "broadcaster": FrameBroadcaster(camera_id),
+            "viewers": 0,
+            "task": None
+        }
+        self._streams[camera_id] = entry
+        self._attach_capture(camera_id, entry)
+        entry["task"] = asyncio.create_task(self._produce(camera_id, entry))
+        source = "private capture" if entry["owns_capture"] else "shared detection capture"
+        print(f"🔵 Raw stream started for camera {camera_id} ({source})")
+        return entry
+
+    async def _stop(self, camera_id: str):
+        entry = self._streams.pop(camera_id, None)
+        if entry is None:
+            return
+        task = entry["task"]
+        if task and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        await entry["broadcaster"].close()
+        if entry["owns_capture"]:
+            # join capture thread ngoài event loop
+            await asyncio.get_event_loop().run_in_executor(None, entry["capture"].stop)
+        print(f"🔵 Raw stream stopped for camera {camera_id}")
+
+    async def _produce(self, camera_id: str, entry: Dict[str, Any]):
+        broadcaster = entry["broadcaster"]
+        last_seq = 0
+        try:
+            while True:
+                capture = entry["capture"]
+                ref = capture.slot.acquire(last_seq)
+                if ref is None:
+                    if not entry["owns_capture"] and self._shared_capture(camera_id) is not capture:
+                        # Detection stream đã dừng - mở capture riêng cho các viewer còn lại
+                        self._attach_capture(camera_id, entry)
+                        last_seq = 0
+                    await asyncio.sleep(0.005)
+                    continue
+                with ref:
+                    last_seq = ref.seq
+                    tiers = broadcaster.active_tiers()
+                    if not tiers:
+                        continue
+                    renditions = {tier: (STREAM_TIERS[tier]["max_width"], tier_quality(tier)) for tier in tiers}
+                    frames = await frame_encoder.encode_renditions(ref.frame, renditions)
+                if frames:
+                    await broadcaster.publish(frames)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"❌ Error in raw stream for camera {camera_id}: {e}")
+            await broadcaster.close()
+
+    async def subscribe(self, camera_id: str, camera_doc: dict, quality: Optional[str] = None,
+                        resolution: Optional[str] = None) -> AsyncGenerator[bytes, None]:
+        """Yield JPEG bytes của camera cho một viewer"""
+        entry = self._streams.get(camera_id)
+        if entry is None or entry["broadcaster"].is_closed:
+            if entry is not None:
+                await self._stop(camera_id)
+            entry = self._start(camera_id, camera_doc)
+        stream_settings = camera_doc.get("stream_settings") or {}
+        tier = resolve_tier(quality or stream_settings.get("quality"),
+                            resolution or stream_settings.get("resolution"))
+        entry["viewers"] += 1
+        try:
+            async for frame_bytes in entry["broadcaster"].subscribe(tier):
+                yield frame_bytes
+        finally:
+            entry["viewers"] -= 1
+            if entry["viewers"] <= 0 and self._streams.get(camera_id) is entry:
+                await self._stop(camera_id)
+
+    def get_latest_frame(self, camera_id: str):
+        """Copy frame mới nhất nếu camera đang có raw stream (None nếu không)"""
+        entry = self._streams.get(camera_id)
+        if entry is None or not entry["capture"].is_live:
+            return None
+        ref = entry["capture"].slot.acquire()
+        if ref is None:
+            return None
+        with ref:
+            return ref.frame.copy()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            camera_id: {
+                "viewers": entry["viewers"],
+                "health": entry["capture"].state,
+                **entry["broadcaster"].get_stats()
+            }
+            for camera_id, entry in self._streams.items()
+        }
+
+# Global instance
+raw_stream_service = RawStreamService()
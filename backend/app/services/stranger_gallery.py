@@ -0,0 +1,148 @@
+import threading
+import time
+import uuid
+from typing import Dict, Optional, Any
+import numpy as np
+import faiss
+from ..config import get_settings
+
+
+class StrangerGallery:
+    """
+    Gallery người lạ của một owner - gom embeddings Unknown thành cluster online
+
+    Mỗi cluster có ID cố định `stranger_<uuid>` (duy nhất qua các lần restart, không
+    trùng ID đã lưu trong DB; faiss id chỉ dùng nội bộ) và centroid (trung bình
+    embeddings đã chuẩn hóa). Index bị giới hạn kích thước: cluster hết TTL bị xóa,
+    khi đầy thì bỏ cluster lâu nhất chưa xuất hiện.
+    """
+
+    def __init__(self, user_id: str, match_threshold: float, max_size: int, ttl_seconds: float):
+        self.user_id = user_id
+        self.match_threshold = match_threshold
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._index = None
+        self._dim: Optional[int] = None
+        self._centroids: Dict[int, np.ndarray] = {}  # faiss id -> centroid (chưa chuẩn hóa)
+        self._counts: Dict[int, int] = {}
+        self._last_seen: Dict[int, float] = {}
+        self._stranger_ids: Dict[int, str] = {}  # faiss id -> stranger ID public
+        self._next_id = 0
+        self._last_sweep = time.time()
+        self._lock = threading.Lock()
+
+    @property
+    def size(self) -> int:
+        return len(self._centroids)
+
+    def assign(self, embedding: np.ndarray) -> Optional[str]:
+        """Trả về stranger ID của cluster gần nhất, hoặc tạo cluster mới"""
+        vector = np.ascontiguousarray(embedding, dtype=np.float32).reshape(1, -1)
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            return None
+        vector /= norm
+
+        with self._lock:
+            if self._dim is None:
+                self._dim = vector.shape[1]
+                self._index = faiss.IndexIDMap2(faiss.IndexFlatIP(self._dim))
+            elif vector.shape[1] != self._dim:
+                return None
+
+            now = time.time()
+            if now - self._last_sweep > 60:
+                self._evict_expired_locked(now)
+
+            if self._centroids:
+                D, I = self._index.search(vector, 1)
+                faiss_id = int(I[0][0])
+                if faiss_id >= 0 and float(D[0][0]) >= self.match_threshold:
+                    self._update_cluster_locked(faiss_id, vector[0], now)
+                    return self._stranger_ids[faiss_id]
+
+            if len(self._centroids) >= self.max_size:
+                oldest = min(self._last_seen, key=self._last_seen.get)
+                self._remove_locked(oldest)
+
+            faiss_id = self._next_id
+            self._next_id += 1
+            self._index.add_with_ids(vector, np.array([faiss_id], dtype=np.int64))
+            self._centroids[faiss_id] = vector[0].copy()
+            self._counts[faiss_id] = 1
+            self._last_seen[faiss_id] = now
+            stranger_id = self._stranger_ids[faiss_id] = f"stranger_{uuid.uuid4().hex}"
+            return stranger_id
+
+    def _update_cluster_locked(self, faiss_id: int, vector: np.ndarray, now: float):
+        """Cập nhật centroid theo running mean (giới hạn trọng số để cluster vẫn thích nghi)"""
+        count = min(self._counts[faiss_id], 50)
+        centroid = (self._centroids[faiss_id] * count + vector) / (count + 1)
+        self._centroids[faiss_id] = centroid
+        self._counts[faiss_id] += 1
+        self._last_seen[faiss_id] = now
+
+        normalized = centroid / max(np.linalg.norm(centroid), 1e-6)
+        ids = np.array([faiss_id], dtype=np.int64)
+        self._index.remove_ids(ids)
+        self._index.add_with_ids(normalized.reshape(1, -1).astype(np.float32), ids)
+
+    def _remove_locked(self, faiss_id: int):
+        self._index.remove_ids(np.array([faiss_id], dtype=np.int64))
+        self._centroids.pop(faiss_id, None)
+        self._counts.pop(faiss_id, None)
+        self._last_seen.pop(faiss_id, None)
+        self._stranger_ids.pop(faiss_id, None)
+
+    def _evict_expired_locked(self, now: float):
+        expired = [fid for fid, seen in self._last_seen.items() if now - seen > self.ttl_seconds]
+        for faiss_id in expired:
+            self._remove_locked(faiss_id)
+        self._last_sweep = now
+
+    def evict_expired(self):
+        with self._lock:
+            if self._index is not None:
+                self._evict_expired_locked(time.time())
+
+
+class StrangerGalleryService:
+    """Quản lý StrangerGallery theo owner để mọi camera của owner dùng chung stranger IDs"""
+
+    def __init__(self):
+        settings = get_settings()
+        self.match_threshold = settings.stranger_match_threshold
+        self.max_size = settings.stranger_gallery_max_size
+        self.ttl_seconds = settings.stranger_ttl_minutes * 60
+        self._galleries: Dict[str, StrangerGallery] = {}
+        self._lock = threading.Lock()
+
+    def get_gallery(self, user_id: str) -> StrangerGallery:
+        gallery = self._galleries.get(user_id)
+        if gallery is None:
+            with self._lock:
+                gallery = self._galleries.get(user_id)
+                if gallery is None:
+                    gallery = StrangerGallery(user_id, self.match_threshold, self.max_size, self.ttl_seconds)
+                    self._galleries[user_id] = gallery
+        return gallery
+
+    def assign(self, user_id: str, embedding: np.ndarray) -> Optional[str]:
+        """Gán stranger ID cho embedding Unknown của owner"""
+        if not user_id or embedding is None:
+            return None
+        try:
+            return self.get_gallery(user_id).assign(embedding)
+        except Exception as e:
+            print(f"⚠️ StrangerGallery: Error assigning stranger id: {e}")
+            return None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "owners": len(self._galleries),
+            "strangers": sum(g.size for g in self._galleries.values())
+        }
+
+# Global instance
+stranger_gallery_service = StrangerGalleryService()
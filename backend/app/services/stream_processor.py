@@ -2,44 +2,56 @@ import cv2
 import asyncio
 import numpy as np
 import json
-from typing import Dict, Any, Optional, AsyncGenerator
+from typing import Dict, Any, Optional, AsyncGenerator, List
 from ..models.camera import CameraResponse
 from ..services.face_processor import face_processor
 from ..services.websocket_manager import websocket_manager
 from ..services.detection_tracker import detection_tracker
 from ..services.detection_optimizer_service import DetectionOptimizerService
 from ..services.notification_service import notification_service
+from ..services.face_gallery import face_gallery_service, FaceGalleryIndex
+from ..services.known_person_cache import known_person_cache
+from ..services.frame_broadcaster import FrameBroadcaster, STREAM_TIERS, resolve_tier, tier_quality
+from ..services.inference_scheduler import inference_scheduler
+from ..services.face_tracker import face_tracker_service
+from ..services.motion_gate import motion_gate_service
+from ..services.adaptive_interval import AdaptiveIntervalController
+from ..services.overlay_renderer import overlay_renderer
+from ..services.frame_encoder import frame_encoder, EncodedFrame
+from ..services.camera_capture import CameraCapture, CAPTURE_OFFLINE
+from ..services.clip_recorder import clip_recorder
+from ..services.capture_factory import capture_factory
+from ..services.capture_pool import capture_pool
+from ..services.image_storage import image_storage
+from ..config import get_settings
 import concurrent.futures
 import time
-import base64
-from io import BytesIO
-from PIL import Image, ImageDraw, ImageFont
 import os
-import asyncio
-import numpy as np
-from typing import Dict, Any, Optional, AsyncGenerator, List, List
-from ..models.camera import CameraResponse
-from ..services.face_processor import face_processor
-from ..services.websocket_manager import websocket_manager
-import concurrent.futures
-import time
-import base64
-from io import BytesIO
+import uuid
+from collections import OrderedDict
 
 class StreamProcessor:
+    PERSISTED_EVENTS_MAX = 512
+
     def __init__(self):
         self.active_streams: Dict[str, Dict[str, Any]] = {}
         self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=4)
         self._frame_times: Dict[str, float] = {}  # Để tracking FPS
+        self._camera_info: Dict[str, Dict[str, str]] = {}  # camera_id -> {"user_id", "name"}
+        # event_id -> Future[detection_id] của các detection event đã lưu gần đây (LRU)
+        self._persisted_events: "OrderedDict[str, asyncio.Future]" = OrderedDict()
+        self._fallback_optimizer: Optional[DetectionOptimizerService] = None
 
     async def get_stream_info(self, camera_id: str) -> Dict[str, Any]:
         """Lấy thông tin stream"""
         if camera_id in self.active_streams:
             stream = self.active_streams[camera_id]
+            capture = stream.get("capture")
             return {
                 "is_streaming": stream.get("is_active", False),
                 "status": "online" if stream.get("is_active") else "offline",
-                "viewers_count": stream.get("viewers_count", 0),
+                "health": capture.state if capture else None,
+                "viewers_count": self._get_viewers_count(stream),
                 "uptime": time.time() - stream.get("start_time", time.time())
             }
         else:
@@ -50,55 +62,41 @@ class StreamProcessor:
                 "uptime": 0
             }
 
-    import threading
-    import queue
-
-    def _frame_reader(self, camera_id: str, camera: CameraResponse, frame_queue: 'queue.Queue', stop_event: 'threading.Event'):
-        """Luồng đọc frame liên tục cho camera"""
-        if camera.camera_type == "webcam":
-            cap = cv2.VideoCapture(0)
-        elif camera.camera_url:
-            cap = cv2.VideoCapture(camera.camera_url)
-        else:
-            cap = cv2.VideoCapture(0)
-        if not cap.isOpened():
-            return
-        self.active_streams[camera_id]["cap"] = cap
-        while not stop_event.is_set():
-            ret, frame = cap.read()
-            if not ret:
-                continue
-            # Giữ queue chỉ 1 frame mới nhất (loại bỏ frame cũ)
-            if not frame_queue.empty():
-                try:
-                    frame_queue.get_nowait()
-                except Exception:
-                    pass
-            frame_queue.put(frame)
-        cap.release()
+    def _get_viewers_count(self, stream: Dict[str, Any]) -> int:
+        """Số viewer đang đọc broadcast buffer của camera"""
+        broadcaster = stream.get("broadcaster")
+        return broadcaster.subscribers if broadcaster else 0
 
     async def start_stream(self, camera_id: str, camera: CameraResponse) -> bool:
         """Bắt đầu stream camera (tối ưu đa luồng đọc frame)"""
         try:
             if camera_id in self.active_streams:
-                return True  # Already streaming
+                if self.active_streams[camera_id].get("is_active"):
+                    return True  # Already streaming
+                # Pipeline đã dừng do lỗi - dọn dẹp trước khi start lại
+                await self.stop_stream(camera_id)
             detection_tracker.start_cleanup_task()
-            import threading
-            import queue
-            frame_queue = queue.Queue(maxsize=1)
-            stop_event = threading.Event()
-            reader_thread = threading.Thread(target=self._frame_reader, args=(camera_id, camera, frame_queue, stop_event), daemon=True)
+            # Capture thread: giữ frame mới nhất, tự kết nối lại với backoff khi mất tín hiệu
+            capture = CameraCapture(camera_id, camera.camera_type, camera.camera_url, camera.stream_settings)
+            # Camera có substream độ phân giải thấp: face detection đọc substream, stream/clip/snapshot dùng main stream
+            inference_capture = None
+            if camera.detection_enabled and capture_factory.has_substream(camera.camera_type, camera.stream_settings):
+                inference_capture = CameraCapture(camera_id, camera.camera_type, camera.camera_url,
+                                                  camera.stream_settings, purpose="inference")
             self.active_streams[camera_id] = {
                 "camera": camera,
                 "is_active": True,
                 "start_time": time.time(),
-                "viewers_count": 0,
-                "cap": None,
-                "frame_queue": frame_queue,
-                "stop_event": stop_event,
-                "reader_thread": reader_thread
+                "capture": capture,
+                "inference_capture": inference_capture,
+                "broadcaster": FrameBroadcaster(camera_id),
+                "producer_task": None
             }
-            reader_thread.start()
+            capture.start()
+            if inference_capture:
+                inference_capture.start()
+            # Một producer duy nhất cho camera - capture + AI + encode chỉ chạy một lần cho mọi viewer
+            self.active_streams[camera_id]["producer_task"] = asyncio.create_task(self._run_pipeline(camera_id, camera))
             print(f"Stream started for camera: {camera.name}")
             return True
         except Exception as e:
@@ -111,17 +109,30 @@ class StreamProcessor:
             if camera_id in self.active_streams:
                 stream = self.active_streams[camera_id]
                 stream["is_active"] = False
-                # Stop frame reader thread
-                if stream.get("stop_event"):
-                    stream["stop_event"].set()
-                if stream.get("reader_thread"):
-                    stream["reader_thread"].join(timeout=1)
-                # Close camera capture if exists
-                if stream.get("cap"):
-                    stream["cap"].release()
+                # Stop capture thread (join blocking - chạy trên executor, thread tự release camera)
+                loop = asyncio.get_event_loop()
+                for key in ("capture", "inference_capture"):
+                    if stream.get(key):
+                        await loop.run_in_executor(None, stream[key].stop)
+                # Stop producer và đóng broadcast buffer (kết thúc các viewer)
+                producer_task = stream.get("producer_task")
+                if producer_task and not producer_task.done():
+                    producer_task.cancel()
+                    try:
+                        await producer_task
+                    except asyncio.CancelledError:
+                        pass
+                if stream.get("broadcaster"):
+                    await stream["broadcaster"].close()
                 del self.active_streams[camera_id]
+                face_tracker_service.remove_tracker(camera_id)
+                motion_gate_service.remove_gate(camera_id)
+                clip_recorder.remove_camera(camera_id)
+                # Camera có thể đổi tên/owner khi không stream
+                self._camera_info.pop(camera_id, None)
                 if not self.active_streams:
                     await detection_tracker.stop_cleanup_task()
+                    await inference_scheduler.stop()
                 print(f"Stream stopped for camera: {camera_id}")
                 return True
             return False
@@ -129,95 +140,206 @@ class StreamProcessor:
             print(f"Error stopping stream: {e}")
             return False
 
-    async def generate_video_stream(self, camera_id: str, camera: CameraResponse) -> AsyncGenerator[bytes, None]:
-        """Generate video stream frames (tối ưu đa luồng, AI mỗi 5 frame)"""
+    async def generate_video_stream(self, camera_id: str, camera: CameraResponse,
+                                    quality: Optional[str] = None,
+                                    resolution: Optional[str] = None) -> AsyncGenerator[bytes, None]:
+        """Generate MJPEG stream cho một viewer - đọc từ broadcast buffer chung của camera"""
         try:
             await self.start_stream(camera_id, camera)
             stream = self.active_streams.get(camera_id)
-            if not stream or "frame_queue" not in stream:
+            if not stream or "broadcaster" not in stream:
                 async for frame in self._generate_dummy_frames():
                     yield frame
                 return
-            frame_queue = stream["frame_queue"]
-            frame_count = 0
-            last_ai_result = None
-            while True:
-                if camera_id not in self.active_streams or not self.active_streams[camera_id]["is_active"]:
-                    break
-                try:
-                    frame = frame_queue.get(timeout=1)
-                except Exception:
-                    frame = self._create_dummy_frame(f"Camera {camera.name} - No Signal")
-                frame_count += 1
-                # Chỉ xử lý AI mỗi 5 frame, các frame còn lại chỉ overlay lại kết quả AI cũ
-                if camera.detection_enabled and frame_count % 5 == 0:
-                    processed_frame = await self._process_frame(frame.copy(), camera_id, camera)
-                    last_ai_result = processed_frame
-                elif last_ai_result is not None:
-                    processed_frame = last_ai_result.copy()
-                    # Cập nhật overlay thời gian, FPS, camera name
-                    current_time = time.time()
-                    fps = 0
-                    if hasattr(self, '_frame_times') and camera_id in self._frame_times:
-                        fps = 1.0 / (current_time - self._frame_times[camera_id])
-                        self._frame_times[camera_id] = current_time
-                    cv2.putText(processed_frame, f"FPS: {fps:.2f}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
-                    cv2.putText(processed_frame, f"Camera: {camera.name}", (10, 70), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-                    timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
-                    cv2.putText(processed_frame, timestamp, (10, processed_frame.shape[0] - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
-                else:
-                    processed_frame = await self._process_frame(frame.copy(), camera_id, camera)
-                _, buffer = cv2.imencode('.jpg', processed_frame, [cv2.IMWRITE_JPEG_QUALITY, 70])
-                frame_bytes = buffer.tobytes()
+            async for frame_bytes in self.subscribe_frames(camera_id, camera, quality, resolution):
                 yield (b'--frame\r\n'
                        b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-                await asyncio.sleep(0.001)  # sleep rất nhỏ để tránh block event loop
         except Exception as e:
             print(f"Error in video stream: {e}")
             async for frame in self._generate_error_frames(str(e)):
                 yield frame
 
-    async def _process_frame(self, frame: np.ndarray, camera_id: str, camera: CameraResponse) -> np.ndarray:
-        """Process frame (add overlays, detection, etc.) - theo code mẫu"""
+    async def subscribe_frames(self, camera_id: str, camera: CameraResponse,
+                               quality: Optional[str] = None,
+                               resolution: Optional[str] = None) -> AsyncGenerator[bytes, None]:
+        """
+        Đăng ký viewer vào pipeline của camera, yield JPEG bytes đã annotate
+
+        quality/resolution mặc định lấy từ camera.stream_settings
+        """
+        await self.start_stream(camera_id, camera)
+        stream = self.active_streams.get(camera_id)
+        if not stream or "broadcaster" not in stream:
+            return
+        stream_settings = camera.stream_settings or {}
+        tier = resolve_tier(quality or stream_settings.get("quality"),
+                            resolution or stream_settings.get("resolution"))
+        async for frame_bytes in stream["broadcaster"].subscribe(tier):
+            yield frame_bytes
+
+    async def _run_pipeline(self, camera_id: str, camera: CameraResponse):
+        """Producer của camera: đọc frame, AI theo adaptive interval, encode JPEG theo tier và publish cho mọi viewer"""
+        stream = self.active_streams[camera_id]
+        capture = stream["capture"]
+        inference_capture = stream.get("inference_capture")
+        last_seq = 0
+        broadcaster = stream["broadcaster"]
+        interval_controller = AdaptiveIntervalController(camera_id)
+        stream["interval_controller"] = interval_controller
+        last_frame_time = time.time()
+        motion_gate = motion_gate_service.get_gate(camera_id, camera.stream_settings) if camera.detection_enabled else None
+        try:
+            while stream.get("is_active"):
+                ref = capture.slot.acquire(last_seq)
+                if ref is not None:
+                    # Annotate trên buffer riêng của pipeline - frame trong capture ring giữ nguyên
+                    # cho raw viewer / enrollment đọc chung capture, buffer ring trả lại ngay
+                    with ref:
+                        frame, last_seq = self._annotation_buffer(stream, ref.frame), ref.seq
+                    last_frame_time = time.time()
+                else:
+                    if time.time() - last_frame_time < 1:
+                        await asyncio.sleep(0.005)
+                        continue
+                    status = "Offline" if capture.state == CAPTURE_OFFLINE else "No Signal"
+                    frame = self._create_dummy_frame(f"Camera {camera.name} - {status}")
+                    last_frame_time = time.time()
+                inference_ref = None
+                try:
+                    # Chỉ xử lý AI theo interval (và khi có chuyển động), các frame còn lại chỉ vẽ lại kết quả AI cũ
+                    run_ai = camera.detection_enabled and interval_controller.tick()
+                    if run_ai or (camera.detection_enabled and "last_detections" not in stream):
+                        if inference_capture is not None and ref is not None:
+                            inference_ref = inference_capture.slot.acquire()
+                    inference_frame = inference_ref.frame if inference_ref is not None else None
+                    if run_ai and motion_gate is not None and "last_detections" in stream:
+                        gate_frame = inference_frame if inference_frame is not None else frame
+                        run_ai = motion_gate.should_process(gate_frame, stream.get("last_face_count", 0) > 0)
+                    if run_ai or (camera.detection_enabled and "last_detections" not in stream):
+                        processed_frame = await self._process_frame(frame, camera_id, camera, inference_frame)
+                        stream.setdefault("last_detections", [])  # Frame bị bỏ / lỗi detection vẫn tính là đã chạy
+                    else:
+                        processed_frame = self._draw_cached_overlay(frame, camera_id, camera)
+                    # Chỉ encode rendition của các tier đang có viewer (không có viewer thì bỏ qua encode),
+                    # cộng frame nhỏ cho clip ring buffer theo clip_fps - tất cả song song trên encode pool
+                    renditions = {tier: (STREAM_TIERS[tier]["max_width"], tier_quality(tier))
+                                  for tier in broadcaster.active_tiers()}
+                    if clip_recorder.wants_frame(camera_id):
+                        renditions["clip"] = clip_recorder.rendition
+                    if renditions:
+                        frames = await frame_encoder.encode_renditions(processed_frame, renditions)
+                        clip_frame = frames.pop("clip", None)
+                        if clip_frame:
+                            clip_recorder.add_frame(camera_id, clip_frame)
+                        if frames:
+                            await broadcaster.publish(frames)
+                finally:
+                    # Frame đã annotate mới nhất cho snapshot (buffer còn lại nhận frame kế tiếp)
+                    if ref is not None:
+                        stream["last_processed"] = frame
+                    if inference_ref is not None:
+                        inference_ref.release()
+                await asyncio.sleep(0.001)  # sleep rất nhỏ để tránh block event loop
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"❌ Error in stream pipeline for camera {camera_id}: {e}")
+            stream["is_active"] = False
+            await broadcaster.close()
+
+    @staticmethod
+    def _annotation_buffer(stream: Dict[str, Any], source: np.ndarray) -> np.ndarray:
+        """Copy frame vào buffer annotate của stream - 2 buffer luân phiên, chỉ cấp phát lại khi đổi shape"""
+        buffers = stream.setdefault("annotate_buffers", [None, None])
+        index = stream["annotate_index"] = 1 - stream.get("annotate_index", 1)
+        buffer = buffers[index]
+        if buffer is None or buffer.shape != source.shape or buffer.dtype != source.dtype:
+            buffer = buffers[index] = np.empty_like(source)
+        np.copyto(buffer, source)
+        return buffer
+
+    @staticmethod
+    def _scale_detections(detections: List[Dict[str, Any]], from_shape, to_shape):
+        """Scale bbox [x, y, w, h] từ frame substream về frame main stream"""
+        scale_x = to_shape[1] / from_shape[1]
+        scale_y = to_shape[0] / from_shape[0]
+        if scale_x == 1 and scale_y == 1:
+            return
+        for detection in detections:
+            x, y, w, h = detection.get('bbox', [0, 0, 0, 0])
+            detection['bbox'] = [int(x * scale_x), int(y * scale_y), int(w * scale_x), int(h * scale_y)]
+
+    def _draw_stream_overlay(self, frame: np.ndarray, camera_id: str, camera: CameraResponse):
+        """Vẽ FPS, tên camera và thời gian lên frame"""
+        current_time = time.time()
+        last_time = self._frame_times.get(camera_id)
+        fps = 1.0 / max(current_time - last_time, 1e-6) if last_time else 0
+        self._frame_times[camera_id] = current_time
+        cv2.putText(frame, f"FPS: {fps:.2f}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
+        cv2.putText(frame, f"Camera: {camera.name}", (10, 70), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+        timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
+        cv2.putText(frame, timestamp, (10, frame.shape[0] - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
+
+    def _draw_cached_overlay(self, frame: np.ndarray, camera_id: str, camera: CameraResponse) -> np.ndarray:
+        """Frame không chạy AI: vẽ lại kết quả detection gần nhất lên frame hiện tại"""
+        self._draw_stream_overlay(frame, camera_id, camera)
+        if not camera.detection_enabled:
+            cv2.putText(frame, "DETECTION: OFF", (frame.shape[1] - 150, 30),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 1)
+            return frame
+        detections = self.active_streams.get(camera_id, {}).get("last_detections") or []
+        cv2.putText(frame, "DETECTION: ON", (frame.shape[1] - 150, 30),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
+        overlay_renderer.draw_detections(frame, detections)
+        cv2.putText(frame, f"Faces: {len(detections)}", (frame.shape[1] - 150, 60),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 255), 1)
+        return frame
+
+    async def _process_frame(self, frame: np.ndarray, camera_id: str, camera: CameraResponse,
+                             inference_frame: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Chạy detection rồi vẽ overlay trực tiếp lên frame
+
+        frame là buffer annotate của pipeline (không phải frame trong capture ring).
+        Overlay vẽ sau inference để detector không thấy chữ trên frame.
+        inference_frame: frame substream (độ phân giải thấp) dùng cho detection,
+        bbox được scale về kích thước của frame.
+        """
         try:
-            # Tính FPS giống code mẫu
-            current_time = time.time()
-            if not hasattr(self, '_frame_times'):
-                self._frame_times = {}
-            
-            if camera_id not in self._frame_times:
-                self._frame_times[camera_id] = current_time
-                fps = 0
-            else:
-                fps = 1.0 / (current_time - self._frame_times[camera_id])
-                self._frame_times[camera_id] = current_time
-            
-            # Hiển thị FPS lên góc trên bên trái giống code mẫu
-            cv2.putText(frame, f"FPS: {fps:.2f}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
-            
-            # Add camera name
-            cv2.putText(frame, f"Camera: {camera.name}", (10, 70), 
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-            
-            # Add timestamp
-            timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
-            cv2.putText(frame, timestamp, (10, frame.shape[0] - 10), 
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
-            
             # Face detection và recognition giống code mẫu
             if camera.detection_enabled:
-                cv2.putText(frame, "DETECTION: ON", (frame.shape[1] - 150, 30), 
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
-                
                 try:
-                    # Load known persons for recognition
-                    known_persons = await self._get_known_persons_for_camera(camera_id)
+                    # Gallery index của owner camera (build một lần, cập nhật theo PersonService)
+                    gallery = await self._get_gallery_for_camera(camera_id)
                     
-                    # Phát hiện và nhận dạng khuôn mặt với detection tracking
-                    detections = await face_processor.detect_and_recognize_faces(frame, known_persons)
+                    # Phát hiện và nhận dạng khuôn mặt qua scheduler chung (batch với các camera khác)
+                    inference_start = time.time()
+                    detections = await inference_scheduler.submit(
+                        camera_id, inference_frame if inference_frame is not None else frame, gallery
+                    )
+                    if detections and inference_frame is not None:
+                        self._scale_detections(detections, inference_frame.shape, frame.shape)
+                    stream = self.active_streams.get(camera_id)
+                    if stream and stream.get("interval_controller"):
+                        stream["interval_controller"].record(
+                            latency=time.time() - inference_start,
+                            faces=len(detections) if detections else 0,
+                            dropped=detections is None,
+                            queue_load=inference_scheduler.queue_depth / max(inference_scheduler.max_queue_depth, 1)
+                        )
+                    skipped = detections is None
+                    if skipped:
+                        # Frame bị bỏ do scheduler quá tải / frame đã cũ
+                        detections = []
+                    elif camera_id in self.active_streams:
+                        # Motion gate vẫn chạy detection khi frame trước còn khuôn mặt;
+                        # các frame không chạy AI vẽ lại detections này
+                        self.active_streams[camera_id]["last_face_count"] = len(detections)
+                        self.active_streams[camera_id]["last_detections"] = detections
                     
                     # Sử dụng detection_tracker để quyết định có lưu detection hay không
-                    for detection in detections:
+                    face_crops: Dict[int, np.ndarray] = {}
+                    for index, detection in enumerate(detections):
                         person_name = detection.get('person_name', 'Unknown')
                         person_id = detection.get('person_id')
                         confidence = detection.get('confidence', 0)
@@ -228,53 +350,49 @@ class StreamProcessor:
                         # Sử dụng detection_tracker để quyết định có lưu hay không
                         should_save = detection_tracker.track_detection(
                             camera_id=camera_id,
-                            person_id=person_id or f"unknown_{int(time.time())}",
+                            person_id=person_id or detection.get('stranger_id') or detection.get('track_id') or f"unknown_{int(time.time())}",
                             person_name=person_name,
                             detection_type=detection_type,
                             confidence=confidence
                         )
                         
-                        # Đánh dấu nếu cần lưu detection này
+                        # Đánh dấu nếu cần lưu detection này (event_id: khóa idempotent khi lưu)
                         detection['should_save'] = should_save
+                        if should_save:
+                            detection['event_id'] = uuid.uuid4().hex
+                            # Crop khuôn mặt trước khi vẽ bất kỳ overlay nào (FPS, thời gian, bbox/label) lên frame
+                            face_crop = self._crop_face(frame, detection.get('bbox'))
+                            if face_crop is not None:
+                                face_crops[index] = face_crop
                         detection['detection_type'] = detection_type
                     
+                    self._draw_stream_overlay(frame, camera_id, camera)
+                    cv2.putText(frame, "DETECTION: ON", (frame.shape[1] - 150, 30), 
+                               cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
+                    if skipped:
+                        cv2.putText(frame, "DETECTION: SKIPPED", (frame.shape[1] - 150, 50), 
+                                   cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 165, 255), 1)
+                    
+                    # Vẽ tất cả bbox + label trong một lượt (label cache, chỉ blend vùng nhỏ)
+                    overlay_renderer.draw_detections(frame, detections)
+                    
+                    # Snapshot dùng chung cho email và ảnh detection (mode "frame") / ảnh context - JPEG chỉ encode một lần.
+                    # Chỉ copy frame khi có detection được lưu hoặc có người lạ (email) - snapshot sống lâu hơn buffer annotate
+                    needs_snapshot = any(
+                        detection.get('should_save') or detection['detection_type'] == 'stranger'
+                        for detection in detections
+                    )
+                    snapshot = EncodedFrame(frame.copy()) if needs_snapshot else None
+                    
                     # ===== PHÂN TÍCH KHUNG HÌNH CHO EMAIL NOTIFICATION =====
-                    await self._analyze_frame_for_notifications(camera_id, detections, frame)
-                
-                    # Vẽ các khuôn mặt đã phát hiện và nhận dạng giống code mẫu
-                    for detection in detections:
-                        # Lấy bounding box
-                        x, y, w, h = detection.get('bbox', [0, 0, 0, 0])
-                        x1, y1, x2, y2 = x, y, x + w, y + h
-                        
-                        # Nhận dạng khuôn mặt
-                        name = detection.get('person_name', 'Unknown')
-                        confidence = detection.get('confidence', 0)
-                        
-                        # Màu khác nhau cho người đã biết và không xác định giống code mẫu
-                        if name == "Unknown":
-                            color = (0, 0, 255)  # Đỏ cho người lạ
-                        else:
-                            color = (0, 255, 0)  # Xanh lá cho người đã biết
-                        
-                        # Vẽ bounding box
-                        cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
-                        
-                        # Thêm tên và độ tin cậy giống code mẫu - sử dụng UTF-8 text
-                        label = f"{name} ({confidence:.2f})"
-                        
-                        # Sử dụng function UTF-8 để vẽ tiếng Việt đúng
-                        frame = self._draw_utf8_text(frame, label, (x1, y1 - 30), 
-                                                   font_scale=0.8, color=color, thickness=2)
-                        
+                    await self._analyze_frame_for_notifications(camera_id, detections, snapshot)
+                    
+                    for index, detection in enumerate(detections):
                         # Chỉ lưu và gửi alert nếu detection_tracker cho phép
                         if detection.get('should_save'):
-                            # Get region of interest (face crop)
-                            x, y, w, h = detection.get('bbox', [0, 0, 0, 0])
-                            face_frame = frame.copy()
                             # Chạy background task để không block video stream
                             detection_task = asyncio.create_task(
-                                self._send_detection_alert(camera_id, detection, face_frame)
+                                self._send_detection_alert(camera_id, detection, snapshot, face_crops.get(index))
                             )
                             detection_task.add_done_callback(lambda t: None if not t.exception() else print(f"❌ Detection alert error: {t.exception()}"))
                     
@@ -285,9 +403,11 @@ class StreamProcessor:
                     
                 except Exception as detection_error:
                     print(f"Face detection error: {detection_error}")
+                    self._draw_stream_overlay(frame, camera_id, camera)
                     cv2.putText(frame, "DETECTION: ERROR", (frame.shape[1] - 150, 30), 
                                cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 1)
             else:
+                self._draw_stream_overlay(frame, camera_id, camera)
                 cv2.putText(frame, "DETECTION: OFF", (frame.shape[1] - 150, 30), 
                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 1)
             
@@ -297,6 +417,22 @@ class StreamProcessor:
             print(f"Error processing frame: {e}")
             return frame
 
+    def _crop_face(self, frame: np.ndarray, bbox) -> Optional[np.ndarray]:
+        """Copy vùng bbox [x, y, w, h] (nới theo detection_crop_padding) - None nếu mode lưu cả frame"""
+        settings = get_settings()
+        if settings.detection_image_mode == "frame" or not bbox:
+            return None
+        x, y, w, h = map(int, bbox[:4])
+        if w <= 0 or h <= 0:
+            return None
+        pad_x = int(w * settings.detection_crop_padding)
+        pad_y = int(h * settings.detection_crop_padding)
+        x1, y1 = max(x - pad_x, 0), max(y - pad_y, 0)
+        x2, y2 = min(x + w + pad_x, frame.shape[1]), min(y + h + pad_y, frame.shape[0])
+        if x2 <= x1 or y2 <= y1:
+            return None
+        return frame[y1:y2, x1:x2].copy()
+
     def _create_dummy_frame(self, message: str = "No Camera") -> np.ndarray:
         """Create dummy frame when camera is not available"""
         frame = np.zeros((480, 640, 3), dtype=np.uint8)
@@ -309,8 +445,7 @@ class StreamProcessor:
         """Generate dummy frames for testing"""
         while True:
             frame = self._create_dummy_frame("Demo Camera - No Real Camera Connected")
-            _, buffer = cv2.imencode('.jpg', frame)
-            frame_bytes = buffer.tobytes()
+            frame_bytes = await frame_encoder.encode(frame, 95)
             
             yield (b'--frame\r\n'
                    b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
@@ -319,42 +454,65 @@ class StreamProcessor:
 
     async def _generate_error_frames(self, error_message: str) -> AsyncGenerator[bytes, None]:
         """Generate error frames"""
+        # Frame lỗi giống nhau - encode một lần cho cả 10 frame
+        frame_bytes = await frame_encoder.encode(self._create_dummy_frame(f"Error: {error_message}"), 95)
         for _ in range(10):  # Show error for a few frames
-            frame = self._create_dummy_frame(f"Error: {error_message}")
-            _, buffer = cv2.imencode('.jpg', frame)
-            frame_bytes = buffer.tobytes()
-            
             yield (b'--frame\r\n'
                    b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
             
             await asyncio.sleep(1/5)  # 5 FPS for error
 
+    async def get_live_frame(self, camera_id: str, annotated: bool = True,
+                             timeout: float = 0.5) -> Optional[np.ndarray]:
+        """
+        Copy frame mới nhất của stream đang chạy (None nếu camera không stream / mất tín hiệu)
+
+        annotated=True: frame pipeline vừa xử lý xong (có bbox, overlay).
+        annotated=False: frame gốc mới nhất trong capture ring (pipeline không vẽ lên ring) -
+        chờ tối đa timeout nếu chưa có frame.
+        """
+        stream = self.active_streams.get(camera_id)
+        if not stream or not stream.get("is_active") or not stream.get("capture"):
+            return None
+        capture = stream["capture"]
+        if not capture.is_live:
+            return None
+
+        if annotated:
+            frame = stream.get("last_processed")
+            # Copy đồng bộ trong event loop - pipeline chỉ vẽ lên buffer còn lại
+            return frame.copy() if frame is not None else None
+
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            ref = capture.slot.acquire()
+            if ref is not None:
+                with ref:
+                    return ref.frame.copy()
+            await asyncio.sleep(0.005)
+        return None
+
     async def capture_snapshot(self, camera_id: str, camera: CameraResponse) -> Optional[bytes]:
-        """Chụp ảnh snapshot từ camera"""
+        """Chụp ảnh snapshot từ camera - ưu tiên frame của stream đang chạy"""
         try:
-            if camera.camera_type == "webcam":
-                cap = cv2.VideoCapture(0)
-            elif camera.camera_url:
-                cap = cv2.VideoCapture(camera.camera_url)
-            else:
-                cap = cv2.VideoCapture(0)
+            frame = await self.get_live_frame(camera_id, annotated=True)
+            if frame is not None:
+                return await frame_encoder.encode(frame, 90)
             
-            if not cap.isOpened():
+            # Camera không stream: đọc qua capture pool (giữ kết nối giữa các snapshot, đóng khi idle)
+            loop = asyncio.get_event_loop()
+            frame = await loop.run_in_executor(
+                self.executor, capture_pool.read_frame, camera_id, lambda: capture_factory.open_camera(camera)
+            )
+            
+            if frame is None:
                 # Return dummy image
                 frame = self._create_dummy_frame(f"Snapshot - {camera.name}")
-                _, buffer = cv2.imencode('.jpg', frame)
-                return buffer.tobytes()
-            
-            ret, frame = cap.read()
-            cap.release()
+                return await frame_encoder.encode(frame, 95)
             
-            if ret:
-                # Process frame
-                frame = await self._process_frame(frame, camera_id, camera)
-                _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 90])
-                return buffer.tobytes()
-            else:
-                return None
+            # Process frame
+            frame = await self._process_frame(frame, camera_id, camera)
+            return await frame_encoder.encode(frame, 90)
                 
         except Exception as e:
             print(f"Error capturing snapshot: {e}")
@@ -366,11 +524,17 @@ class StreamProcessor:
             stream = self.active_streams[camera_id]
             return {
                 "is_streaming": stream.get("is_active", False),
-                "is_recording": False,  # TODO: Implement recording
-                "viewers_count": stream.get("viewers_count", 0),
+                "is_recording": clip_recorder.is_recording(camera_id),
+                "viewers_count": self._get_viewers_count(stream),
                 "uptime": time.time() - stream.get("start_time", time.time()),
                 "frame_rate": 30,  # TODO: Calculate actual FPS
-                "resolution": "640x480"  # TODO: Get actual resolution
+                "resolution": "640x480",  # TODO: Get actual resolution
+                "detection_interval": stream["interval_controller"].get_stats() if stream.get("interval_controller") else None,
+                "motion_gate": motion_gate_service.get_stats(camera_id),
+                "stream_tiers": stream["broadcaster"].get_stats() if stream.get("broadcaster") else None,
+                "health": stream["capture"].state if stream.get("capture") else None,
+                "capture": stream["capture"].get_status() if stream.get("capture") else None,
+                "clip_recorder": clip_recorder.get_stats(camera_id)
             }
         else:
             return {
@@ -379,28 +543,25 @@ class StreamProcessor:
                 "viewers_count": 0,
                 "uptime": 0,
                 "frame_rate": 0,
-                "resolution": "Unknown"
+                "resolution": "Unknown",
+                "health": CAPTURE_OFFLINE
             }
 
-    async def _send_detection_alert(self, camera_id: str, detection: Dict[str, Any], frame: np.ndarray = None):
+    async def _send_detection_alert(self, camera_id: str, detection: Dict[str, Any], frame: EncodedFrame = None,
+                                    face_crop: Optional[np.ndarray] = None):
         """Send detection alert via WebSocket and save to database"""
         try:
-            # Get camera name
-            from ..database import get_database
-            from bson import ObjectId
+            camera_info = await self._get_camera_info(camera_id)
+            camera_name = camera_info["name"] if camera_info else "Unknown Camera"
             
-            db = get_database()
-            camera_data = await db.cameras.find_one({"_id": ObjectId(camera_id)})
-            camera_name = camera_data.get("name", "Unknown Camera") if camera_data else "Unknown Camera"
-            
-            # Save to database using both methods for compatibility
+            # Một đường lưu duy nhất: một file ảnh + một detection log cho mỗi event
             detection_id = None
-            if frame is not None:
-                # Use both detection optimizer and normal save for compatibility
-                detection_id = await self._save_optimized_detection(camera_id, camera_name, detection, frame)
-                if not detection_id:
-                    # Fallback to traditional method if optimizer fails
-                    detection_id = await self._save_detection_to_database(camera_id, camera_name, detection, frame)
+            if frame is not None and camera_info:
+                detection_id = await self._persist_detection(camera_id, camera_info, detection, frame, face_crop)
+            
+            # Người lạ: ghi clip trước/sau sự kiện và gắn vào detection log
+            if detection.get('detection_type') == "stranger":
+                clip_recorder.trigger(camera_id, detection_id)
             
             # Create WebSocket message
             alert_message = {
@@ -412,6 +573,7 @@ class StreamProcessor:
                     "detection_type": detection.get('detection_type', 'unknown'),
                     "person_id": detection.get('person_id'),
                     "person_name": detection.get('person_name', 'Unknown'),
+                    "stranger_id": detection.get('stranger_id'),
                     "confidence": detection.get('confidence', 0),
                     "timestamp": time.time(),
                     "bbox": detection.get('bbox')
@@ -430,262 +592,144 @@ class StreamProcessor:
         except Exception as e:
             print(f"Error sending detection alert: {e}")
 
-    async def _get_known_persons_for_camera(self, camera_id: str) -> List[dict]:
-        """Get known persons data for face recognition"""
+    async def _get_camera_info(self, camera_id: str) -> Optional[Dict[str, str]]:
+        """Lấy user_id owner + tên camera (cache theo camera_id, xóa khi stream dừng)"""
+        if camera_id in self._camera_info:
+            return self._camera_info[camera_id]
         try:
-            # Import here to avoid circular imports
             from ..database import get_database
             from bson import ObjectId
             
             db = get_database()
-            known_persons = []
-            
-            print(f"🔵 Loading known persons for camera {camera_id}...")
-            
-            # Get all known persons (you might want to filter by camera or user)
-            async for person_data in db.known_persons.find({"is_active": True}):
-                # Convert embeddings - backend lưu trong field 'face_embeddings'
-                embeddings = []
-                if 'face_embeddings' in person_data and person_data['face_embeddings']:
-                    for emb_data in person_data['face_embeddings']:
-                        if isinstance(emb_data, str) and emb_data:
-                            # If stored as base64, decode it
-                            try:
-                                emb_bytes = base64.b64decode(emb_data)
-                                emb_array = np.frombuffer(emb_bytes, dtype=np.float32)
-                                embeddings.append(emb_array)
-                            except Exception as e:
-                                print(f"Error decoding base64 embedding: {e}")
-                        elif isinstance(emb_data, list) and emb_data:
-                            # If stored as list, convert to numpy array
-                            try:
-                                embeddings.append(np.array(emb_data, dtype=np.float32))
-                            except Exception as e:
-                                print(f"Error converting list to array: {e}")
-                
-                if embeddings:
-                    # Đảm bảo name được encode/decode đúng UTF-8
-                    person_name = person_data['name']
-                    if isinstance(person_name, bytes):
-                        person_name = person_name.decode('utf-8')
-                    elif not isinstance(person_name, str):
-                        person_name = str(person_name)
-                    
-                    known_persons.append({
-                        'id': str(person_data['_id']),
-                        'name': person_name,
-                        'embeddings': embeddings
-                    })
-                    print(f"✅ Loaded person: {person_name} with {len(embeddings)} embeddings")
-                else:
-                    person_name = person_data['name']
-                    if isinstance(person_name, bytes):
-                        person_name = person_name.decode('utf-8')
-                    print(f"⚠️ Person {person_name} has no valid embeddings")
-            
-            print(f"✅ Loaded {len(known_persons)} known persons for recognition")
-            return known_persons
-            
+            camera_data = await db.cameras.find_one({"_id": ObjectId(camera_id)}, {"user_id": 1, "name": 1})
         except Exception as e:
-            print(f"❌ Error loading known persons: {e}")
-            import traceback
-            traceback.print_exc()
-            return []
+            print(f"❌ Error loading camera info for {camera_id}: {e}")
+            return None
+        if not camera_data or not camera_data.get("user_id"):
+            print(f"❌ Camera not found or has no owner: {camera_id}")
+            return None
+        info = {
+            "user_id": str(camera_data["user_id"]),
+            "name": camera_data.get("name", "Unknown Camera")
+        }
+        self._camera_info[camera_id] = info
+        return info
 
-    async def _save_detection_to_database(self, camera_id: str, camera_name: str, detection: Dict[str, Any], frame: np.ndarray):
-        """Save detection to database"""
+    async def _get_camera_owner(self, camera_id: str) -> Optional[str]:
+        """Lấy user_id owner của camera"""
+        info = await self._get_camera_info(camera_id)
+        return info["user_id"] if info else None
+
+    async def _get_gallery_for_camera(self, camera_id: str) -> Optional[FaceGalleryIndex]:
+        """Lấy FAISS gallery index của owner camera"""
+        user_id = await self._get_camera_owner(camera_id)
+        if not user_id:
+            return None
+        return await face_gallery_service.get_gallery(user_id)
+
+    async def _get_known_persons_for_camera(self, camera_id: str) -> List[dict]:
+        """Get known persons (embeddings đã decode) của owner camera từ KnownPersonCache"""
         try:
-            # Import here to avoid circular imports
-            from ..database import get_database
-            from bson import ObjectId
-            from ..models.detection_log import DetectionLogCreate
-            import base64
-            import uuid
-            import os
-            from datetime import datetime
-            
-            # Get camera info
-            db = get_database()
-            camera_data = await db.cameras.find_one({"_id": ObjectId(camera_id)})
-            if not camera_data:
-                print(f"❌ Camera not found: {camera_id}")
-                return None
-                
-            user_id = str(camera_data.get("user_id", ""))
+            user_id = await self._get_camera_owner(camera_id)
             if not user_id:
-                print(f"❌ No user_id found for camera: {camera_id}")
-                return None
-            
-            # Convert frame to base64 for storage
-            _, img_encoded = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 90])
-            img_base64 = base64.b64encode(img_encoded.tobytes()).decode('utf-8')
-            
-            # Create detection document
-            detection_type = "known_person" if detection.get("person_name") != "Unknown" else "stranger"
-            
-            # Ensure uploads directory exists
-            upload_dir = "uploads/detections"
-            os.makedirs(upload_dir, exist_ok=True)
-            
-            # Save image to file
-            image_filename = f"detection_{uuid.uuid4()}.jpg"
-            image_path = os.path.join(upload_dir, image_filename)
-            with open(image_path, 'wb') as f:
-                f.write(img_encoded.tobytes())
-                
-            # Create database entry
-            detection_type = detection.get("detection_type", "unknown")
-            detection_doc = {
-                "user_id": ObjectId(user_id),
-                "camera_id": ObjectId(camera_id),
-                "detection_type": detection_type,
-                "person_id": ObjectId(detection.get("person_id")) if detection.get("person_id") else None,
-                "person_name": detection.get("person_name", "Unknown"),
-                "confidence": float(detection.get("confidence", 0)),
-                "similarity_score": float(detection.get("recognition_confidence", 0)),
-                "image_path": image_path,
-                "bbox": detection.get("bbox", [0, 0, 0, 0]),
-                "timestamp": datetime.utcnow(),
-                "is_alert_sent": detection_type in ["stranger", "unknown"],  # ✅ FIXED: True for alerts, False for known persons
-                "alert_sent": detection_type in ["stranger", "unknown"],  # ✅ FIXED: Compatibility field
-                "alert_methods": ["websocket"] if detection_type in ["stranger", "unknown"] else [],
-                "metadata": {
-                    "created_by": "stream_processor",
-                    "detection_source": "live_stream"
-                }
-            }
-            
-            # Insert to database
-            result = await db.detection_logs.insert_one(detection_doc)
-            detection_id = str(result.inserted_id)
-            
-            print(f"✅ Saved detection to database: {detection_id}, type: {detection_type}")
-            return detection_id
-            
+                return []
+            return await known_person_cache.get_persons(user_id)
         except Exception as e:
-            import traceback
-            print(f"❌ Error saving detection to database: {e}")
-            traceback.print_exc()
-            return None
+            print(f"❌ Error loading known persons: {e}")
+            return []
+
+    async def _persist_detection(self, camera_id: str, camera_info: Dict[str, str], detection: Dict[str, Any],
+                                 frame: EncodedFrame, face_crop: Optional[np.ndarray] = None) -> Optional[str]:
+        """
+        Lưu một detection event: encode JPEG một lần, ghi file một lần, insert một lần
+
+        Idempotent theo detection['event_id'] - gọi lại cho cùng event (retry, alert
+        gửi hai lần) trả về detection_id đã có thay vì ghi thêm file/row.
+        """
+        event_id = detection.get("event_id")
+        if event_id is None:
+            return await self._persist_detection_once(camera_id, camera_info, detection, frame, face_crop)
+
+        future = self._persisted_events.get(event_id)
+        if future is None:
+            future = asyncio.ensure_future(
+                self._persist_detection_once(camera_id, camera_info, detection, frame, face_crop)
+            )
+            self._persisted_events[event_id] = future
+            while len(self._persisted_events) > self.PERSISTED_EVENTS_MAX:
+                self._persisted_events.popitem(last=False)
+        return await asyncio.shield(future)
 
-    async def _save_optimized_detection(self, camera_id: str, camera_name: str, detection: Dict[str, Any], frame: np.ndarray):
-        """Lưu detection sử dụng Detection Optimizer Service"""
+    async def _persist_detection_once(self, camera_id: str, camera_info: Dict[str, str], detection: Dict[str, Any],
+                                      frame: EncodedFrame, face_crop: Optional[np.ndarray]) -> Optional[str]:
+        from datetime import datetime
+        from ..routers.detection_optimizer import detection_optimizer
+
+        settings = get_settings()
+        image_path = thumbnail_path = context_path = None
         try:
-            # Import here to avoid circular imports
-            from ..database import get_database
-            from bson import ObjectId
-            import base64
-            import os
-            import uuid
-            from datetime import datetime
-            
-            # Get camera info
-            db = get_database()
-            camera_data = await db.cameras.find_one({"_id": ObjectId(camera_id)})
-            if not camera_data:
-                print(f"❌ Camera not found: {camera_id}")
-                return None
-                
-            user_id = str(camera_data.get("user_id", ""))
-            if not user_id:
-                print(f"❌ No user_id found for camera: {camera_id}")
-                return None
-            
-            # Convert frame to base64 for storage
-            _, img_encoded = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 90])
-            img_base64 = base64.b64encode(img_encoded.tobytes()).decode('utf-8')
-            
-            # Create detection document
-            detection_type = "known_person" if detection.get("person_name") != "Unknown" else "stranger"
-            
-            # Ensure uploads directory exists
-            upload_dir = "uploads/detections"
-            os.makedirs(upload_dir, exist_ok=True)
-            
-            # Save image to file
-            image_filename = f"detection_{uuid.uuid4()}.jpg"
-            image_path = os.path.join(upload_dir, image_filename)
-            with open(image_path, 'wb') as f:
-                f.write(img_encoded.tobytes())
-            
-            # Prepare detection data for optimizer
+            if face_crop is not None:
+                # Chỉ lưu vùng khuôn mặt (+ frame toàn cảnh thu nhỏ, quality thấp nếu bật)
+                image_bytes = await frame_encoder.encode(face_crop, settings.detection_jpeg_quality)
+                image_path, thumbnail_path = await image_storage.save(image_bytes, camera_id, face_crop)
+                if settings.detection_image_mode == "crop_with_context":
+                    context = await frame_encoder.encode_renditions(frame.frame, {
+                        "context": (settings.detection_context_width, settings.detection_context_quality)
+                    })
+                    if context:
+                        context_path, _ = await image_storage.save(
+                            context["context"], thumbnail=False,
+                            image_path=image_storage.companion_path(image_path, "context")
+                        )
+            else:
+                # JPEG dùng chung với email / các detection khác của cùng frame
+                image_bytes = await frame.jpeg(settings.detection_jpeg_quality)
+                image_path, thumbnail_path = await image_storage.save(image_bytes, camera_id, frame.frame)
+
             detection_data = {
-                "user_id": user_id,
+                "user_id": camera_info["user_id"],
                 "camera_id": camera_id,
-                "detection_type": detection_type,
+                "detection_type": detection.get("detection_type", "unknown"),
                 "person_id": detection.get("person_id"),
                 "person_name": detection.get("person_name", "Unknown"),
+                "stranger_id": detection.get("stranger_id"),
                 "confidence": float(detection.get("confidence", 0)),
                 "similarity_score": float(detection.get("recognition_confidence", 0)),
                 "image_path": image_path,
+                "thumbnail_path": thumbnail_path,
+                "context_image_path": context_path,
                 "bbox": detection.get("bbox", [0, 0, 0, 0]),
                 "timestamp": datetime.utcnow(),
                 "is_alert_sent": True,
                 "alert_methods": ["websocket"],
-                "notes": f"Detected by {camera_name}"
+                "notes": f"Detected by {camera_info['name']}"
             }
-            
-            try:
-                # Use the existing detection optimizer from router
-                from ..routers.detection_optimizer import detection_optimizer
-                
-                if detection_optimizer is not None:
-                    # Process detection with optimizer
-                    detection_id = await detection_optimizer.process_detection(detection_data)
-                else:
-                    # Fall back to traditional save if optimizer isn't available
-                    print("⚠️ Detection optimizer service not available, falling back to traditional save")
-                    detection_id = None  # Will be saved by the original method
-            except Exception as optimizer_error:
-                print(f"⚠️ Error using detection optimizer: {optimizer_error}")
-                detection_id = None  # Will be saved by the original method
-            
+
+            # Optimizer của router chưa khởi tạo (startup chưa chạy): dùng instance riêng
+            optimizer = detection_optimizer
+            if optimizer is None:
+                if self._fallback_optimizer is None:
+                    self._fallback_optimizer = DetectionOptimizerService()
+                optimizer = self._fallback_optimizer
+
+            # detection_tracker đã lọc nên luôn lưu; optimizer chỉ gom session
+            detection_id = await optimizer.process_detection(detection_data, always_save=True)
             if detection_id:
-                print(f"✅ Optimized detection saved: {detection.get('person_name')} - ID: {detection_id}")
-            
-            return detection_id
-            
+                print(f"✅ Detection persisted: {detection.get('person_name')} - ID: {detection_id}")
+                return detection_id
         except Exception as e:
-            print(f"❌ Error saving optimized detection: {e}")
-            import traceback
-            traceback.print_exc()
-            return None
+            print(f"❌ Error persisting detection: {e}")
+
+        # Insert thất bại: không để lại file mồ côi
+        if image_path:
+            await image_storage.delete(image_path, thumbnail_path, context_path)
+        return None
 
     def _draw_utf8_text(self, frame: np.ndarray, text: str, position: tuple, 
                        font_scale: float = 0.8, color: tuple = (0, 255, 0), thickness: int = 2) -> np.ndarray:
-        """Draw UTF-8 text (including Vietnamese) on frame using PIL"""
+        """Draw UTF-8 text (including Vietnamese) on frame - dùng label cache của OverlayRenderer"""
         try:
-            # Convert OpenCV frame (BGR) to PIL Image (RGB)
-            frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            pil_image = Image.fromarray(frame_rgb)
-            draw = ImageDraw.Draw(pil_image)
-            
-            # Try to load a font that supports Vietnamese characters
-            font_size = int(20 * font_scale)
-            try:
-                # Try to use a system font that supports Vietnamese
-                if os.name == 'nt':  # Windows
-                    font_path = "C:/Windows/Fonts/arial.ttf"
-                else:  # Linux/Mac
-                    font_path = "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"
-                
-                if os.path.exists(font_path):
-                    font = ImageFont.truetype(font_path, font_size)
-                else:
-                    font = ImageFont.load_default()
-            except:
-                font = ImageFont.load_default()
-            
-            # Convert BGR color to RGB for PIL
-            pil_color = (color[2], color[1], color[0])
-            
-            # Draw text with PIL
-            draw.text(position, text, font=font, fill=pil_color)
-            
-            # Convert back to OpenCV format (RGB to BGR)
-            frame_with_text = cv2.cvtColor(np.array(pil_image), cv2.COLOR_RGB2BGR)
-            return frame_with_text
-            
+            return overlay_renderer.draw_text(frame, text, position, font_scale=font_scale, color=color)
         except Exception as e:
             print(f"Error drawing UTF-8 text: {e}")
             # Fallback to ASCII-only version if UTF-8 fails
@@ -693,7 +737,7 @@ class StreamProcessor:
             cv2.putText(frame, ascii_text, position, cv2.FONT_HERSHEY_SIMPLEX, font_scale, color, thickness)
             return frame
 
-    async def _analyze_frame_for_notifications(self, camera_id: str, detections: List[Dict[str, Any]], frame: np.ndarray):
+    async def _analyze_frame_for_notifications(self, camera_id: str, detections: List[Dict[str, Any]], frame: EncodedFrame):
         """
         Phân tích khung hình để gửi thông báo email
         Chỉ gửi thông báo nếu trong khung hình chỉ có người lạ (không có người quen)
@@ -702,17 +746,8 @@ class StreamProcessor:
             if not detections:
                 return
             
-            # Lấy user_id từ database
-            from ..database import get_database
-            from bson import ObjectId
-            
-            db = get_database()
-            camera_data = await db.cameras.find_one({"_id": ObjectId(camera_id)})
-            if not camera_data:
-                print(f"[WARNING] Camera {camera_id} not found in database")
-                return
-                
-            user_id = str(camera_data.get("user_id"))
+            # Lấy user_id từ cache camera
+            user_id = await self._get_camera_owner(camera_id)
             if not user_id:
                 print(f"[WARNING] No user_id found for camera {camera_id}")
                 return
@@ -735,10 +770,8 @@ class StreamProcessor:
                 # Chuyển đổi frame thành bytes để gửi email
                 image_bytes = None
                 try:
-                    # Encode frame as JPEG
-                    success, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
-                    if success:
-                        image_bytes = buffer.tobytes()
+                    # JPEG dùng chung với ảnh detection của cùng frame
+                    image_bytes = await frame.jpeg(get_settings().detection_jpeg_quality)
                 except Exception as img_error:
                     print(f"⚠️ Error encoding frame for email: {img_error}")
                 
@@ -5,6 +5,7 @@ from typing import Optional, Dict, AsyncGenerator, List
 from ..services.camera_service import CameraService
 from ..services.person_service import PersonService
 from ..services.face_processor import face_processor
+from ..services.capture_factory import capture_factory
 import logging
 
 
@@ -21,11 +22,7 @@ class StreamService:
                 return False
             
             # Initialize camera capture
-            if camera.camera_type == "webcam":
-                cap = cv2.VideoCapture(int(camera.camera_url) if camera.camera_url.isdigit() else 0)
-            else:
-                # IP Camera
-                cap = cv2.VideoCapture(camera.camera_url)
+            cap = capture_factory.open_camera(camera)
             
             if not cap.isOpened():
                 return False
@@ -0,0 +1,91 @@
+"""
+Entry point cho inference worker process (InferenceWorkerPool)
+
+Module này chỉ import cv2/numpy/insightface để process con (spawn) không phải
+import app.services và các service khác.
+"""
+
+from multiprocessing import shared_memory
+from typing import Dict, List, Tuple
+import numpy as np
+
+
+def attach_shared_memory(name: str) -> shared_memory.SharedMemory:
+    """
+    Attach vào shared memory do process cha tạo - process con không unlink nó.
+    Worker spawn dùng chung resource tracker với process cha nên không cần unregister.
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+def detect_faces(face_app, frame: np.ndarray) -> List[Tuple[np.ndarray, float, np.ndarray]]:
+    """Chạy detector + ArcFace, trả về list (bbox, det_score, embedding)"""
+    det_model = getattr(face_app, 'det_model', None)
+    rec_model = face_app.models.get('recognition') if hasattr(face_app, 'models') else None
+    if det_model is None or rec_model is None:
+        return [(face.bbox[:4], float(face.det_score), face.embedding) for face in face_app.get(frame)]
+
+    from insightface.utils import face_align
+
+    bboxes, kpss = det_model.detect(frame, max_num=0, metric='default')
+    if bboxes is None or bboxes.shape[0] == 0 or kpss is None:
+        return []
+    crops = [
+        face_align.norm_crop(frame, landmark=kpss[i], image_size=rec_model.input_size[0])
+        for i in range(bboxes.shape[0])
+    ]
+    embeddings = rec_model.get_feat(crops)
+    return [
+        (bboxes[i][:4], float(bboxes[i][4]), embeddings[i].flatten())
+        for i in range(bboxes.shape[0])
+    ]
+
+
+def worker_main(conn, providers: List[str], det_size: Tuple[int, int]):
+    """
+    Vòng lặp của worker: load FaceAnalysis một lần, sau đó nhận
+    (shm_name, shape, dtype) qua pipe, đọc frame trực tiếp từ shared memory
+    và trả về kết quả detection (bbox/score/embedding - vài KB).
+    Message None = dừng worker.
+    """
+    from insightface.app import FaceAnalysis
+
+    ctx_id = 0 if 'CUDAExecutionProvider' in providers else -1
+    face_app = FaceAnalysis(providers=providers)
+    face_app.prepare(ctx_id=ctx_id, det_size=det_size)
+    conn.send(("ready", None))
+
+    attached: Dict[str, shared_memory.SharedMemory] = {}
+    try:
+        while True:
+            try:
+                message = conn.recv()
+            except (EOFError, KeyboardInterrupt):
+                break
+            if message is None:
+                break
+
+            shm_name, shape, dtype = message
+            try:
+                shm = attached.get(shm_name)
+                if shm is None:
+                    # Process cha tạo slot mới khi frame lớn hơn - bỏ slot cũ
+                    for old in attached.values():
+                        old.close()
+                    attached = {shm_name: attach_shared_memory(shm_name)}
+                    shm = attached[shm_name]
+                frame = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+                conn.send(("ok", detect_faces(face_app, frame)))
+                del frame
+            except Exception as e:
+                conn.send(("error", str(e)))
+    finally:
+        for shm in attached.values():
+            try:
+                shm.close()
+            except BufferError:
+                pass
+        conn.close()
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+Benchmark các endpoint thống kê detection: count_documents tuần tự (cách cũ)
+so với một aggregation $facet/$group + asyncio.gather (DetectionService hiện tại)
+
+Seed dữ liệu giả vào database riêng (<database_name>_benchmark, không đụng dữ liệu thật):
+    python benchmark_detection_stats.py --rows 10000000
+Chạy lại trên dữ liệu đã seed:
+    python benchmark_detection_stats.py --skip-seed --repeat 10
+
+Chưa có số đo nào được commit - kết quả phụ thuộc máy/MongoDB, chạy script để so sánh
+(in median/p95 của từng endpoint theo cách cũ và cách mới)
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List
+
+# Add the backend directory to Python path
+backend_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, backend_dir)
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from bson import ObjectId
+from app.config import get_settings
+from app.database import db_manager
+from app.services.detection_service import DetectionService
+
+
+# ===== SEED =====
+
+async def seed(db, rows: int, users: int, cameras_per_user: int, days: int, batch_size: int) -> List[ObjectId]:
+    """Tạo users/cameras/detection_logs giả, trả về danh sách user_id"""
+    print(f"🌱 Seeding {rows:,} detection logs ({users} users x {cameras_per_user} cameras, {days} days)...")
+    await db.detection_logs.drop()
+    await db.cameras.drop()
+    await db.known_persons.drop()
+
+    user_ids = [ObjectId() for _ in range(users)]
+    cameras = []
+    for user_id in user_ids:
+        for index in range(cameras_per_user):
+            cameras.append({
+                "_id": ObjectId(),
+                "user_id": user_id,
+                "name": f"Camera {index + 1}",
+                "is_active": index % 4 != 3,
+                "is_streaming": index % 2 == 0
+            })
+    await db.cameras.insert_many(cameras)
+    await db.known_persons.insert_many([
+        {"user_id": user_id, "name": f"Person {index}", "is_active": True}
+        for user_id in user_ids for index in range(20)
+    ])
+
+    now = datetime.utcnow()
+    span_seconds = days * 24 * 3600
+    start = time.monotonic()
+    inserted = 0
+    pending = []
+    while inserted < rows:
+        count = min(batch_size, rows - inserted)
+        docs = []
+        for _ in range(count):
+            camera = random.choice(cameras)
+            is_stranger = random.random() < 0.35
+            docs.append({
+                "user_id": camera["user_id"],
+                "camera_id": camera["_id"],
+                "detection_type": "stranger" if is_stranger else "known_person",
+                "person_name": "Unknown" if is_stranger else "Known Person",
+                "confidence": round(random.uniform(0.5, 1.0), 3),
+                "timestamp": now - timedelta(seconds=random.randint(0, span_seconds)),
+                "is_alert_sent": is_stranger
+            })
+        pending.append(asyncio.create_task(db.detection_logs.insert_many(docs, ordered=False)))
+        inserted += count
+        if len(pending) >= 4:
+            await asyncio.gather(*pending)
+            pending = []
+            print(f"   {inserted:,}/{rows:,} ({inserted / (time.monotonic() - start):,.0f} docs/s)", end="\r")
+    await asyncio.gather(*pending)
+    print(f"\n✅ Seeded in {time.monotonic() - start:.1f}s")
+
+    print("🔧 Creating indexes...")
+    await db.detection_logs.create_index([("user_id", 1), ("timestamp", -1)])
+    await db.detection_logs.create_index([("user_id", 1), ("camera_id", 1), ("timestamp", -1)])
+    await db.cameras.create_index("user_id")
+    return user_ids
+
+
+# ===== CÁCH CŨ: count_documents tuần tự =====
+
+async def legacy_detection_stats(db, user_id: ObjectId):
+    query = {"user_id": user_id}
+    now = datetime.utcnow()
+    today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    await db.detection_logs.count_documents(query)
+    await db.detection_logs.count_documents({**query, "detection_type": "stranger"})
+    await db.detection_logs.count_documents({**query, "detection_type": "known_person"})
+    for start in (today_start, now - timedelta(days=7), now - timedelta(days=30)):
+        await db.detection_logs.count_documents({**query, "timestamp": {"$gte": start}})
+    await db.cameras.count_documents({"user_id": user_id, "is_active": True})
+
+
+async def legacy_stats_overview(db, user_id: ObjectId):
+    query = {"user_id": user_id}
+    now = datetime.utcnow()
+    today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    await legacy_detection_stats(db, user_id)
+    await db.cameras.count_documents({"user_id": user_id})
+    await db.cameras.count_documents({"user_id": user_id, "is_streaming": True})
+    await db.known_persons.count_documents({"user_id": user_id, "is_active": True})
+    await db.detection_logs.count_documents({
+        **query, "detection_type": "stranger", "timestamp": {"$gte": now - timedelta(hours=24)}
+    })
+    await db.detection_logs.count_documents({**query, "is_alert_sent": True})
+    camera_stats = await db.detection_logs.aggregate([
+        {"$match": query},
+        {"$group": {"_id": "$camera_id", "detection_count": {"$sum": 1}}},
+        {"$sort": {"detection_count": -1}},
+        {"$limit": 5}
+    ]).to_list(length=5)
+    for stat in camera_stats:
+        await db.cameras.find_one({"_id": stat["_id"]})
+    for hour in range(24):
+        hour_start = today_start + timedelta(hours=hour)
+        await db.detection_logs.count_documents({
+            **query, "timestamp": {"$gte": hour_start, "$lt": hour_start + timedelta(hours=1)}
+        })
+
+
+async def legacy_stats_by_camera(db, user_id: ObjectId, camera_id: ObjectId):
+    query = {"user_id": user_id, "camera_id": camera_id,
+             "timestamp": {"$gte": datetime.utcnow() - timedelta(days=7)}}
+    await db.cameras.find_one({"_id": camera_id, "user_id": user_id})
+    await db.detection_logs.count_documents(query)
+    await db.detection_logs.count_documents({**query, "detection_type": "stranger"})
+    await db.detection_logs.count_documents({**query, "detection_type": "known_person"})
+
+
+async def legacy_realtime_stats(db, user_id: ObjectId):
+    now = datetime.utcnow()
+    for minutes in (30, 5):
+        query = {"user_id": user_id, "timestamp": {"$gte": now - timedelta(minutes=minutes)}}
+        await db.detection_logs.count_documents(query)
+        await db.detection_logs.count_documents({**query, "detection_type": "stranger"})
+    await db.cameras.count_documents({"user_id": user_id, "is_active": True})
+    await db.cameras.count_documents({"user_id": user_id, "is_streaming": True})
+
+
+async def legacy_report_data(db, user_id: ObjectId, start_date: datetime, end_date: datetime):
+    query = {"user_id": user_id, "timestamp": {"$gte": start_date, "$lte": end_date}}
+    await db.detection_logs.count_documents(query)
+    await db.detection_logs.count_documents({**query, "detection_type": "stranger"})
+    await db.detection_logs.count_documents({**query, "detection_type": "known_person"})
+    current_date = start_date
+    while current_date <= end_date:
+        day_start = current_date.replace(hour=0, minute=0, second=0, microsecond=0)
+        day_query = {**query, "timestamp": {"$gte": day_start, "$lt": day_start + timedelta(days=1)}}
+        await db.detection_logs.count_documents(day_query)
+        await db.detection_logs.count_documents({**day_query, "detection_type": "stranger"})
+        await db.detection_logs.count_documents({**day_query, "detection_type": "known_person"})
+        current_date += timedelta(days=1)
+    for hour in range(24):
+        hour_start = start_date.replace(hour=hour, minute=0, second=0, microsecond=0)
+        await db.detection_logs.count_documents({
+            **query, "timestamp": {"$gte": hour_start, "$lt": hour_start + timedelta(hours=1)}
+        })
+    camera_stats = await db.detection_logs.aggregate([
+        {"$match": query},
+        {"$group": {"_id": "$camera_id", "detection_count": {"$sum": 1}}},
+        {"$sort": {"detection_count": -1}},
+        {"$limit": 10}
+    ]).to_list(length=10)
+    for stat in camera_stats:
+        await db.cameras.find_one({"_id": stat["_id"]})
+    recent = await db.detection_logs.find(query).sort("timestamp", -1).limit(50).to_list(length=50)
+    for detection in recent:
+        await db.cameras.find_one({"_id": detection["camera_id"]})
+
+
+# ===== ĐO =====
+
+async def measure(func: Callable[[], Awaitable[Any]], repeat: int) -> Dict[str, float]:
+    await func()  # warm-up (cache WiredTiger / index)
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await func()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "median": statistics.median(samples),
+        "p95": samples[min(int(len(samples) * 0.95), len(samples) - 1)]
+    }
+
+
+async def main():
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description="Benchmark detection stats endpoints")
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--cameras-per-user", type=int, default=4)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--database", default=f"{settings.database_name}_benchmark")
+    parser.add_argument("--skip-seed", action="store_true", help="Dùng dữ liệu đã seed từ lần chạy trước")
+    args = parser.parse_args()
+
+    if args.database == settings.database_name:
+        print("❌ Refusing to seed the application database - use a separate --database")
+        return
+
+    client = AsyncIOMotorClient(settings.mongodb_url)
+    db = client[args.database]
+    # DetectionService đọc database qua get_database()
+    db_manager.client = client
+    db_manager.database = db
+
+    try:
+        if args.skip_seed:
+            user_ids = await db.detection_logs.distinct("user_id")
+            print(f"📦 Using existing data: {await db.detection_logs.estimated_document_count():,} detection logs")
+        else:
+            user_ids = await seed(db, args.rows, args.users, args.cameras_per_user, args.days, args.batch_size)
+        if not user_ids:
+            print("❌ No data - run without --skip-seed first")
+            return
+
+        user_id = user_ids[0]
+        camera = await db.cameras.find_one({"user_id": user_id})
+        service = DetectionService()
+        end_date = datetime.utcnow()
+        start_date = end_date - timedelta(days=30)
+        report_config = {"start_date": start_date.isoformat(), "end_date": end_date.isoformat()}
+
+        cases = [
+            ("get_detection_stats",
+             lambda: legacy_detection_stats(db, user_id),
+             lambda: service.get_detection_stats(str(user_id))),
+            ("get_stats_overview",
+             lambda: legacy_stats_overview(db, user_id),
+             lambda: service.get_stats_overview(str(user_id))),
+            ("get_stats_by_camera",
+             lambda: legacy_stats_by_camera(db, user_id, camera["_id"]),
+             lambda: service.get_stats_by_camera(str(user_id), str(camera["_id"]))),
+            ("get_realtime_stats",
+             lambda: legacy_realtime_stats(db, user_id),
+             lambda: service.get_realtime_stats(str(user_id))),
+            ("generate_report_data (30d)",
+             lambda: legacy_report_data(db, user_id, start_date, end_date),
+             lambda: service.generate_report_data(str(user_id), report_config)),
+        ]
+
+        print(f"\n⏱️  {args.repeat} runs per case (user {user_id})\n")
+        print(f"{'endpoint':<28} {'legacy median':>14} {'legacy p95':>11} {'new median':>11} {'new p95':>9} {'speedup':>8}")
+        for name, legacy, current in cases:
+            old = await measure(legacy, args.repeat)
+            new = await measure(current, args.repeat)
+            speedup = old["median"] / new["median"] if new["median"] else float("inf")
+            print(f"{name:<28} {old['median']:>12.1f}ms {old['p95']:>9.1f}ms "
+                  f"{new['median']:>9.1f}ms {new['p95']:>7.1f}ms {speedup:>7.1f}x")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -10,6 +10,7 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from app.database import get_database
 from app.services.face_processor import face_processor
 from app.services.stream_processor import stream_processor
+from app.services.face_gallery import FaceGalleryIndex
 
 async def test_known_persons():
     """Test loading known persons from database"""
@@ -79,7 +80,10 @@ async def test_face_detection():
         
         # Test với known persons
         known_persons = await stream_processor._get_known_persons_for_camera("test_camera")
-        detections_with_recognition = await face_processor.detect_and_recognize_faces(test_frame, known_persons)
+        gallery = FaceGalleryIndex("test_user")
+        for person in known_persons:
+            gallery.upsert_person(person['id'], person['name'], person['embeddings'])
+        detections_with_recognition = await face_processor.detect_and_recognize_faces(test_frame, gallery)
         print(f"✅ Face recognition completed: {len(detections_with_recognition)} faces processed")
         
     except Exception as e:
@@ -103,7 +103,7 @@ const DetectionCard: React.FC<DetectionCardProps> = ({
           <div className="flex items-center space-x-3">
             <Avatar className="h-10 w-10">
               <AvatarImage 
-                src={!imageError ? detection.image_url : undefined} 
+                src={!imageError ? (detection.thumbnail_url || detection.image_url) : undefined} 
                 alt="Detection"
                 onError={() => setImageError(true)}
               />
@@ -155,7 +155,7 @@ const DetectionCard: React.FC<DetectionCardProps> = ({
         <div className="relative aspect-video bg-gray-100 rounded-t-lg overflow-hidden">
           {!imageError && detection.image_url ? (
             <img
-              src={detection.image_url}
+              src={detection.thumbnail_url || detection.image_url}
               alt="Detection"
               className="w-full h-full object-cover group-hover:scale-105 transition-transform duration-200"
               onError={() => setImageError(true)}
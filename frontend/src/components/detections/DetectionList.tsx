@@ -236,7 +236,7 @@ const DetectionList: React.FC<DetectionListProps> = ({
                 >
                   {/* Avatar */}
                   <Avatar className="h-12 w-12">
-                    <AvatarImage src={detection.image_url} alt="Detection" />
+                    <AvatarImage src={detection.thumbnail_url || detection.image_url} alt="Detection" />
                     <AvatarFallback className={`$
                       detection.detection_type === 'stranger' ? 'bg-rose-100 text-rose-600' : 'bg-emerald-100 text-emerald-600'
                     }`}>
@@ -7,6 +7,8 @@ export interface Detection {
   confidence: number;
   timestamp: string;
   image_url?: string;
+  thumbnail_url?: string;
+  context_image_url?: string;
   image_path?: string;
   bbox?: number[];
   metadata?: any;